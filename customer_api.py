@@ -0,0 +1,387 @@
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from customer_db import COLUMNS, ConnectionPool, CustomerRepository, order_expression
+from customer_dedup import find_matches
+from customer_search import SEARCH_COLUMNS, build_match_query, search_filter
+from customer_validation import FIELDS, validate_customer
+from customer_writer import BatchWriter, WriteQueueFull
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+POOL_SIZE = 8          # connections shared by the request threads
+PAGE_SIZE = 100        # rows per list page unless ?limit= says otherwise
+MAX_PAGE = 10000       # largest ?limit= apart from "all"
+FETCH_ROWS = 1000      # rows read from the cursor per streamed chunk
+FLUSH_MS = 20          # creates from different clients share a commit within this
+SAVE_TIMEOUT = 30      # seconds a create waits for its commit
+MAX_BODY = 64 * 1024
+
+
+class ApiError(Exception):
+    """An error answered with a status code and a JSON {"error": ...} body"""
+
+    def __init__(self, status, message, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+def _customer(row):
+    return dict(zip(COLUMNS, row))
+
+
+def _int_param(query, name, default, low=0, high=None):
+    value = query.get(name, [None])[0]
+    if value is None or value == '':
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} must be a number") from None
+    if number < low:
+        message = (f"{name} must be at least {low}" if high is None
+                   else f"{name} must be between {low} and {high}")
+        raise ApiError(HTTPStatus.BAD_REQUEST, message)
+    if high is not None and number > high:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} must be between {low} and {high}")
+    return number
+
+
+def _fields_param(query):
+    fields = query.get('fields', [''])[0]
+    if not fields:
+        return None
+    columns = tuple(field.strip() for field in fields.split(','))
+    unknown = [c for c in columns if c not in SEARCH_COLUMNS]
+    if unknown:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"Can't search by {', '.join(unknown)}")
+    return columns
+
+
+class CustomerApi:
+    """What the HTTP handler calls: queries on a shared pool, creates
+    through a BatchWriter so concurrent clients share commits"""
+
+    def __init__(self, db_path=None, pool_size=POOL_SIZE, flush_ms=FLUSH_MS):
+        self.repo = CustomerRepository(pool=ConnectionPool(db_path, pool_size))
+        self.repo.init_schema()
+        self.writer = BatchWriter(repo=self.repo, flush_ms=flush_ms)
+
+    def close(self):
+        self.writer.close()
+        self.repo.pool.close()
+
+    def version(self):
+        """Changes whenever a customer is added, updated or deleted
+
+        Inserts raise the highest id and the change log records every
+        update and delete, so together they identify the table's state.
+        """
+        with self.repo.pool.connection() as conn:
+            return conn.execute('''
+                SELECT (SELECT MAX(id) FROM customers),
+                       (SELECT MAX(seq) FROM customer_changes)
+            ''').fetchone()
+
+    def list_query(self, query):
+        """Return (sql, params, count_sql, count_params) for a list request"""
+        sort = query.get('sort', ['id'])[0]
+        try:
+            with self.repo.pool.connection() as conn:
+                expression = order_expression(sort, conn)
+        except ValueError as e:
+            raise ApiError(HTTPStatus.BAD_REQUEST, str(e)) from None
+        direction = 'ASC' if query.get('order', ['asc'])[0].lower() == 'asc' else 'DESC'
+
+        where, params = [], []
+        term = query.get('q', [''])[0]
+        if term:
+            condition, values = search_filter(term, _fields_param(query))
+            # A term without any words matches nothing, as in /search
+            where.append(condition or '0')
+            params.extend(values)
+        count_where = ' AND '.join(where)
+        count_params = tuple(params)
+
+        # Keyset paging: ?after=<id> continues an id-ordered list cheaply
+        after = _int_param(query, 'after', None)
+        if after is not None:
+            if sort != 'id':
+                raise ApiError(HTTPStatus.BAD_REQUEST, "after only works with sort=id")
+            where.append('id > ?' if direction == 'ASC' else 'id < ?')
+            params.append(after)
+
+        limit = query.get('limit', [str(PAGE_SIZE)])[0]
+        limit = -1 if limit == 'all' else _int_param(query, 'limit', PAGE_SIZE, 1, MAX_PAGE)
+        offset = _int_param(query, 'offset', 0)
+
+        sql = f"SELECT {', '.join(COLUMNS)} FROM customers"
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += f' ORDER BY {expression} {direction}, id {direction} LIMIT ? OFFSET ?'
+        count_sql = 'SELECT COUNT(*) FROM customers'
+        if count_where:
+            count_sql += f' WHERE {count_where}'
+        return sql, tuple(params) + (limit, offset), count_sql, count_params
+
+    def total(self, conn, count_sql, count_params):
+        if ' WHERE ' in count_sql or not self.repo.has_stats:
+            return conn.execute(count_sql, count_params).fetchone()[0]
+        # Unfiltered: the summary counts hold the total already
+        return conn.execute("SELECT COALESCE(SUM(count), 0) FROM customer_stats "
+                            "WHERE kind = 'contact'").fetchone()[0]
+
+    def stream_list(self, sql, params, count_sql, count_params):
+        """Yield the JSON text of a list response a piece at a time"""
+        with self.repo.pool.connection() as conn:
+            total = self.total(conn, count_sql, count_params)
+            yield f'{{"total": {total}, "customers": ['
+            cursor = conn.execute(sql, params)
+            first = True
+            last_id = None
+            while True:
+                rows = cursor.fetchmany(FETCH_ROWS)
+                if not rows:
+                    break
+                text = ', '.join(json.dumps(_customer(row)) for row in rows)
+                yield text if first else ', ' + text
+                first = False
+                last_id = rows[-1][0]
+            yield f'], "last_id": {json.dumps(last_id)}}}'
+
+    def get(self, customer_id):
+        row = self.repo.get_customer(customer_id)
+        if row is None:
+            raise ApiError(HTTPStatus.NOT_FOUND, f"No customer {customer_id}")
+        return _customer(row)
+
+    def search(self, query):
+        term = query.get('q', [''])[0]
+        if not term:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "q is required")
+        limit = _int_param(query, 'limit', PAGE_SIZE, 1, MAX_PAGE)
+        columns = _fields_param(query)
+        if build_match_query(term) is None:
+            # No words to look for, e.g. only punctuation
+            return {'customers': []}
+        rows = self.repo.search(term, columns=columns, limit=limit)
+        return {'customers': [_customer(row) for row in rows]}
+
+    def create(self, record, allow_duplicate=False):
+        """Validate like the entry form, check for duplicates, and save"""
+        if not isinstance(record, dict):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Expected a JSON object")
+        values = tuple(str(record.get(field) or '').strip() for field in FIELDS)
+        error = validate_customer(*values)
+        if error:
+            raise ApiError(HTTPStatus.UNPROCESSABLE_ENTITY, error)
+
+        if not allow_duplicate:
+            with self.repo.pool.connection() as conn:
+                matches = find_matches(conn, *values[:5])
+            if matches:
+                raise ApiError(HTTPStatus.CONFLICT, "This looks like an existing customer",
+                               matches=[dict(_customer(row), score=round(score, 3))
+                                        for score, row in matches[:5]])
+
+        done = threading.Event()
+        result = {}
+
+        def saved(customer_id, error):
+            result['id'], result['error'] = customer_id, error
+            done.set()
+
+        try:
+            self.writer.submit(values, saved)
+        except WriteQueueFull as e:
+            raise ApiError(HTTPStatus.SERVICE_UNAVAILABLE, str(e)) from None
+        if not done.wait(SAVE_TIMEOUT):
+            raise ApiError(HTTPStatus.SERVICE_UNAVAILABLE, "Timed out saving the customer")
+        if result['error'] is not None:
+            raise ApiError(HTTPStatus.SERVICE_UNAVAILABLE, str(result['error']))
+        return self.get(result['id'])
+
+    def delete(self, customer_id):
+        self.get(customer_id)
+        self.repo.delete_customer(customer_id)
+
+
+class CustomerRequestHandler(BaseHTTPRequestHandler):
+    """Routes:
+
+    GET    /customers          page of customers (?limit=, offset=, after=,
+                               sort=, order=asc|desc, q=, fields=; limit=all
+                               streams every row)
+    GET    /customers/<id>     one customer
+    POST   /customers          create (?allow_duplicate=1 skips the check)
+    DELETE /customers/<id>     delete
+    GET    /search?q=          ranked full-text search
+    GET    /summary            dashboard counts
+    """
+
+    protocol_version = 'HTTP/1.1'    # keep-alive
+    server_version = 'CustomerAPI/1.0'
+
+    @property
+    def api(self):
+        return self.server.api
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def _handle(self, method):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        parts = [part for part in url.path.split('/') if part]
+        try:
+            # Read the body first so the connection stays usable after an error
+            body = self._read_json() if method == 'POST' else None
+            if parts == ['customers'] and method == 'GET':
+                self._list(query)
+            elif parts == ['customers'] and method == 'POST':
+                allow = query.get('allow_duplicate', ['0'])[0] not in ('0', 'false', '')
+                self._send_json(self.api.create(body, allow), HTTPStatus.CREATED)
+            elif len(parts) == 2 and parts[0] == 'customers' and method in ('GET', 'DELETE'):
+                customer_id = _int_param({'id': [parts[1]]}, 'id', None)
+                if method == 'GET':
+                    self._send_json(self.api.get(customer_id))
+                else:
+                    self.api.delete(customer_id)
+                    self._send_empty(HTTPStatus.NO_CONTENT)
+            elif parts == ['search'] and method == 'GET':
+                self._send_json(self.api.search(query))
+            elif parts == ['summary'] and method == 'GET':
+                self._send_json(self.api.repo.summary())
+            elif parts and parts[0] in ('customers', 'search', 'summary'):
+                raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} not allowed here")
+            else:
+                raise ApiError(HTTPStatus.NOT_FOUND, f"No such endpoint: {url.path}")
+        except ApiError as e:
+            self._send_json(dict(error=str(e), **e.extra), e.status)
+        except sqlite3.Error as e:
+            self._send_json({'error': f"Database error: {e}"}, HTTPStatus.SERVICE_UNAVAILABLE)
+
+    def _read_json(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length < 0 or length > MAX_BODY:
+            self.close_connection = True
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Bad Content-Length")
+        body = self.rfile.read(length)
+        try:
+            return json.loads(body or b'null')
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Body is not valid JSON") from None
+
+    def _list(self, query):
+        sql, params, count_sql, count_params = self.api.list_query(query)
+        # Weak ETag: the same request against the same table state
+        state = json.dumps([self.path, self.api.version()])
+        etag = f'W/"{hashlib.sha1(state.encode()).hexdigest()[:20]}"'
+        if etag in (tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')):
+            self._send_empty(HTTPStatus.NOT_MODIFIED, {'ETag': etag})
+            return
+
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        stream = self.api.stream_list(sql, params, count_sql, count_params)
+        try:
+            for text in stream:
+                data = text.encode()
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        except (sqlite3.Error, OSError):
+            # Too late for an error status; a cut-off body tells the client
+            self.close_connection = True
+            return
+        finally:
+            stream.close()    # gives the pooled connection back
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _send_json(self, value, status=HTTPStatus.OK):
+        data = json.dumps(value).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_empty(self, status, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != HTTPStatus.NOT_MODIFIED and status != HTTPStatus.NO_CONTENT:
+            self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class CustomerServer(ThreadingHTTPServer):
+    """One thread per connection, all sharing one CustomerApi"""
+
+    daemon_threads = True
+
+    def __init__(self, address, api, quiet=False):
+        super().__init__(address, CustomerRequestHandler)
+        self.api = api
+        self.quiet = quiet
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, db_path=None, pool_size=POOL_SIZE,
+          quiet=False):
+    """Run the API until interrupted"""
+    api = CustomerApi(db_path, pool_size)
+    server = CustomerServer((host, port), api, quiet)
+    print(f"Serving customers on http://{host}:{server.server_port}/", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        api.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP/JSON API for the customer database")
+    parser.add_argument('--db', help="database file (default: $CUSTOMER_DB or customer_data.db)")
+    parser.add_argument('--host', default=DEFAULT_HOST,
+                        help=f"address to listen on (default: {DEFAULT_HOST})")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help=f"port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument('--pool-size', type=int, default=POOL_SIZE,
+                        help=f"database connections shared by requests (default: {POOL_SIZE})")
+    parser.add_argument('--quiet', action='store_true', help="don't log each request")
+    args = parser.parse_args(argv)
+    try:
+        serve(args.host, args.port, args.db, args.pool_size, args.quiet)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Server failed: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,642 @@
+import argparse
+import contextlib
+import heapq
+import json
+import math
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from unittest import mock
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import customer_management
+import readDatabase
+import view_customers
+from customer_db import get_repository
+from customer_generator import generate_customers, generate_database
+
+DEFAULT_ROWS = 100000
+DEFAULT_REPEAT = 5
+TIMEOUT = 120   # seconds to wait for a background search or chunked insert
+
+# Search terms: name prefixes, a whole last name, an email domain, phone digits
+# and a term that matches nothing
+SEARCH_TERMS = ('smi', 'garcia', 'jen', 'gmail', '415', 'zzqx')
+SORT_HEADINGS = ('Name', 'Birthday', 'Email', 'Phone', 'Date Added', 'ID')
+
+# A regression is a p50 slower than the baseline by more than this share
+DEFAULT_THRESHOLD = 0.25
+
+
+# --- Headless stand-ins for the Tk widgets the GUIs use ---------------------
+
+def _noop(*args, **kwargs):
+    return None
+
+
+class FakeRoot:
+    """Stands in for tk.Tk; after() callbacks run when the harness pumps"""
+
+    def __init__(self):
+        self._timers = []
+        self._cancelled = set()
+        self._next_id = 0
+
+    def after(self, ms, func=None, *args):
+        self._next_id += 1
+        heapq.heappush(self._timers, (time.perf_counter() + ms / 1000,
+                                      self._next_id, func, args))
+        return self._next_id
+
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+
+    def after_cancel(self, timer_id):
+        self._cancelled.add(timer_id)
+
+    def run_due(self):
+        """Run every callback whose time has come"""
+        now = time.perf_counter()
+        while self._timers and self._timers[0][0] <= now:
+            _, timer_id, func, args = heapq.heappop(self._timers)
+            if timer_id in self._cancelled:
+                self._cancelled.discard(timer_id)
+            elif func is not None:
+                func(*args)
+
+    def __getattr__(self, name):
+        # title, geometry, protocol, columnconfigure, destroy, ...
+        return _noop
+
+
+class FakeWidget:
+    """Any widget: remembers its options and the text put into it"""
+
+    def __init__(self, *args, **kwargs):
+        self.options = dict(kwargs)
+        self.value = ''
+
+    def get(self, *args):
+        return self.value
+
+    def insert(self, index, text):
+        self.value += text
+
+    def delete(self, *args):
+        self.value = ''
+
+    def set(self, *args):
+        self.value = args[0] if len(args) == 1 else args
+
+    def config(self, **kwargs):
+        self.options.update(kwargs)
+
+    configure = config
+
+    def cget(self, key):
+        return self.options.get(key, '')
+
+    def __getattr__(self, name):
+        # grid, pack, bind, heading, column, tag_configure, ...
+        return _noop
+
+
+class FakeTreeview(FakeWidget):
+    """Keeps items in order like ttk.Treeview, without drawing them"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._items = {}    # iid -> item, in display order
+        self._detached = {}
+        self._selection = ()
+        self._focus = ''
+        self._next_iid = 0
+
+    def insert(self, parent, index, iid=None, values=(), tags=()):
+        if iid is None:
+            self._next_iid += 1
+            iid = f'I{self._next_iid:03X}'
+        if iid in self._items:
+            raise ValueError(f"Item {iid} already exists")
+        item = {'values': list(values), 'tags': list(tags)}
+        if index == 'end' or index >= len(self._items):
+            self._items[iid] = item
+        else:
+            entries = list(self._items.items())
+            entries.insert(index, (iid, item))
+            self._items = dict(entries)
+        return iid
+
+    def delete(self, *iids):
+        for iid in iids:
+            if self._detached.pop(iid, None) is None:
+                del self._items[iid]
+
+    def detach(self, *iids):
+        for iid in iids:
+            self._detached[iid] = self._items.pop(iid)
+
+    def move(self, iid, parent, index):
+        item = self._detached.pop(iid, None) or self._items.pop(iid)
+        entries = list(self._items.items())
+        entries.insert(index, (iid, item))
+        self._items = dict(entries)
+
+    def get_children(self, item=''):
+        return tuple(self._items)
+
+    def exists(self, iid):
+        return iid in self._items or iid in self._detached
+
+    def item(self, iid, option=None, **kwargs):
+        entry = self._items[iid] if iid in self._items else self._detached[iid]
+        entry.update(kwargs)
+        return entry if option is None else entry[option]
+
+    def selection(self):
+        return tuple(iid for iid in self._selection if iid in self._items)
+
+    def selection_set(self, items):
+        self._selection = (items,) if isinstance(items, str) else tuple(items)
+
+    def focus(self, iid=None):
+        if iid is None:
+            return self._focus
+        self._focus = iid
+
+
+class FakeStringVar:
+    """tk.StringVar with write traces"""
+
+    def __init__(self, *args, value='', **kwargs):
+        self.value = value
+        self.traces = []
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+        for callback in self.traces:
+            callback('', '', 'w')
+
+    def trace(self, mode, callback):
+        self.traces.append(callback)
+
+    trace_add = trace
+
+
+class FakeMessagebox:
+    """Records dialogs instead of blocking on them"""
+
+    def __init__(self):
+        self.shown = []
+
+    def askyesno(self, *args, **kwargs):
+        return True
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.shown.append((name, args))
+
+
+class _FakeModule:
+    def __init__(self, **members):
+        self.__dict__.update(members)
+
+    def __getattr__(self, name):
+        # Constants like tk.END or tk.W are their lower-case names in Tk
+        return name.lower() if name.isupper() else FakeWidget
+
+
+class Harness:
+    """Creates GUI roots and runs their event loops, mocked or real"""
+
+    def __init__(self, real_tk=False):
+        self.real_tk = real_tk
+        self.messagebox = FakeMessagebox()
+
+    @contextlib.contextmanager
+    def patched(self):
+        """Swap the GUI modules' Tk imports for the stand-ins"""
+        patches = {'messagebox': self.messagebox, 'filedialog': _FakeModule()}
+        if not self.real_tk:
+            patches['tk'] = _FakeModule(StringVar=FakeStringVar, Tk=FakeRoot,
+                                        END='end')
+            patches['ttk'] = _FakeModule(Treeview=FakeTreeview)
+        with contextlib.ExitStack() as stack:
+            for module in (readDatabase, customer_management):
+                for name, value in patches.items():
+                    if hasattr(module, name):
+                        stack.enter_context(mock.patch.object(module, name, value))
+            yield
+
+    def make_root(self):
+        if not self.real_tk:
+            return FakeRoot()
+        import tkinter
+        root = tkinter.Tk()
+        root.withdraw()
+        return root
+
+    def pump(self, root, until, timeout=TIMEOUT):
+        """Run the event loop until until() is true; False on timeout"""
+        deadline = time.perf_counter() + timeout
+        while not until():
+            if time.perf_counter() > deadline:
+                return False
+            if self.real_tk:
+                root.update()
+            else:
+                root.run_due()
+            time.sleep(0.0005)
+        return True
+
+
+# --- Measurements ------------------------------------------------------------
+
+def peak_rss_kb():
+    """Highest resident set size of this process so far, in KiB"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of a sorted list"""
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples, rows=None):
+    """Latency percentiles (ms) and throughput for a list of timings (s)"""
+    ordered = sorted(samples)
+    total = sum(ordered)
+    result = {
+        'runs': len(ordered),
+        'mean_ms': 1000 * total / len(ordered),
+        'min_ms': 1000 * ordered[0],
+        'p50_ms': 1000 * percentile(ordered, 50),
+        'p90_ms': 1000 * percentile(ordered, 90),
+        'p99_ms': 1000 * percentile(ordered, 99),
+        'max_ms': 1000 * ordered[-1],
+        'ops_per_second': len(ordered) / total if total else None,
+    }
+    if rows is not None:
+        result['rows'] = rows
+        result['rows_per_second'] = rows * len(ordered) / total if total else None
+    result['peak_rss_kb'] = peak_rss_kb()
+    return result
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - started
+
+
+class Timeout(Exception):
+    """A GUI operation did not finish within TIMEOUT"""
+
+
+class BenchmarkFailed(Exception):
+    """A GUI operation ended in an error instead of the state being measured"""
+
+
+# --- Benchmarks --------------------------------------------------------------
+
+@contextlib.contextmanager
+def open_viewer(harness, db_path, virtual):
+    root = harness.make_root()
+    viewer = readDatabase.CustomerDatabaseViewer(root, virtual=virtual,
+                                                 search_debounce_ms=0, db_path=db_path)
+    try:
+        yield root, viewer
+    finally:
+        close_viewer(harness, root, viewer)
+
+
+def close_viewer(harness, root, viewer):
+    viewer.search_worker.close()
+    if viewer.count_worker is not None:
+        viewer.count_worker.close()
+    if viewer.tracker is not None:
+        viewer.tracker.close()
+    if harness.real_tk:
+        root.destroy()
+
+
+def _status(viewer):
+    return str(viewer.status_label.cget('text'))
+
+
+def _wait_shown(harness, root, viewer):
+    # Searches and chunked inserts end by putting "Showing ..." in the status bar
+    if not harness.pump(root, lambda: _status(viewer).startswith('Showing')):
+        raise Timeout(f"Still waiting after {TIMEOUT}s: {_status(viewer)!r}")
+
+
+def bench_load_data(harness, db_path, repeat, virtual):
+    with open_viewer(harness, db_path, virtual) as (root, viewer):
+        rows = viewer.repo.count()
+        return summarize([timed(viewer.load_data) for _ in range(repeat)], rows)
+
+
+def bench_import_viewer(harness, db_path, repeat):
+    """Import the viewer module in a fresh interpreter, as launching it does"""
+    code = ('import time; started = time.perf_counter(); import readDatabase; '
+            'print(time.perf_counter() - started)')
+    here = os.path.dirname(os.path.abspath(__file__))
+    samples = [float(subprocess.run([sys.executable, '-c', code], cwd=here, check=True,
+                                    capture_output=True, text=True).stdout)
+               for _ in range(repeat)]
+    return summarize(samples)
+
+
+def bench_startup(harness, db_path, repeat):
+    """Fast start: from creating the viewer to its first page on screen"""
+    samples = []
+    for _ in range(repeat):
+        root = harness.make_root()
+        viewer = readDatabase.CustomerDatabaseViewer(root, search_debounce_ms=0,
+                                                     db_path=db_path, fast_start=True)
+        try:
+            if viewer.startup_seconds is None or harness.messagebox.shown:
+                raise BenchmarkFailed("The viewer didn't show its first page")
+            samples.append(viewer.startup_seconds)
+            # Let the deferred count finish so it doesn't slow the next run
+            if not harness.pump(root, lambda: not viewer.pager.count_estimated):
+                raise Timeout(f"Row count still running after {TIMEOUT}s")
+        finally:
+            close_viewer(harness, root, viewer)
+    return summarize(samples, get_repository(db_path).count())
+
+
+def bench_scroll(harness, db_path, repeat):
+    """Jump to spread-out positions in the virtual viewer, then page down"""
+    with open_viewer(harness, db_path, True) as (root, viewer):
+        samples = []
+        for i in range(repeat):
+            position = (i * 0.37) % 1.0
+            samples.append(timed(viewer.on_vscroll, 'moveto', str(position)))
+            samples.append(timed(viewer.scroll_rows, viewer.visible_rows))
+        return summarize(samples, viewer.visible_rows)
+
+
+def bench_filter_data(harness, db_path, repeat, virtual):
+    with open_viewer(harness, db_path, virtual) as (root, viewer):
+        samples = []
+        for i in range(repeat):
+            term = SEARCH_TERMS[i % len(SEARCH_TERMS)]
+            started = time.perf_counter()
+            viewer.search_var.set(term)
+            _wait_shown(harness, root, viewer)
+            samples.append(time.perf_counter() - started)
+        return summarize(samples)
+
+
+def bench_sort_column(harness, db_path, repeat, virtual):
+    with open_viewer(harness, db_path, virtual) as (root, viewer):
+        samples = []
+        for i in range(repeat):
+            heading = SORT_HEADINGS[i % len(SORT_HEADINGS)]
+            viewer.status_label.config(text='')
+            started = time.perf_counter()
+            viewer.sort_column(heading)
+            if not virtual:
+                # Classic mode inserts the sorted rows a chunk at a time
+                _wait_shown(harness, root, viewer)
+            samples.append(time.perf_counter() - started)
+        return summarize(samples, viewer.repo.count())
+
+
+def bench_search_customer(harness, db_path, repeat):
+    samples = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for i in range(repeat):
+            samples.append(timed(view_customers.search_customer,
+                                 SEARCH_TERMS[i % len(SEARCH_TERMS)], db_path))
+    return summarize(samples)
+
+
+def bench_view_summary(harness, db_path, repeat):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        samples = [timed(view_customers.view_summary, db_path) for _ in range(repeat)]
+    return summarize(samples, get_repository(db_path).count())
+
+
+def bench_submit_data(harness, db_path, repeat):
+    """Time Submit clicks, then how long until every row is committed
+
+    The inserted customers are deleted again so runs stay comparable.
+    """
+    root = harness.make_root()
+    form = customer_management.CustomerManagementSystem(root, db_path)
+    count = max(repeat, 100)
+    records = list(generate_customers(count, seed=-1))
+    samples = []
+    started = time.perf_counter()
+    try:
+        for record in records:
+            form.name_entry.insert(0, record['name'])
+            form.birthday_entry.insert(0, record['birthday'])
+            form.email_entry.insert(0, record['email'])
+            form.phone_entry.insert(0, record['phone'])
+            form.address_text.insert('1.0', record['address'])
+            form.contact_var.set(record['preferred_contact'])
+            samples.append(timed(form.submit_data))
+        form.writer.flush()
+        committed = time.perf_counter() - started
+    finally:
+        form.writer.close()
+        ids = []
+        while not form.save_results.empty():
+            _, customer_id, _ = form.save_results.get()
+            if customer_id is not None:
+                ids.append(customer_id)
+        for customer_id in ids:
+            form.repo.delete_customer(customer_id)
+        if harness.real_tk:
+            root.destroy()
+
+    result = summarize(samples)
+    result['committed_rows'] = len(ids)
+    result['commit_seconds'] = committed
+    result['commits_per_second'] = len(ids) / committed if committed else None
+    return result
+
+
+BENCHMARKS = {
+    'import_viewer': bench_import_viewer,
+    'startup_virtual': bench_startup,
+    'load_data_classic': lambda h, db, n: bench_load_data(h, db, n, virtual=False),
+    'load_data_virtual': lambda h, db, n: bench_load_data(h, db, n, virtual=True),
+    'scroll_virtual': bench_scroll,
+    'filter_data_classic': lambda h, db, n: bench_filter_data(h, db, n, virtual=False),
+    'filter_data_virtual': lambda h, db, n: bench_filter_data(h, db, n, virtual=True),
+    'sort_column_classic': lambda h, db, n: bench_sort_column(h, db, n, virtual=False),
+    'sort_column_virtual': lambda h, db, n: bench_sort_column(h, db, n, virtual=True),
+    'search_customer': bench_search_customer,
+    'view_summary': bench_view_summary,
+    'submit_data': bench_submit_data,
+}
+
+
+# --- Running and comparing ---------------------------------------------------
+
+def default_db_path(rows, seed):
+    return os.path.join(tempfile.gettempdir(), f'customer_bench_{rows}_{seed}.db')
+
+
+def prepare_database(db_path, rows, seed, quiet=False):
+    """Generate the benchmark database unless it already exists"""
+    if os.path.exists(db_path):
+        return
+    progress = None if quiet else lambda s: print(s, file=sys.stderr)
+    stats = generate_database(rows, db_path, seed, progress=progress)
+    # Add the change log, search index and summary counts like the apps do
+    get_repository(db_path).upgrade_schema()
+    if not quiet:
+        print(f"Generated {db_path}: {stats}", file=sys.stderr)
+
+
+def run_benchmarks(db_path, names, repeat=DEFAULT_REPEAT, real_tk=False, quiet=False):
+    """Run benchmarks in this process and return {name: result}"""
+    harness = Harness(real_tk)
+    results = {}
+    with harness.patched():
+        for name in names:
+            if not quiet:
+                print(f"Running {name}...", file=sys.stderr)
+            try:
+                results[name] = BENCHMARKS[name](harness, db_path, repeat)
+            except (Timeout, BenchmarkFailed, sqlite3.Error) as e:
+                results[name] = {'error': str(e)}
+            if harness.messagebox.shown:
+                # Error dialogs mean the timings measured a failure path
+                results[name]['dialogs'] = [f"{kind}: {args[-1]}"
+                                            for kind, args in harness.messagebox.shown]
+                harness.messagebox.shown.clear()
+    return results
+
+
+def run_isolated(db_path, names, repeat=DEFAULT_REPEAT, real_tk=False, quiet=False):
+    """Run each benchmark in a fresh process so peak RSS is its own"""
+    results = {}
+    for name in names:
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            output = f.name
+        command = [sys.executable, os.path.abspath(__file__), '--db', db_path,
+                   '--only', name, '--repeat', str(repeat), '--output', output, '--quiet']
+        if real_tk:
+            command.append('--tk')
+        try:
+            if not quiet:
+                print(f"Running {name}...", file=sys.stderr)
+            subprocess.run(command, check=True)
+            with open(output) as f:
+                results.update(json.load(f)['results'])
+        except subprocess.CalledProcessError as e:
+            results[name] = {'error': f"exit status {e.returncode}"}
+        finally:
+            os.unlink(output)
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Print p50 changes against a baseline run; return the regressed names"""
+    regressed = []
+    print(f"{'benchmark':<22} {'baseline':>12} {'now':>12} {'change':>8}")
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name, {}).get('p50_ms')
+        now = result.get('p50_ms')
+        if before is None or now is None:
+            continue
+        change = (now - before) / before if before else 0.0
+        flag = ''
+        if change > threshold:
+            regressed.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<22} {before:>10.2f}ms {now:>10.2f}ms {change:>+7.0%}{flag}")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time the customer GUIs and CLI headlessly on synthetic data")
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS,
+                        help=f"customers in the generated database (default: {DEFAULT_ROWS})")
+    parser.add_argument('--seed', type=int, default=0, help="generator seed (default: 0)")
+    parser.add_argument('--db', help="database to benchmark; generated if it doesn't exist "
+                                     "(default: a file per --rows/--seed in the temp dir)")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help=f"runs per benchmark (default: {DEFAULT_REPEAT})")
+    parser.add_argument('--only', help="comma-separated benchmarks to run: "
+                                       + ', '.join(BENCHMARKS))
+    parser.add_argument('--tk', action='store_true',
+                        help="use real Tk widgets (needs a display, e.g. xvfb-run)")
+    parser.add_argument('--isolate', action='store_true',
+                        help="run each benchmark in its own process for per-benchmark peak RSS")
+    parser.add_argument('--output', help="write results to this JSON file")
+    parser.add_argument('--compare', help="baseline JSON file to check for regressions")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="p50 slowdown that counts as a regression (default: 0.25)")
+    parser.add_argument('--quiet', action='store_true', help="don't print progress")
+    args = parser.parse_args(argv)
+
+    names = args.only.split(',') if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(unknown)}")
+
+    db_path = args.db or default_db_path(args.rows, args.seed)
+    try:
+        prepare_database(db_path, args.rows, args.seed, args.quiet)
+        run = run_isolated if args.isolate else run_benchmarks
+        results = run(db_path, names, args.repeat, args.tk, args.quiet)
+        rows = get_repository(db_path).count()
+    except (OSError, sqlite3.Error) as e:
+        print(f"Benchmark failed: {e}", file=sys.stderr)
+        return 1
+
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'database': db_path,
+        'rows': rows,
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'tk': 'real' if args.tk else 'mocked',
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if not args.quiet:
+        for name, result in results.items():
+            if 'error' in result:
+                print(f"{name:<22} error: {result['error']}")
+            else:
+                print(f"{name:<22} p50 {result['p50_ms']:>9.2f}ms  "
+                      f"p99 {result['p99_ms']:>9.2f}ms  peak RSS {result['peak_rss_kb']} KiB")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from customer_db import COLUMNS, get_db_path
+
+MAX_ENTRIES = 256         # results kept at most, least recently used dropped first
+TTL = 300                 # seconds a result is trusted at most, changed or not
+MAX_RESULT_ROWS = 50000   # larger results aren't kept, to bound memory
+
+# Inserts raise the highest id; the change log records updates and deletes
+VERSION_SQL = '''
+    SELECT (SELECT COALESCE(MAX(id), 0) FROM customers),
+           (SELECT COALESCE(MAX(seq), 0) FROM customer_changes)
+'''
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def query_key(term, order_column='id', descending=False, page=0):
+    """Cache key of one page of a search (or of the unfiltered rows)
+
+    page=None stands for every matching row at once.
+    """
+    return ('query', term, order_column, descending, page)
+
+
+def customer_key(customer_id):
+    """Cache key of a single customer row"""
+    return ('customer', int(customer_id))
+
+
+class ResultCache:
+    """Bounded LRU cache of search results and customer rows
+
+    Call check() with a connection before using the cache: it compares the
+    highest id and the last change-log entry with the ones seen before and
+    drops what the commits in between may have changed. PRAGMA data_version
+    is per connection and ignores the connection's own commits, so it can't
+    serve a cache shared by the pool. Search results are dropped on any
+    change; customer rows only when the change log names them.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL, max_result_rows=MAX_RESULT_ROWS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_result_rows = max_result_rows
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()    # key -> (stored at, value)
+        self._version = None             # (highest id, last change seq)
+        self._epoch = 0                  # bumped whenever entries are dropped
+        self._lock = threading.Lock()
+
+    def check(self, conn):
+        """Drop entries made stale by commits since the last check
+
+        Returns the token to pass to put(), so a result computed while
+        another thread saw a newer commit isn't stored as current.
+        """
+        version = tuple(conn.execute(VERSION_SQL).fetchone())
+        with self._lock:
+            previous = self._version
+            if version == previous:
+                return version, self._epoch
+        changed = None
+        if previous is not None and version[1] >= previous[1]:
+            changed = [customer_id for customer_id, in conn.execute(
+                'SELECT DISTINCT customer_id FROM customer_changes WHERE seq > ?',
+                (previous[1],))]
+        with self._lock:
+            if self._version != previous:
+                # Another thread got there first with its own version
+                changed = None
+            # With no changed ids (first check, or the log was pruned) drop all
+            self._discard(changed)
+            self._version = version
+            return version, self._epoch
+
+    def token(self):
+        """The current state, for put() by callers that track changes themselves"""
+        with self._lock:
+            return self._version, self._epoch
+
+    def get(self, key):
+        """Return a cached value, or None when it isn't cached"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, token=None):
+        """Store a value computed after check() or token() returned `token`"""
+        if value is None:
+            return
+        if isinstance(value, list) and len(value) > self.max_result_rows:
+            return
+        with self._lock:
+            if token is not None and token != (self._version, self._epoch):
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, customer_ids=None):
+        """Drop every search result and the given customers (default: all)"""
+        with self._lock:
+            self._discard(customer_ids)
+
+    def _discard(self, customer_ids):
+        self._epoch += 1
+        if customer_ids is None:
+            self._entries.clear()
+            return
+        for key in [key for key in self._entries if key[0] == 'query']:
+            del self._entries[key]
+        for customer_id in customer_ids:
+            self._entries.pop(customer_key(customer_id), None)
+
+    def customer(self, conn, customer_id):
+        """Return a customer row (in COLUMNS order) through the cache"""
+        token = self.check(conn)
+        key = customer_key(customer_id)
+        row = self.get(key)
+        if row is None:
+            row = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM customers WHERE id = ?",
+                               (customer_id,)).fetchone()
+            self.put(key, row, token)
+        return row
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def status_line(self):
+        """Short summary for a status bar"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            text = f"Cache: {self.hits} hits, {self.misses} misses"
+            if lookups:
+                text += f" ({100 * self.hits / lookups:.0f}%)"
+            return text
+
+
+def get_cache(db_path=None):
+    """Return the cache shared by everything using a database file"""
+    key = os.path.abspath(db_path or get_db_path())
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = ResultCache()
+        return cache
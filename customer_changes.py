@@ -0,0 +1,96 @@
+from customer_db import COLUMNS, connect
+
+_IN_CHUNK = 500   # ids per IN (...) list
+
+
+class ChangeSet:
+    """Rows inserted, rows updated and ids deleted since the last check"""
+
+    def __init__(self, inserted=(), updated=(), deleted=()):
+        self.inserted = list(inserted)
+        self.updated = list(updated)
+        self.deleted = set(deleted)
+
+    def __bool__(self):
+        return bool(self.inserted or self.updated or self.deleted)
+
+    def __repr__(self):
+        return (f"ChangeSet(inserted={len(self.inserted)}, updated={len(self.updated)}, "
+                f"deleted={len(self.deleted)})")
+
+
+class ChangeTracker:
+    """Find what changed in customers since the last check
+
+    Uses its own connection because PRAGMA data_version is per connection:
+    it changes whenever another connection commits, which makes
+    has_changed() a cheap poll.
+    """
+
+    def __init__(self, db_path=None):
+        self.conn = connect(db_path, isolation_level=None)
+        self.max_id = 0
+        self.last_seq = 0
+        self.data_version = None
+
+    def start(self):
+        """Mark the current state as seen"""
+        self.conn.execute('BEGIN')
+        try:
+            self.max_id = self.conn.execute(
+                'SELECT COALESCE(MAX(id), 0) FROM customers').fetchone()[0]
+            self.last_seq = self.conn.execute(
+                'SELECT COALESCE(MAX(seq), 0) FROM customer_changes').fetchone()[0]
+        finally:
+            self.conn.execute('COMMIT')
+        self.data_version = self._data_version()
+
+    def _data_version(self):
+        return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def has_changed(self):
+        """True if another connection committed since the last check"""
+        return self._data_version() != self.data_version
+
+    def fetch_changes(self):
+        """Return a ChangeSet since the last call (or start) and move the marks"""
+        self.data_version = self._data_version()
+        select = f"SELECT {', '.join(COLUMNS)} FROM customers"
+
+        # One read transaction so the log and the rows are the same snapshot
+        self.conn.execute('BEGIN')
+        try:
+            updated_ids, deleted = set(), set()
+            last_seq = self.last_seq
+            for seq, customer_id, op in self.conn.execute(
+                    'SELECT seq, customer_id, op FROM customer_changes '
+                    'WHERE seq > ? ORDER BY seq', (self.last_seq,)):
+                last_seq = seq
+                if customer_id > self.max_id:
+                    continue    # picked up with the inserts below
+                if op == 'D':
+                    deleted.add(customer_id)
+                    updated_ids.discard(customer_id)
+                else:
+                    updated_ids.add(customer_id)
+
+            inserted = self.conn.execute(f'{select} WHERE id > ? ORDER BY id',
+                                         (self.max_id,)).fetchall()
+
+            updated = []
+            ids = sorted(updated_ids)
+            for i in range(0, len(ids), _IN_CHUNK):
+                chunk = ids[i:i + _IN_CHUNK]
+                marks = ', '.join('?' * len(chunk))
+                updated.extend(self.conn.execute(f'{select} WHERE id IN ({marks})',
+                                                 chunk).fetchall())
+        finally:
+            self.conn.execute('COMMIT')
+
+        self.last_seq = last_seq
+        if inserted:
+            self.max_id = inserted[-1][0]
+        return ChangeSet(inserted, updated, deleted)
+
+    def close(self):
+        self.conn.close()
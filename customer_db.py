@@ -0,0 +1,407 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from customer_metrics import InstrumentedConnection, is_enabled
+from customer_schema import (DEDUP_KEYS, ISO_DATE_SQL, contact_ids_sorted, ensure_change_log,
+                             insert_sql, migrate_schema, migrate_step, migration_pending,
+                             storage_table)
+from customer_search import ensure_search_index, search_customers
+from customer_stats import ensure_stats, summary
+from customer_validation import normalize_contact
+
+DEFAULT_DB_PATH = 'customer_data.db'
+
+# Columns in the order the GUI and CLI display them
+COLUMNS = ('id', 'name', 'birthday', 'email', 'phone', 'address',
+           'preferred_contact', 'date_added')
+
+# Settings applied to every connection. WAL lets the form write while the
+# viewer reads; synchronous=NORMAL is durable across application crashes
+# and only fsyncs at checkpoints.
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', 256 * 1024 * 1024),
+    ('cache_size', -16 * 1024),      # negative means KiB
+    ('temp_store', 'MEMORY'),
+    ('busy_timeout', 5000),
+)
+
+POOL_SIZE = 4
+POOL_TIMEOUT = 30     # seconds to wait for a free pooled connection
+CACHED_STATEMENTS = 256
+
+# Background migrations copy this many rows per transaction, then pause
+MIGRATE_BATCH = 2000
+MIGRATE_PAUSE = 0.05
+
+# Columns that need a different expression to sort correctly: the stored
+# values behind the displayed ones (see customer_schema), all indexed.
+# preferred_contact sorts by contact_id only where order_expression can
+# check that the ids follow the names.
+SORT_EXPRESSIONS = {'birthday': 'birth_date', 'phone': 'phone_number',
+                    'date_added': 'added_at'}
+
+# Columns update_customers can set on many customers at once
+BATCH_COLUMNS = ('preferred_contact', 'address')
+
+_db_path = os.environ.get('CUSTOMER_DB', DEFAULT_DB_PATH)
+_include_archives = False
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_db_path():
+    """Return the database file used when no path is given"""
+    return _db_path
+
+
+def set_db_path(path):
+    """Change the default database file (also settable with $CUSTOMER_DB)"""
+    global _db_path
+    _db_path = path
+
+
+def include_archives():
+    """True when new connections read archived customers too"""
+    return _include_archives
+
+
+def set_include_archives(enabled):
+    """Make new connections read archived customers as well as live ones
+
+    For readers only: the full-text index doesn't cover archived rows, and
+    writes through the customers view fail (see customer_maintenance).
+    """
+    global _include_archives
+    _include_archives = enabled
+
+
+def order_expression(column, conn=None):
+    """Return the SQL expression used to sort by a display column
+
+    Given a connection, preferred_contact sorts by the indexed contact_id
+    when that gives the same order as the names.
+    """
+    if column not in COLUMNS:
+        raise ValueError(f"Unknown column: {column}")
+    if column == 'preferred_contact' and conn is not None and contact_ids_sorted(conn):
+        return 'contact_id'
+    return SORT_EXPRESSIONS.get(column, column)
+
+
+def batch_condition(customer_ids=None, where='', params=()):
+    """Return the (condition, params) picking the customers of a batch
+    operation: a list of ids, or a filter on customers such as a search"""
+    if customer_ids is not None:
+        # One parameter however many ids, so no statement per row and no
+        # limit on the number of variables
+        return ('id IN (SELECT value FROM json_each(?))',
+                (json.dumps([int(customer_id) for customer_id in customer_ids]),))
+    if not where:
+        raise ValueError("A batch operation needs customer ids or a filter")
+    return f'id IN (SELECT id FROM customers WHERE {where})', tuple(params)
+
+
+def dedup_keys(conn, name, birthday, email, phone):
+    """The DEDUP_KEYS of values not stored yet, computed by the same SQL"""
+    row = conn.execute(f'''
+        SELECT {', '.join(f'{expression} AS {column}' for column, expression in DEDUP_KEYS.items())}
+        FROM (SELECT ? AS name, ? AS email, ? AS phone,
+                     {ISO_DATE_SQL.format('birthday')} AS birth_date
+              FROM (SELECT ? AS birthday))
+    ''', (name, email, phone, birthday)).fetchone()
+    return dict(zip(DEDUP_KEYS, row))
+
+
+def connect(db_path=None, read_only=False, archives=None, **kwargs):
+    """Open a connection with the standard pragmas applied
+
+    A read_only connection can't write even by accident, and leaves the
+    journal mode to whoever created the file. With archives (by default
+    include_archives()) its customers view has the archived rows as well.
+    """
+    kwargs.setdefault('cached_statements', CACHED_STATEMENTS)
+    if is_enabled():
+        kwargs.setdefault('factory', InstrumentedConnection)
+    path = db_path or _db_path
+    if read_only:
+        # urllib.request takes longer to import than the rest of this module
+        from urllib.request import pathname2url
+        path = f'file:{pathname2url(os.path.abspath(path))}?mode=ro'
+        kwargs['uri'] = True
+    conn = sqlite3.connect(path, **kwargs)
+    for name, value in PRAGMAS:
+        if not (read_only and name == 'journal_mode'):
+            conn.execute(f'PRAGMA {name} = {value}')
+    if _include_archives if archives is None else archives:
+        # Imported here: customer_maintenance builds on this module
+        from customer_maintenance import attach_archives
+        attach_archives(conn, db_path, read_only)
+    return conn
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when every pooled connection stayed in use for POOL_TIMEOUT
+
+    A sqlite3.OperationalError, so callers handle it like a busy database.
+    """
+
+
+class ConnectionPool:
+    """A small pool of configured connections to one database file
+
+    Connections are created on demand up to `size` and may be used from
+    any thread, one thread at a time.
+    """
+
+    def __init__(self, db_path=None, size=POOL_SIZE):
+        self.db_path = db_path or _db_path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._all = []
+
+    def _acquire(self, timeout=POOL_TIMEOUT):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                conn = connect(self.db_path, check_same_thread=False)
+                self._all.append(conn)
+                return conn
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"All {self.size} database connections are busy "
+                              f"(waited {timeout}s)") from None
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with block"""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Borrow a connection and commit (or roll back) when done"""
+        with self.connection() as conn:
+            # Explicit commit/rollback rather than `with conn` so an
+            # instrumented connection can time the COMMIT
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def close(self):
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all = []
+            self._created = 0
+            self._idle = queue.LifoQueue()
+
+
+def get_pool(db_path=None):
+    """Return the shared pool for a database file"""
+    path = db_path or _db_path
+    with _pools_lock:
+        if path not in _pools:
+            _pools[path] = ConnectionPool(path)
+        return _pools[path]
+
+
+class CustomerRepository:
+    """All reads and writes of the customers table go through here"""
+
+    def __init__(self, db_path=None, pool=None):
+        self.pool = pool or get_pool(db_path)
+        self.db_path = self.pool.db_path
+        self.has_search_index = False
+        self.has_stats = False
+
+    def init_schema(self):
+        """Create the customers table and its search index if needed"""
+        return self.upgrade_schema()
+
+    def upgrade_schema(self):
+        """Migrate the schema (see customer_schema), then add the change log,
+        summary counts and the search index
+
+        Returns whether full-text search is available.
+        """
+        with self.pool.connection() as conn:
+            migrate_schema(conn)
+            table = storage_table(conn)
+            ensure_change_log(conn, table)
+            self.has_stats = ensure_stats(conn, table)
+            self.has_search_index = ensure_search_index(conn, table)
+        return self.has_search_index
+
+    def ensure_change_log(self):
+        """Create the tables and the change log, leaving the search index and
+        summary counts, which may have to read every row, to upgrade_schema"""
+        with self.pool.connection() as conn:
+            migrate_schema(conn)
+            ensure_change_log(conn, storage_table(conn))
+
+    def migration_pending(self):
+        """True while a schema migration still has rows to copy or clean up"""
+        with self.pool.connection() as conn:
+            return migration_pending(conn)
+
+    def migrate(self, batch_size=None, pause=MIGRATE_PAUSE, progress=None):
+        """Finish a pending migration one batch per transaction
+
+        Sleeps `pause` seconds between batches so the apps' own writes get
+        the database in between. progress, if given, is called with each
+        batch's migrate_step result.
+        """
+        while True:
+            with self.pool.connection() as conn:
+                step = migrate_step(conn, batch_size or MIGRATE_BATCH)
+            if step is None:
+                return
+            if progress is not None:
+                progress(*step)
+            time.sleep(pause)
+
+    def start_migration(self):
+        """Run migrate() on a daemon thread if there is anything to do
+
+        An unfinished batch is rolled back if the program exits, and the
+        next start carries on from the last committed one.
+        """
+        if not self.migration_pending():
+            return None
+        thread = threading.Thread(target=self.migrate, name='customer-migrate', daemon=True)
+        thread.start()
+        return thread
+
+    def add_customer(self, name, birthday, email, phone, address, preferred_contact):
+        """Insert one customer and return its id"""
+        with self.pool.transaction() as conn:
+            cursor = conn.execute(insert_sql(conn),
+                                  (name, birthday, email, phone, address, preferred_contact))
+            return cursor.lastrowid
+
+    def add_customers(self, rows):
+        """Insert several customers in one transaction and return their ids"""
+        with self.pool.transaction() as conn:
+            sql = insert_sql(conn)
+            return [conn.execute(sql, row).lastrowid for row in rows]
+
+    def delete_customer(self, customer_id):
+        with self.pool.transaction() as conn:
+            conn.execute('DELETE FROM customers WHERE id = ?', (customer_id,))
+
+    def delete_customers(self, customer_ids=None, where='', params=()):
+        """Delete many customers with one statement in one transaction
+
+        Takes ids or a filter (see batch_condition); returns how many were
+        deleted. Writes the storage table directly rather than through the
+        view's trigger.
+        """
+        condition, values = batch_condition(customer_ids, where, params)
+        with self.pool.transaction() as conn:
+            return conn.execute(f'DELETE FROM {storage_table(conn)} WHERE {condition}',
+                                values).rowcount
+
+    def update_customers(self, changes, customer_ids=None, where='', params=()):
+        """Set BATCH_COLUMNS of many customers with one statement in one transaction
+
+        changes maps column names to new values; customers are picked as
+        in delete_customers. Returns how many rows changed: rows that
+        already have the values are left alone.
+        """
+        unknown = set(changes) - set(BATCH_COLUMNS)
+        if unknown:
+            raise ValueError(f"Can't update in a batch: {', '.join(sorted(unknown))}")
+        if not changes:
+            return 0
+        condition, values = batch_condition(customer_ids, where, params)
+        with self.pool.transaction() as conn:
+            table = storage_table(conn)
+            stored = {}
+            for column, value in changes.items():
+                if column == 'preferred_contact':
+                    value = normalize_contact(value) or value
+                    if table == 'customer_records':
+                        # Version 2 stores the id of the contact method
+                        conn.execute('INSERT OR IGNORE INTO contact_methods (name) VALUES (?)',
+                                     (value,))
+                        column = 'contact_id'
+                        value = conn.execute('SELECT id FROM contact_methods WHERE name = ?',
+                                             (value,)).fetchone()[0]
+                stored[column] = value
+            assignments = ', '.join(f'{column} = ?' for column in stored)
+            different = ' OR '.join(f'{column} IS NOT ?' for column in stored)
+            return conn.execute(
+                f'UPDATE {table} SET {assignments} WHERE {condition} AND ({different})',
+                (*stored.values(), *values, *stored.values())).rowcount
+
+    def get_customer(self, customer_id):
+        with self.pool.connection() as conn:
+            return conn.execute(f"SELECT {', '.join(COLUMNS)} FROM customers WHERE id = ?",
+                                (customer_id,)).fetchone()
+
+    def all_customers(self, descending=False, order_column='id'):
+        """Return every customer ordered by a column, then id"""
+        order = 'DESC' if descending else 'ASC'
+        with self.pool.connection() as conn:
+            expression = order_expression(order_column, conn)
+            return conn.execute(f"SELECT {', '.join(COLUMNS)} FROM customers "
+                                f"ORDER BY {expression} {order}, id {order}").fetchall()
+
+    def count(self, where='', params=()):
+        """Count the customers, or those matching a filter"""
+        sql = 'SELECT COUNT(*) FROM customers' + (f' WHERE {where}' if where else '')
+        with self.pool.connection() as conn:
+            return conn.execute(sql, params).fetchone()[0]
+
+    def contact_counts(self):
+        """Return (preferred_contact, count) pairs"""
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT preferred_contact, COUNT(*) FROM customers '
+                                'GROUP BY preferred_contact').fetchall()
+
+    def summary(self, today=None):
+        """Dashboard counts kept up to date by triggers (see customer_stats)"""
+        if not self.has_stats:
+            self.upgrade_schema()
+        with self.pool.connection() as conn:
+            return summary(conn, today)
+
+    def search(self, term, columns=None, limit=None):
+        """Ranked full-text search, falling back to a name LIKE scan"""
+        with self.pool.connection() as conn:
+            if not _include_archives and (self.has_search_index or ensure_search_index(conn)):
+                self.has_search_index = True
+                return search_customers(conn, term, limit, columns)
+            # Same fallback as before the index existed: name only
+            sql = f"SELECT {', '.join(COLUMNS)} FROM customers WHERE name LIKE ?"
+            return conn.execute(sql, (f'%{term}%',)).fetchall()
+
+
+def get_repository(db_path=None):
+    """Return a repository on the shared pool for a database file"""
+    return CustomerRepository(db_path)
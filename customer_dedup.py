@@ -0,0 +1,234 @@
+import argparse
+import csv
+import os
+import re
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+
+from customer_db import (COLUMNS, DEDUP_KEYS, connect, dedup_keys, get_db_path, get_pool,
+                         get_repository)
+from customer_validation import parse_date, phone_digits
+
+THRESHOLD = 0.6      # scores at or above this are reported as duplicates
+MAX_BLOCK = 100      # larger key groups (e.g. a shared office phone) are skipped
+CHUNK_PAIRS = 20000  # candidate pairs scored per worker task
+MATCH_LIMIT = 50     # candidates fetched per key when checking one customer
+
+# How much each field counts towards a pair's score
+WEIGHTS = {'email': 0.35, 'phone': 0.25, 'name': 0.25, 'birthday': 0.10, 'address': 0.05}
+
+_WORD_RE = re.compile(r'\w+')
+_IN_CHUNK = 500
+_SELECT = f"SELECT {', '.join(COLUMNS)} FROM customers"
+
+# Each worker process keeps one connection for all of its tasks
+_worker_conn = None
+
+
+def normalize_email(email):
+    """Lowercase and drop a +tag from the local part"""
+    local, _, domain = email.strip().lower().partition('@')
+    local = local.split('+', 1)[0]
+    return f'{local}@{domain}' if domain else local
+
+
+def normalize_name(name):
+    """Lowercase words in sorted order, so "Smith, John" equals "john smith\""""
+    return ' '.join(sorted(_WORD_RE.findall(name.casefold())))
+
+
+def similarity(a, b):
+    """0.0 to 1.0 similarity of two strings"""
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def score(a, b):
+    """How likely two customer rows (in COLUMNS order) are the same person"""
+    _, name_a, birthday_a, email_a, phone_a, address_a = a[:6]
+    _, name_b, birthday_b, email_b, phone_b, address_b = b[:6]
+    digits_a, digits_b = phone_digits(phone_a), phone_digits(phone_b)
+    born_a, born_b = parse_date(birthday_a), parse_date(birthday_b)
+    return (WEIGHTS['email'] * (normalize_email(email_a) == normalize_email(email_b))
+            + WEIGHTS['phone'] * (bool(digits_a) and digits_a == digits_b)
+            + WEIGHTS['name'] * similarity(normalize_name(name_a), normalize_name(name_b))
+            + WEIGHTS['birthday'] * (born_a is not None and born_a == born_b)
+            + WEIGHTS['address'] * similarity(address_a.casefold(), address_b.casefold()))
+
+
+def find_matches(conn, name, birthday, email, phone, address,
+                 threshold=THRESHOLD, limit=MATCH_LIMIT):
+    """Return (score, row) for stored customers that look like these values
+
+    Only rows sharing a duplicate key are looked at, each through an index,
+    so this is fast enough to run on every form submit.
+    """
+    keys = dedup_keys(conn, name, birthday, email, phone)
+    candidates = {}
+    for column, key in keys.items():
+        if not key:
+            continue
+        for row in conn.execute(f'{_SELECT} WHERE {column} = ? LIMIT ?', (key, limit)):
+            candidates[row[0]] = row
+    new = (None, name, birthday, email, phone, address)
+    matches = [(score(new, row), row) for row in candidates.values()]
+    return sorted((m for m in matches if m[0] >= threshold), key=lambda m: -m[0])
+
+
+def check_customer(name, birthday, email, phone, address, db_path=None,
+                   threshold=THRESHOLD):
+    """find_matches on the shared connection pool"""
+    with get_pool(db_path).connection() as conn:
+        return find_matches(conn, name, birthday, email, phone, address, threshold)
+
+
+def candidate_pairs(conn, max_block=MAX_BLOCK):
+    """Return (pairs, skipped): id pairs that share a key, and oversized groups
+
+    Each key is grouped through its index, so no pair of customers that
+    shares nothing is ever compared.
+    """
+    pairs = set()
+    skipped = 0
+    for column in DEDUP_KEYS:
+        for size, ids in conn.execute(f'''
+                SELECT COUNT(*), group_concat(id) FROM customers
+                WHERE {column} IS NOT NULL AND {column} != ''
+                GROUP BY {column} HAVING COUNT(*) > 1
+            '''):
+            if size > max_block:
+                skipped += 1
+                continue
+            ids = sorted(int(i) for i in ids.split(','))
+            pairs.update((a, b) for i, a in enumerate(ids) for b in ids[i + 1:])
+    return sorted(pairs), skipped
+
+
+def _init_worker(db_path):
+    global _worker_conn
+    _worker_conn = connect(db_path)
+
+
+def _score_pairs(pairs, threshold, conn=None):
+    """Fetch the rows of a chunk of pairs and return those scoring >= threshold"""
+    conn = conn or _worker_conn
+    ids = sorted({i for pair in pairs for i in pair})
+    rows = {}
+    for start in range(0, len(ids), _IN_CHUNK):
+        chunk = ids[start:start + _IN_CHUNK]
+        marks = ', '.join('?' * len(chunk))
+        rows.update((row[0], row) for row in
+                    conn.execute(f'{_SELECT} WHERE id IN ({marks})', chunk))
+    found = []
+    for a, b in pairs:
+        if a in rows and b in rows:
+            pair_score = score(rows[a], rows[b])
+            if pair_score >= threshold:
+                found.append((pair_score, a, b))
+    return found
+
+
+def find_duplicates(db_path=None, threshold=THRESHOLD, workers=None,
+                    max_block=MAX_BLOCK, progress=None):
+    """Score every candidate pair in the table, using several processes
+
+    Returns ((score, id, id) best first, number of candidate pairs, number
+    of key groups skipped for being larger than max_block). progress, if
+    given, is called as progress(done, total) in candidate pairs.
+    """
+    conn = connect(db_path)
+    try:
+        db_path = db_path or get_db_path()
+        pairs, skipped = candidate_pairs(conn, max_block)
+        chunks = [pairs[i:i + CHUNK_PAIRS] for i in range(0, len(pairs), CHUNK_PAIRS)]
+        workers = workers or os.cpu_count() or 1
+
+        found, done = [], 0
+        if workers == 1 or len(chunks) <= 1:
+            results = (_score_pairs(chunk, threshold, conn) for chunk in chunks)
+            for chunk, result in zip(chunks, results):
+                found.extend(result)
+                done += len(chunk)
+                if progress is not None:
+                    progress(done, len(pairs))
+        else:
+            with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                     initargs=(db_path,)) as executor:
+                results = executor.map(_score_pairs, chunks, [threshold] * len(chunks))
+                for chunk, result in zip(chunks, results):
+                    found.extend(result)
+                    done += len(chunk)
+                    if progress is not None:
+                        progress(done, len(pairs))
+    finally:
+        conn.close()
+
+    found.sort(key=lambda pair: (-pair[0], pair[1], pair[2]))
+    return found, len(pairs), skipped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find customers entered more than once")
+    parser.add_argument('--db', help="database file (default: $CUSTOMER_DB or customer_data.db)")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help=f"lowest score reported, 0-1 (default: {THRESHOLD})")
+    parser.add_argument('--workers', type=int,
+                        help="processes scoring pairs (default: one per CPU)")
+    parser.add_argument('--output', help="write all pairs with both customers to this CSV file")
+    parser.add_argument('--limit', type=int, default=20, help="pairs to print (default: 20)")
+    args = parser.parse_args(argv)
+
+    def progress(done, total):
+        print(f"\rScored {done} of {total} candidate pairs", end='', file=sys.stderr, flush=True)
+
+    try:
+        # The keys are columns of schema version 2, which an older database
+        # has to be brought up to (and its rows copied into) first
+        repo = get_repository(args.db)
+        repo.upgrade_schema()
+        repo.migrate()
+        found, candidates, skipped = find_duplicates(args.db, args.threshold, args.workers,
+                                                     progress=progress)
+        print(file=sys.stderr)
+        with get_pool(args.db).connection() as conn:
+            def rows(ids):
+                marks = ', '.join('?' * len(ids))
+                return {row[0]: row for row in
+                        conn.execute(f'{_SELECT} WHERE id IN ({marks})', ids)}
+
+            if args.output:
+                with open(args.output, 'w', newline='', encoding='utf-8') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(('score',) + tuple(f'{c}_1' for c in COLUMNS)
+                                    + tuple(f'{c}_2' for c in COLUMNS))
+                    for start in range(0, len(found), _IN_CHUNK // 2):
+                        chunk = found[start:start + _IN_CHUNK // 2]
+                        by_id = rows(sorted({i for _, a, b in chunk for i in (a, b)}))
+                        for pair_score, a, b in chunk:
+                            if a not in by_id or b not in by_id:
+                                continue    # deleted since it was scored
+                            writer.writerow((f'{pair_score:.3f}',) + by_id[a] + by_id[b])
+
+            shown = found[:args.limit]
+            by_id = rows(sorted({i for _, a, b in shown for i in (a, b)})) if shown else {}
+            for pair_score, a, b in shown:
+                if a not in by_id or b not in by_id:
+                    continue
+                print(f"{pair_score:.2f}  #{a} {by_id[a][1]} <{by_id[a][3]}>  ~  "
+                      f"#{b} {by_id[b][1]} <{by_id[b][3]}>")
+    except (OSError, sqlite3.Error) as e:
+        print(f"Duplicate search failed: {e}", file=sys.stderr)
+        return 1
+
+    print(f"{len(found)} likely duplicate pairs out of {candidates} candidates"
+          + (f" ({skipped} oversized key groups skipped)" if skipped else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,272 @@
+import csv
+import gzip
+import importlib
+import importlib.util
+import io
+import itertools
+import json
+import sys
+
+from customer_db import COLUMNS, connect, order_expression
+
+FORMATS = ('csv', 'jsonl', 'parquet', 'text')
+COMPRESSIONS = ('gzip', 'zstd')
+
+CHUNK_SIZE = 10000   # rows fetched from the cursor at a time
+
+_EXTENSIONS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl',
+               '.parquet': 'parquet', '.txt': 'text'}
+_COMPRESSION_EXTENSIONS = {'.gz': 'gzip', '.zst': 'zstd'}
+
+TEXT_LABELS = ('ID', 'Name', 'Birthday', 'Email', 'Phone', 'Address',
+               'Preferred Contact', 'Date Added')
+
+# Column widths of the table format; longer values are cut off
+TABLE_WIDTHS = (8, 24, 10, 30, 12, 40, 7, 19)
+
+
+class ExportCancelled(Exception):
+    """Raised inside export_customers when the progress callback asks to stop"""
+
+
+def detect_format(path):
+    """Guess (format, compression) from a file name like customers.csv.gz"""
+    name = path.lower()
+    compression = None
+    for ext, kind in _COMPRESSION_EXTENSIONS.items():
+        if name.endswith(ext):
+            compression = kind
+            name = name[:-len(ext)]
+    for ext, fmt in _EXTENSIONS.items():
+        if name.endswith(ext):
+            return fmt, compression
+    return 'csv', compression
+
+
+def _optional_module(name):
+    """Import an optional export engine on first use, or return None
+
+    pyarrow alone takes longer to import than the whole viewer, so it is
+    only loaded when a Parquet export starts.
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+def available_formats():
+    """Formats that can be written with the installed packages"""
+    return [fmt for fmt in FORMATS
+            if fmt != 'parquet' or importlib.util.find_spec('pyarrow') is not None]
+
+
+def iter_chunks(conn, where='', params=(), order_column='id', descending=False,
+                chunk_size=CHUNK_SIZE, limit=None, offset=0, columns=COLUMNS):
+    """Yield lists of customer rows straight from an open SQLite cursor
+
+    columns are SQL expressions to select instead of COLUMNS.
+    """
+    direction = 'DESC' if descending else 'ASC'
+    sql = f"SELECT {', '.join(columns)} FROM customers"
+    if where:
+        sql += f' WHERE {where}'
+    sql += f' ORDER BY {order_expression(order_column, conn)} {direction}, id {direction}'
+    if limit is not None or offset:
+        sql += ' LIMIT ? OFFSET ?'
+        params = tuple(params) + (-1 if limit is None else limit, offset)
+    cursor = conn.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+
+
+def _open_binary(path, compression):
+    if path == '-':
+        if compression:
+            raise ValueError("Compressed output can't be written to standard output")
+        # Anything printed before goes out first
+        sys.stdout.flush()
+        return sys.stdout.buffer
+    if compression == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=6)
+    if compression == 'zstd':
+        zstandard = _optional_module('zstandard')
+        if zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package")
+        return zstandard.ZstdCompressor().stream_writer(open(path, 'wb'))
+    return open(path, 'wb')
+
+
+class _TextWriter:
+    """Base for formats written as text through an optional compressor
+
+    A path of '-' writes to standard output, which is left open.
+    """
+
+    def __init__(self, path, compression):
+        self.raw = _open_binary(path, compression)
+        self.file = io.TextIOWrapper(self.raw, encoding='utf-8', newline='')
+        self.start()
+
+    # SQL expressions that render a whole row as one line of output, when
+    # SQLite can do that faster than Python (see write_rendered)
+    sql_columns = None
+
+    def start(self):
+        pass
+
+    def write_rendered(self, rows):
+        """Write rows selected with sql_columns"""
+        self.file.write(''.join(line + '\n' for line, in rows))
+
+    def close(self):
+        if self.raw is sys.stdout.buffer:
+            self.file.flush()
+            self.file.detach()
+        else:
+            self.file.close()
+
+
+class CsvWriter(_TextWriter):
+    def start(self):
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+
+class JsonlWriter(_TextWriter):
+    # json_object() is several times faster than json.dumps; write()
+    # gives the same output for rows from elsewhere
+    sql_columns = ("json_object(" + ', '.join(f"'{column}', {column}"
+                                              for column in COLUMNS) + ")",)
+
+    def write(self, rows):
+        self.file.write(''.join(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False,
+                                           separators=(',', ':')) + '\n'
+                                for row in rows))
+
+
+class TableWriter(_TextWriter):
+    """Aligned columns for reading in a terminal"""
+
+    # '!' makes SQLite count widths in characters rather than bytes
+    sql_columns = ("printf('" + ' '.join(f'%!-{width}.{width}s' for width in TABLE_WIDTHS)
+                   + "', " + ', '.join(COLUMNS) + ")",)
+
+    def start(self):
+        self.template = ' '.join(f'%-{width}.{width}s' for width in TABLE_WIDTHS) + '\n'
+        labels = ('ID', 'Name', 'Birthday', 'Email', 'Phone', 'Address', 'Contact',
+                  'Date Added')
+        self.file.write(self.template % labels)
+        self.file.write(' '.join('-' * width for width in TABLE_WIDTHS) + '\n')
+
+    def write(self, rows):
+        template = self.template
+        self.file.write(''.join(
+            template % (row if None not in row else
+                        tuple('' if value is None else value for value in row))
+            for row in rows))
+
+
+class PlainTextWriter(_TextWriter):
+    """The original fixed-format text export"""
+
+    def start(self):
+        self.file.write("CUSTOMER DATABASE EXPORT\n")
+        self.file.write("=" * 80 + "\n\n")
+
+    def write(self, rows):
+        parts = []
+        for row in rows:
+            for label, value in zip(TEXT_LABELS, row):
+                parts.append(f"{label}: {value}\n")
+            parts.append("-" * 80 + "\n\n")
+        self.file.write(''.join(parts))
+
+
+class ParquetWriter:
+    """Writes one row group per chunk, so memory stays flat"""
+
+    def __init__(self, path, compression):
+        if path == '-':
+            raise ValueError("Parquet can't be written to standard output")
+        pq = _optional_module('pyarrow.parquet')
+        if pq is None:
+            raise ValueError("Parquet export needs the pyarrow package")
+        self.pa = pa = _optional_module('pyarrow')
+        self.schema = pa.schema([
+            ('id', pa.int64()), ('name', pa.string()), ('birthday', pa.string()),
+            ('email', pa.string()), ('phone', pa.string()), ('address', pa.string()),
+            ('preferred_contact', pa.string()), ('date_added', pa.string()),
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema,
+                                       compression=compression or 'snappy')
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        pa = self.pa
+        arrays = [pa.array(column, type=field.type)
+                  for column, field in zip(columns, self.schema)]
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {'csv': CsvWriter, 'jsonl': JsonlWriter, 'parquet': ParquetWriter,
+           'text': PlainTextWriter, 'table': TableWriter}
+
+
+def export_customers(path, fmt=None, compression=None, where='', params=(),
+                     order_column='id', descending=False, db_path=None,
+                     chunk_size=CHUNK_SIZE, progress=None, limit=None, offset=0):
+    """Stream customers into a file and return the number of rows written
+
+    fmt and compression default to what the file name suggests; a path of
+    '-' writes to standard output. where and params restrict the rows like
+    the viewer's search, and limit and offset pick a slice of them.
+    progress, if given, is called as progress(done, total) after every
+    chunk; returning False from it cancels the export with ExportCancelled.
+    """
+    guessed_fmt, guessed_compression = detect_format(path)
+    fmt = fmt or guessed_fmt
+    compression = compression or guessed_compression
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    conn = connect(db_path)
+    try:
+        total = None
+        if progress is not None:
+            sql = 'SELECT COUNT(*) FROM customers'
+            if where:
+                sql += f' WHERE {where}'
+            total = max(0, conn.execute(sql, params).fetchone()[0] - offset)
+            if limit is not None:
+                total = min(total, limit)
+
+        writer_class = WRITERS[fmt]
+        rendered = getattr(writer_class, 'sql_columns', None)
+        chunks = iter_chunks(conn, where, params, order_column, descending,
+                             chunk_size, limit, offset, rendered or COLUMNS)
+        # Run the query before creating the file, so a bad filter leaves none
+        first = next(chunks, None)
+        writer = writer_class(path, compression)
+        write = writer.write if rendered is None else writer.write_rendered
+        done = 0
+        try:
+            for rows in itertools.chain([first] if first else [], chunks):
+                write(rows)
+                done += len(rows)
+                if progress is not None and progress(done, total) is False:
+                    raise ExportCancelled(f"Export cancelled after {done} rows")
+        finally:
+            writer.close()
+        return done
+    finally:
+        conn.close()
@@ -0,0 +1,212 @@
+import argparse
+import csv
+import json
+import random
+import sqlite3
+import sys
+from datetime import date, datetime, timedelta
+
+from customer_import import BATCH_SIZE, import_records
+from customer_validation import FIELDS
+
+FIRST_NAMES = (
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda',
+    'David', 'Elizabeth', 'William', 'Barbara', 'Richard', 'Susan', 'Joseph',
+    'Jessica', 'Thomas', 'Sarah', 'Charles', 'Karen', 'Christopher', 'Lisa',
+    'Daniel', 'Nancy', 'Matthew', 'Betty', 'Anthony', 'Margaret', 'Mark', 'Sandra',
+    'Donald', 'Ashley', 'Steven', 'Kimberly', 'Paul', 'Emily', 'Andrew', 'Donna',
+    'Joshua', 'Michelle', 'Kenneth', 'Carol', 'Kevin', 'Amanda', 'Brian', 'Melissa',
+    'George', 'Deborah', 'Timothy', 'Stephanie', 'Ronald', 'Rebecca', 'Jason',
+    'Sharon', 'Edward', 'Laura', 'Jeffrey', 'Cynthia', 'Ryan', 'Kathleen', 'Jacob',
+    'Amy', 'Gary', 'Angela', 'Nicholas', 'Shirley', 'Eric', 'Anna', 'Jonathan',
+    'Brenda', 'Stephen', 'Pamela', 'Larry', 'Emma', 'Justin', 'Nicole', 'Scott',
+    'Helen', 'Brandon', 'Samantha', 'Benjamin', 'Katherine', 'Samuel', 'Christine',
+    'Gregory', 'Debra', 'Alexander', 'Rachel', 'Frank', 'Carolyn', 'Raymond',
+    'Janet', 'Patrick', 'Catherine', 'Jack', 'Maria', 'Dennis', 'Heather', 'Jerry',
+    'Diane', 'Tyler', 'Ruth', 'Aaron', 'Julie', 'Jose', 'Olivia', 'Adam', 'Joyce',
+    'Nathan', 'Virginia', 'Henry', 'Victoria', 'Douglas', 'Kelly', 'Zachary',
+    'Lauren', 'Peter', 'Christina', 'Kyle', 'Joan', 'Ethan', 'Evelyn', 'Walter',
+    'Judith', 'Noah', 'Megan', 'Jeremy', 'Andrea', 'Christian', 'Cheryl', 'Keith',
+    'Hannah', 'Roger', 'Jacqueline', 'Terry', 'Martha', 'Gerald', 'Gloria', 'Harold',
+    'Teresa', 'Sean', 'Ann', 'Austin', 'Sara', 'Carl', 'Madison', 'Arthur', 'Frances',
+    'Lawrence', 'Kathryn', 'Dylan', 'Janice', 'Jesse', 'Jean', 'Jordan', 'Abigail',
+)
+
+LAST_NAMES = (
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis',
+    'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson',
+    'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin', 'Lee', 'Perez', 'Thompson',
+    'White', 'Harris', 'Sanchez', 'Clark', 'Ramirez', 'Lewis', 'Robinson', 'Walker',
+    'Young', 'Allen', 'King', 'Wright', 'Scott', 'Torres', 'Nguyen', 'Hill', 'Flores',
+    'Green', 'Adams', 'Nelson', 'Baker', 'Hall', 'Rivera', 'Campbell', 'Mitchell',
+    'Carter', 'Roberts', 'Gomez', 'Phillips', 'Evans', 'Turner', 'Diaz', 'Parker',
+    'Cruz', 'Edwards', 'Collins', 'Reyes', 'Stewart', 'Morris', 'Morales', 'Murphy',
+    'Cook', 'Rogers', 'Gutierrez', 'Ortiz', 'Morgan', 'Cooper', 'Peterson', 'Bailey',
+    'Reed', 'Kelly', 'Howard', 'Ramos', 'Kim', 'Cox', 'Ward', 'Richardson', 'Watson',
+    'Brooks', 'Chavez', 'Wood', 'James', 'Bennett', 'Gray', 'Mendoza', 'Ruiz',
+    'Hughes', 'Price', 'Alvarez', 'Castillo', 'Sanders', 'Patel', 'Myers', 'Long',
+    'Ross', 'Foster', 'Jimenez', 'Powell', 'Jenkins', 'Perry', 'Russell', 'Sullivan',
+    'Bell', 'Coleman', 'Butler', 'Henderson', 'Barnes', 'Gonzales', 'Fisher',
+    'Vasquez', 'Simmons', 'Romero', 'Jordan', 'Patterson', 'Alexander', 'Hamilton',
+    'Graham', 'Reynolds', 'Griffin', 'Wallace', 'Moreno', 'West', 'Cole', 'Hayes',
+    'Bryant', 'Herrera', 'Gibson', 'Ellis', 'Tran', 'Medina', 'Aguilar', 'Stevens',
+    'Murray', 'Ford', 'Castro', 'Marshall', 'Owens', 'Harrison', 'Fernandez',
+    'McDonald', 'Woods', 'Washington', 'Kennedy', 'Wells', 'Vargas', 'Henry', 'Chen',
+    'Freeman', 'Webb', 'Tucker', 'Guzman', 'Burns', 'Crawford', 'Olson', 'Simpson',
+)
+
+STREETS = (
+    'Main', 'Oak', 'Pine', 'Maple', 'Cedar', 'Elm', 'Washington', 'Lake', 'Hill',
+    'Park', 'Walnut', 'Sunset', 'Lincoln', 'Jackson', 'Church', 'River', 'Willow',
+    'Highland', 'Meadow', 'Forest', 'Spring', 'Ridge', 'Jefferson', 'Adams', 'Center',
+    'Franklin', 'Chestnut', 'Madison', 'Valley', 'Mill', 'Birch', 'Spruce', 'Laurel',
+)
+
+STREET_SUFFIXES = ('St', 'Ave', 'Rd', 'Blvd', 'Ln', 'Dr', 'Ct', 'Way', 'Pl')
+
+CITIES = (
+    ('Springfield', 'IL'), ('Madison', 'WI'), ('Portland', 'OR'), ('Austin', 'TX'),
+    ('Denver', 'CO'), ('Columbus', 'OH'), ('Raleigh', 'NC'), ('Nashville', 'TN'),
+    ('Salem', 'MA'), ('Fairview', 'NJ'), ('Franklin', 'TN'), ('Greenville', 'SC'),
+    ('Bristol', 'CT'), ('Clinton', 'IA'), ('Georgetown', 'KY'), ('Arlington', 'VA'),
+    ('Riverside', 'CA'), ('Phoenix', 'AZ'), ('Boise', 'ID'), ('Omaha', 'NE'),
+    ('Tulsa', 'OK'), ('Albany', 'NY'), ('Dayton', 'OH'), ('Reno', 'NV'),
+)
+
+EMAIL_DOMAINS = ('gmail.com', 'yahoo.com', 'outlook.com', 'hotmail.com', 'aol.com',
+                 'icloud.com', 'example.com', 'mail.com')
+
+# Preferred contact methods and how often customers pick them
+CONTACT_WEIGHTS = (('Email', 60), ('Phone', 30), ('Mail', 10))
+
+_FIRST_BIRTHDAY = date(1940, 1, 1).toordinal()
+_LAST_BIRTHDAY = date(2007, 12, 31).toordinal()
+
+# date_added grows with the row number: 10M rows span about five years
+_FIRST_ADDED = datetime(2020, 1, 1)
+_ADDED_EVERY = 15   # seconds
+
+# Recent customers kept around to be repeated as near-duplicates
+_RECENT = 1000
+
+
+def _vary(rng, record):
+    """A copy of record as it might be typed in again by someone else"""
+    record = dict(record)
+    change = rng.randrange(4)
+    if change == 0:
+        record['name'] = record['name'].upper()
+    elif change == 1:
+        record['email'] = record['email'].upper()
+    elif change == 2:
+        digits = ''.join(c for c in record['phone'] if c.isdigit())
+        record['phone'] = f"({digits[:3]}) {digits[3:6]}-{digits[6:]}"
+    else:
+        record['address'] = record['address'].replace(' St,', ' Street,')
+    return record
+
+
+def generate_customers(count, seed=0, duplicates=0.0):
+    """Yield count customer records as dicts with FIELDS and date_added
+
+    The same seed always gives the same rows, and a smaller count gives a
+    prefix of a larger one. duplicates is the share of rows that repeat a
+    recent customer with a small variation.
+    """
+    rng = random.Random(seed)
+    rand, randint = rng.random, rng.randint
+    # Indexing with int(rand() * n) is several times faster than choice()
+    firsts = [(name, name.lower()) for name in FIRST_NAMES]
+    lasts = [(name, name.lower()) for name in LAST_NAMES]
+    streets = [f"{street} {suffix}" for street in STREETS for suffix in STREET_SUFFIXES]
+    cities = [f"{city}, {state}" for city, state in CITIES]
+    total = sum(weight for _, weight in CONTACT_WEIGHTS)
+    contacts, running = [], 0
+    for method, weight in CONTACT_WEIGHTS:
+        running += weight
+        contacts.append((running / total, method))
+    recent = []
+
+    for i in range(count):
+        added = _FIRST_ADDED + timedelta(seconds=i * _ADDED_EVERY)
+        date_added = added.strftime('%Y-%m-%d %H:%M:%S')
+
+        if recent and duplicates and rand() < duplicates:
+            record = _vary(rng, recent[int(rand() * len(recent))])
+            record['date_added'] = date_added
+            yield record
+            continue
+
+        first, first_lower = firsts[int(rand() * len(firsts))]
+        last, last_lower = lasts[int(rand() * len(lasts))]
+        birthday = date.fromordinal(randint(_FIRST_BIRTHDAY, _LAST_BIRTHDAY))
+        pick = rand()
+        contact = next(method for limit, method in contacts if pick < limit)
+        record = {
+            'name': f"{first} {last}",
+            'birthday': f"{birthday.month:02d}/{birthday.day:02d}/{birthday.year}",
+            'email': (f"{first_lower}.{last_lower}{i}@"
+                      f"{EMAIL_DOMAINS[int(rand() * len(EMAIL_DOMAINS))]}"),
+            'phone': (f"{201 + int(rand() * 789)}-{200 + int(rand() * 800)}-"
+                      f"{int(rand() * 10000):04d}"),
+            'address': (f"{1 + int(rand() * 9999)} {streets[int(rand() * len(streets))]}, "
+                        f"{cities[int(rand() * len(cities))]} "
+                        f"{10000 + int(rand() * 90000)}"),
+            'preferred_contact': contact,
+            'date_added': date_added,
+        }
+        if len(recent) < _RECENT:
+            recent.append(record)
+        else:
+            recent[i % _RECENT] = record
+        yield record
+
+
+def generate_database(count, db_path=None, seed=0, duplicates=0.0,
+                      batch_size=BATCH_SIZE, progress=None):
+    """Add count synthetic customers to a database and return ImportStats"""
+    return import_records(generate_customers(count, seed, duplicates), db_path,
+                          batch_size=batch_size, progress=progress)
+
+
+def write_file(path, count, seed=0, duplicates=0.0):
+    """Write synthetic customers to a CSV or JSONL file for customer_import"""
+    fields = FIELDS + ('date_added',)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        if path.lower().endswith(('.jsonl', '.ndjson')):
+            for record in generate_customers(count, seed, duplicates):
+                f.write(json.dumps(record) + '\n')
+        else:
+            writer = csv.writer(f)
+            writer.writerow(fields)
+            writer.writerows([record[k] for k in fields]
+                             for record in generate_customers(count, seed, duplicates))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic customers for testing")
+    parser.add_argument('count', type=int, help="number of customers to generate")
+    parser.add_argument('--db', help="database file (default: $CUSTOMER_DB or customer_data.db)")
+    parser.add_argument('--output', help="write a CSV or JSONL file instead of a database")
+    parser.add_argument('--seed', type=int, default=0, help="random seed (default: 0)")
+    parser.add_argument('--duplicates', type=float, default=0.0,
+                        help="share of rows that repeat an earlier customer (0-1)")
+    parser.add_argument('--quiet', action='store_true', help="don't print progress")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.output:
+            write_file(args.output, args.count, args.seed, args.duplicates)
+            print(f"Wrote {args.count} customers to '{args.output}'")
+            return 0
+        progress = None if args.quiet else lambda s: print(s, file=sys.stderr)
+        print(generate_database(args.count, args.db, args.seed, args.duplicates,
+                                progress=progress))
+    except (OSError, sqlite3.Error, ValueError) as e:
+        print(f"Generation failed: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
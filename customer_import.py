@@ -0,0 +1,279 @@
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+import time
+from itertools import islice
+from datetime import datetime, timezone
+
+from customer_db import connect
+from customer_metrics import enable as enable_metrics, timed
+from customer_schema import (RECORDS_INSERT_SQL, contact_ids, insert_sql, migrate_schema,
+                             storage_table, stored_values)
+from customer_search import (create_search_triggers, drop_search_triggers,
+                             ensure_search_index, index_customers)
+from customer_stats import add_stats, create_stats_triggers, drop_stats_triggers, ensure_stats
+from customer_validation import FIELDS, normalize_contact, validate_customers
+
+BATCH_SIZE = 50000   # rows validated and inserted at a time
+
+
+class ImportStats:
+    """Counters for one import run"""
+
+    def __init__(self):
+        self.read = 0
+        self.inserted = 0
+        self.rejected = 0
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.read / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f"Imported {self.inserted} of {self.read} rows "
+                f"({self.rejected} rejected) in {self.seconds:.2f}s "
+                f"({self.rows_per_second:,.0f} rows/s)")
+
+
+def _normalize_key(key):
+    return (key or '').strip().lower().replace(' ', '_')
+
+
+def read_csv(f):
+    """Yield records from a CSV file with a header row"""
+    reader = csv.reader(f)
+    header = [_normalize_key(k) for k in next(reader, [])]
+    for row in reader:
+        yield dict(zip(header, row))
+
+
+class InvalidRecord(dict):
+    """A line that couldn't be read as a record; rejected with `error`"""
+
+    def __init__(self, values, error):
+        super().__init__(values)
+        self.error = error
+
+
+def read_jsonl(f):
+    """Yield records from a file with one JSON object per line
+
+    A line that isn't a JSON object is yielded as an InvalidRecord, so it
+    is rejected on its own instead of stopping the import.
+    """
+    for number, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield InvalidRecord({'line': line}, f"Line {number}: invalid JSON ({e.msg})")
+            continue
+        if not isinstance(record, dict):
+            yield InvalidRecord({'line': line}, f"Line {number}: not a JSON object")
+            continue
+        yield {_normalize_key(k): v for k, v in record.items()}
+
+
+def detect_format(path):
+    """Guess the input format from a file name"""
+    return 'jsonl' if path.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def validate_batch(records, date_added):
+    """Validate a list of records with the shared batch validators
+
+    Returns (rows, rejects): insertable value tuples and (record, error)
+    pairs. Records without a date_added get the given timestamp.
+    """
+    invalid = [(record, record.error) for record in records
+               if isinstance(record, InvalidRecord)]
+    if invalid:
+        records = [record for record in records if not isinstance(record, InvalidRecord)]
+    columns = {field: [str(record.get(field) or '').strip() for record in records]
+               for field in FIELDS}
+    mask, reasons = validate_customers(columns)
+
+    rows, rejects = [], invalid
+    name, birthday, email, phone, address, contact = (columns[f] for f in FIELDS)
+    for i, ok in enumerate(mask):
+        if ok:
+            rows.append((name[i], birthday[i], email[i], phone[i], address[i],
+                         normalize_contact(contact[i]),
+                         str(records[i].get('date_added') or date_added)))
+        else:
+            rejects.append((records[i], reasons[i]))
+    return rows, rejects
+
+
+class _RejectWriter:
+    """Write rejected records, with the reason, in the input's format"""
+
+    def __init__(self, path, fmt):
+        self.path = path
+        self.fmt = fmt
+        self.file = None
+        self.writer = None
+
+    def write(self, record, error):
+        if self.path is None:
+            return
+        if self.file is None:
+            self.file = open(self.path, 'w', newline='', encoding='utf-8')
+            if self.fmt == 'csv':
+                self.writer = csv.writer(self.file)
+                self.writer.writerow(FIELDS + ('error',))
+        if self.fmt == 'csv':
+            self.writer.writerow([record.get(f, '') for f in FIELDS] + [error])
+        else:
+            self.file.write(json.dumps(dict(record, error=error)) + '\n')
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def _secondary_indexes(conn, table):
+    """(name, sql) of the indexes on `table` that only speed up reads"""
+    return conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' "
+                        "AND tbl_name = ? AND sql IS NOT NULL AND sql NOT LIKE 'CREATE UNIQUE%'",
+                        (table,)).fetchall()
+
+
+def _insert_batch(conn, table, batch):
+    """Insert validated rows into the storage table"""
+    if table == 'customer_records':
+        # Converted here rather than by SQL expressions for every row
+        ids = contact_ids(conn)
+        missing = {row[5] for row in batch} - ids.keys()
+        if missing:
+            ids = contact_ids(conn, missing)
+        conn.executemany(RECORDS_INSERT_SQL, [stored_values(row, ids) for row in batch])
+    else:
+        conn.executemany(insert_sql(conn, with_date=True), batch)
+
+
+def import_records(records, db_path=None, reject_path=None,
+                   reject_format='csv', batch_size=BATCH_SIZE, progress=None):
+    """Validate and insert an iterable of record dicts, returning ImportStats
+
+    The whole import is one transaction: either every valid row is added
+    or, if it fails, none are. Other connections keep reading meanwhile.
+    """
+    stats = ImportStats()
+    started = time.perf_counter()
+    # Same format SQLite uses for CURRENT_TIMESTAMP
+    now = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+    conn = connect(db_path, isolation_level=None)
+    rejects = _RejectWriter(reject_path, reject_format)
+    try:
+        migrate_schema(conn)
+        table = storage_table(conn)
+        has_search_index = ensure_search_index(conn, table)
+        has_stats = ensure_stats(conn, table)
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Index and count the imported rows in one statement each at
+            # the end instead of row by row through the triggers. The
+            # triggers are back before COMMIT, so other connections never
+            # see them missing.
+            last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM customers').fetchone()[0]
+            if has_search_index:
+                drop_search_triggers(conn)
+            if has_stats:
+                drop_stats_triggers(conn)
+            # Building an index from scratch costs less per row than adding
+            # rows to it one at a time, once the import is at least as big
+            # as the table was (the highest id stands in for its size)
+            indexes = None
+
+            records = iter(records)
+            while True:
+                chunk = list(islice(records, batch_size))
+                if not chunk:
+                    break
+                stats.read += len(chunk)
+                batch, rejected = validate_batch(chunk, now)
+                for record, error in rejected:
+                    rejects.write(record, error)
+                stats.rejected += len(rejected)
+                if batch:
+                    if indexes is None and stats.inserted + len(batch) >= last_id:
+                        indexes = _secondary_indexes(conn, table)
+                        for name, _ in indexes:
+                            conn.execute(f'DROP INDEX {name}')
+                    _insert_batch(conn, table, batch)
+                    stats.inserted += len(batch)
+                if progress is not None:
+                    stats.seconds = time.perf_counter() - started
+                    progress(stats)
+
+            for _, sql in indexes or ():
+                conn.execute(sql)
+            if has_search_index:
+                index_customers(conn, last_id)
+                create_search_triggers(conn, table)
+            if has_stats:
+                add_stats(conn, last_id)
+                create_stats_triggers(conn, table)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        rejects.close()
+        conn.close()
+
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+def import_file(path, db_path=None, fmt=None, reject_path=None,
+                batch_size=BATCH_SIZE, progress=None):
+    """Import a CSV or JSONL file ('-' reads standard input)"""
+    fmt = fmt or (detect_format(path) if path != '-' else 'csv')
+    reader = read_jsonl if fmt == 'jsonl' else read_csv
+    if path == '-':
+        return import_records(reader(sys.stdin), db_path, reject_path, fmt,
+                              batch_size, progress)
+    with open(path, newline='', encoding='utf-8') as f:
+        return import_records(reader(f), db_path, reject_path, fmt,
+                              batch_size, progress)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import customers from CSV or JSONL")
+    parser.add_argument('file', help="input file, or - for standard input")
+    parser.add_argument('--db', help="database file (default: $CUSTOMER_DB or customer_data.db)")
+    parser.add_argument('--format', choices=['csv', 'jsonl'],
+                        help="input format (default: from the file extension)")
+    parser.add_argument('--rejects', help="write rejected rows and reasons to this file")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help="rows validated and inserted at a time")
+    parser.add_argument('--quiet', action='store_true', help="don't print progress")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="time every query and write the timings to FILE (.json or .prom)")
+    args = parser.parse_args(argv)
+    if args.metrics:
+        enable_metrics(args.metrics)
+
+    progress = None if args.quiet else lambda s: print(s, file=sys.stderr)
+    try:
+        with timed('import'):
+            stats = import_file(args.file, args.db, args.format, args.rejects,
+                                args.batch_size, progress)
+    except (OSError, sqlite3.Error, ValueError) as e:
+        print(f"Import failed: {e}", file=sys.stderr)
+        return 1
+    print(stats)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
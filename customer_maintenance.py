@@ -0,0 +1,454 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+
+from customer_db import connect, get_db_path
+from customer_schema import (DEDUP_KEYS, PHONE_TEXT_SQL, TIMESTAMP_SQL, US_DATE_SQL,
+                             migration_pending, schema_version)
+from customer_stats import STAT_KEYS
+
+BACKUP_PAGES = 1024      # pages copied per backup step
+BACKUP_PAUSE = 0.005     # seconds between backup steps, to let writers in
+VACUUM_PAGES = 2048      # free pages handed back to the file system per step
+VACUUM_PAUSE = 0.05      # seconds between vacuum steps
+ARCHIVE_BATCH = 2000     # rows moved to an archive per transaction
+ARCHIVE_PAUSE = 0.05     # seconds between archive batches
+
+# SQLite attaches at most 10 databases by default, one of them is kept free
+MAX_ARCHIVES = 9
+
+# The columns of the customers view, which the archives provide as well
+VIEW_COLUMNS = ('id, name, birthday, email, phone, address, preferred_contact, date_added, '
+                'birth_date, phone_number, contact_id, added_at, email_key, phone_key, name_key')
+
+# What an archive stores; the rest is generated like in customer_records.
+# The contact's name is kept as well, so an archive can be read on its own.
+_ARCHIVE_COLUMNS = ('id, name, birth_date, email, phone_number, address, contact_id, '
+                    'preferred_contact, added_at')
+
+# Archived rows are sorted like the live ones, so they get the same indexes
+_ARCHIVE_INDEXES = ('name', 'birth_date', 'email', 'phone_number', 'address',
+                    'contact_id', 'added_at')
+
+_AUTO_VACUUM = {0: 'none', 1: 'full', 2: 'incremental'}
+
+
+# Backups --------------------------------------------------------------------
+
+def backup(dest, db_path=None, pages=BACKUP_PAGES, pause=BACKUP_PAUSE, progress=None):
+    """Copy a database to dest while the apps keep using it
+
+    The copy is made `pages` pages at a time with a pause in between, so a
+    writer never waits for more than one step. A write from another
+    connection makes SQLite restart the copy, which the pauses keep from
+    happening more than needed. The copy is written next to dest and
+    renamed when complete. progress, if given, is called as
+    progress(pages_done, page_count) after every step. Returns the size of
+    the copy in bytes.
+    """
+    partial = dest + '.partial'
+    source = connect(db_path, read_only=True, archives=False)
+    try:
+        target = sqlite3.connect(partial)
+        try:
+            def step(status, remaining, total):
+                if progress is not None:
+                    progress(total - remaining, total)
+                time.sleep(pause)
+
+            # Reading from one snapshot for the whole copy: otherwise, in
+            # WAL mode, every write made elsewhere starts it over
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            source.backup(target, pages=pages, progress=step)
+            source.rollback()
+        finally:
+            target.close()
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    finally:
+        source.close()
+    os.replace(partial, dest)
+    return os.path.getsize(dest)
+
+
+# Compaction -----------------------------------------------------------------
+
+def space(conn):
+    """Page counts of a database: how big it is and how much of it is free"""
+    return {
+        'page_size': conn.execute('PRAGMA page_size').fetchone()[0],
+        'pages': conn.execute('PRAGMA page_count').fetchone()[0],
+        'free_pages': conn.execute('PRAGMA freelist_count').fetchone()[0],
+        'auto_vacuum': _AUTO_VACUUM[conn.execute('PRAGMA auto_vacuum').fetchone()[0]],
+    }
+
+
+def enable_incremental_vacuum(db_path=None):
+    """Switch a database to incremental vacuum, so compact() can run
+
+    This rewrites the whole file once, keeping writers out until it is
+    done, so run it at a quiet time.
+    """
+    conn = connect(db_path, archives=False)
+    try:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+
+
+def compact(db_path=None, pages=VACUUM_PAGES, pause=VACUUM_PAUSE, progress=None):
+    """Hand a database's free pages back to the file system, a step at a time
+
+    Each step is its own short transaction, so the apps can write in
+    between. Needs incremental vacuum (see enable_incremental_vacuum).
+    progress, if given, is called as progress(pages_freed, free_pages)
+    after every step. Returns the number of pages freed.
+    """
+    conn = connect(db_path, archives=False)
+    try:
+        if space(conn)['auto_vacuum'] != 'incremental':
+            raise ValueError("The database doesn't use incremental vacuum; "
+                             "enable it first (compact --enable)")
+        total = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        freed = 0
+        while True:
+            free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if not free:
+                break
+            # The pragma frees a page per step, and execute() only takes
+            # one step of a statement without result columns
+            conn.executescript(f'PRAGMA incremental_vacuum({min(pages, free)});')
+            freed += free - conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if progress is not None:
+                progress(freed, total)
+            time.sleep(pause)
+        # In WAL mode the file only shrinks once the freed pages are checkpointed
+        conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchall()
+        return freed
+    finally:
+        conn.close()
+
+
+def vacuum_into(dest, db_path=None):
+    """Write a compacted copy of a database to dest, which must not exist
+
+    The copy is read from one snapshot, so the apps can keep writing.
+    Returns the size of the copy in bytes.
+    """
+    conn = connect(db_path, read_only=True, archives=False)
+    try:
+        conn.execute('VACUUM INTO ?', (dest,))
+    finally:
+        conn.close()
+    return os.path.getsize(dest)
+
+
+# Archives -------------------------------------------------------------------
+
+def _cutoff(before):
+    """Seconds since the epoch (UTC, like added_at) of a date or datetime"""
+    if isinstance(before, str):
+        before = datetime.fromisoformat(before)
+    return int(before.replace(tzinfo=before.tzinfo or timezone.utc).timestamp())
+
+
+def _db_dir(db_path):
+    return os.path.dirname(os.path.abspath(db_path or get_db_path()))
+
+
+def _create_archive(conn, schema):
+    generated = {
+        'birthday': US_DATE_SQL.format('birth_date'),
+        'phone': PHONE_TEXT_SQL.format('phone_number'),
+        'date_added': TIMESTAMP_SQL.format('added_at'),
+        **DEDUP_KEYS,
+    }
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.customer_archive (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            birth_date TEXT NOT NULL,
+            email TEXT NOT NULL,
+            phone_number INTEGER NOT NULL,
+            address TEXT NOT NULL,
+            contact_id INTEGER NOT NULL,
+            preferred_contact TEXT,
+            added_at INTEGER,
+            {', '.join(f'{column} TEXT GENERATED ALWAYS AS ({expression}) VIRTUAL'
+                       for column, expression in generated.items())}
+        )
+    ''')
+    for column in _ARCHIVE_INDEXES:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {schema}.idx_customer_archive_{column} '
+                     f'ON customer_archive ({column})')
+
+
+def _stat_counts(schema):
+    """SELECT of (kind, key, count) for the summary, counted from an archive"""
+    return ' UNION ALL '.join(
+        f"SELECT '{kind}' AS kind, coalesce({expression.format('customer_archive')}, '') AS key, "
+        f"COUNT(*) AS count FROM {schema}.customer_archive GROUP BY 2"
+        for kind, expression in STAT_KEYS.items())
+
+
+def _count_archive(conn, schema):
+    """Recount an archive's summary counts, kept in the archive itself
+    because its rows don't change once moved"""
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.customer_stats (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (kind, key)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute(f'DELETE FROM {schema}.customer_stats')
+    conn.execute(f'INSERT INTO {schema}.customer_stats (kind, key, count) '
+                 f'{_stat_counts(schema)}')
+
+
+def _has_table(conn, schema, name):
+    return conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE name = ?",
+                        (name,)).fetchone() is not None
+
+
+def _location(path, read_only):
+    """What to ATTACH: a read-only connection only opens URIs"""
+    if not read_only:
+        return path
+    # urllib.request takes longer to import than the rest of this module
+    from urllib.request import pathname2url
+    return f'file:{pathname2url(path)}?mode=ro'
+
+
+def archive_paths(conn, db_path=None):
+    """The archive files of a database, as absolute paths"""
+    if not conn.execute("SELECT 1 FROM main.sqlite_master "
+                        "WHERE name = 'customer_archives'").fetchone():
+        return []
+    directory = _db_dir(db_path)
+    return [os.path.join(directory, path)
+            for path, in conn.execute('SELECT path FROM customer_archives ORDER BY path')]
+
+
+def attach_archives(conn, db_path=None, read_only=False):
+    """Let a connection read archived customers as if they were never moved
+
+    Attaches every archive file of the database and puts a temporary
+    customers view in front of the real one, with the live and archived
+    rows together. Queries that name customers then read both; writes
+    have to go to customer_records. The summary counts get the same
+    treatment. Returns the archive paths.
+    """
+    paths = archive_paths(conn, db_path)
+    if not paths:
+        return paths
+    selects = [f'SELECT {VIEW_COLUMNS} FROM main.customers']
+    for number, path in enumerate(paths):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Archive file not found: {path}")
+        conn.execute(f'ATTACH DATABASE ? AS archive{number}', (_location(path, read_only),))
+        selects.append(f'SELECT {VIEW_COLUMNS} FROM archive{number}.customer_archive')
+    conn.execute(f"CREATE TEMP VIEW customers AS {' UNION ALL '.join(selects)}")
+
+    if _has_table(conn, 'main', 'customer_stats'):
+        counts = ['SELECT kind, key, count FROM main.customer_stats']
+        for number in range(len(paths)):
+            schema = f'archive{number}'
+            # Archives from before the counts were kept are counted here
+            counts.append(f'SELECT kind, key, count FROM {schema}.customer_stats'
+                          if _has_table(conn, schema, 'customer_stats')
+                          else _stat_counts(schema))
+        conn.execute(f"CREATE TEMP VIEW customer_stats AS SELECT kind, key, SUM(count) AS count "
+                     f"FROM ({' UNION ALL '.join(counts)}) GROUP BY kind, key")
+    return paths
+
+
+def archive_customers(before, archive_path, db_path=None, batch_size=ARCHIVE_BATCH,
+                      pause=ARCHIVE_PAUSE, progress=None):
+    """Move customers added before a date into an archive file
+
+    Rows move `batch_size` at a time, each batch in one transaction over
+    both files, with a pause in between for the apps' own writes. Deleted
+    rows reach running viewers through the change log like any other
+    delete. The archive is created if needed and remembered in the
+    database, so readers that include archives (see attach_archives) find
+    it. progress, if given, is called as progress(rows_moved) after every
+    batch. Returns the number of rows moved.
+    """
+    cutoff = _cutoff(before)
+    conn = connect(db_path, archives=False)
+    try:
+        if schema_version(conn) < 2 or migration_pending(conn):
+            raise ValueError("Archiving needs schema version 2; run customer_migrate first")
+        directory = _db_dir(db_path)
+        path = os.path.abspath(archive_path)
+        known = archive_paths(conn, db_path)
+        if path not in known and len(known) >= MAX_ARCHIVES:
+            raise ValueError(f"A database can have at most {MAX_ARCHIVES} archive files")
+
+        conn.execute('ATTACH DATABASE ? AS archive', (path,))
+        conn.execute('PRAGMA archive.journal_mode = WAL')
+        with conn:
+            _create_archive(conn, 'archive')
+            conn.execute('CREATE TABLE IF NOT EXISTS customer_archives '
+                         '(path TEXT PRIMARY KEY, before INTEGER NOT NULL)')
+            # Stored relative to the database, so the files can be moved together
+            conn.execute('INSERT INTO customer_archives (path, before) VALUES (?, ?) '
+                         'ON CONFLICT (path) DO UPDATE SET before = max(before, excluded.before)',
+                         (os.path.relpath(path, directory), cutoff))
+
+        # In WAL mode a transaction over two files isn't atomic across
+        # both, so a crash can leave a batch in both; drop those copies first
+        with conn:
+            conn.execute('DELETE FROM customer_records WHERE added_at < ? '
+                         'AND id IN (SELECT id FROM archive.customer_archive)', (cutoff,))
+
+        moved = 0
+        while True:
+            ids = [customer_id for customer_id, in conn.execute(
+                'SELECT id FROM customer_records WHERE added_at < ? ORDER BY added_at LIMIT ?',
+                (cutoff, batch_size))]
+            if not ids:
+                break
+            batch = json.dumps(ids)
+            with conn:
+                conn.execute(f'''
+                    INSERT OR REPLACE INTO archive.customer_archive ({_ARCHIVE_COLUMNS})
+                    SELECT {_ARCHIVE_COLUMNS} FROM main.customers
+                    WHERE id IN (SELECT value FROM json_each(?))
+                ''', (batch,))
+                conn.execute('DELETE FROM customer_records '
+                             'WHERE id IN (SELECT value FROM json_each(?))', (batch,))
+            moved += len(ids)
+            if progress is not None:
+                progress(moved)
+            time.sleep(pause)
+        with conn:
+            _count_archive(conn, 'archive')
+        return moved
+    finally:
+        conn.close()
+
+
+def archive_stats(db_path=None):
+    """(path, rows, newest date_added) of each archive file of a database"""
+    conn = connect(db_path, read_only=True, archives=False)
+    try:
+        stats = []
+        for number, path in enumerate(archive_paths(conn, db_path)):
+            if not os.path.exists(path):
+                stats.append((path, None, None))
+                continue
+            conn.execute(f'ATTACH DATABASE ? AS archive{number}', (_location(path, True),))
+            stats.append((path,) + conn.execute(
+                f'SELECT COUNT(*), datetime(MAX(added_at), \'unixepoch\') '
+                f'FROM archive{number}.customer_archive').fetchone())
+        return stats
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Back up, compact and archive a customer database while it is in use")
+    parser.add_argument('--db', help="database file (default: $CUSTOMER_DB or customer_data.db)")
+    commands = parser.add_subparsers(dest='command', metavar='command', required=True)
+
+    backup_parser = commands.add_parser('backup', help="copy the database to a file")
+    backup_parser.add_argument('dest', help="backup file")
+    backup_parser.add_argument('--pages', type=int, default=BACKUP_PAGES,
+                               help=f"pages copied per step (default: {BACKUP_PAGES})")
+    backup_parser.add_argument('--pause', type=float, default=BACKUP_PAUSE,
+                               help=f"seconds between steps (default: {BACKUP_PAUSE})")
+    backup_parser.add_argument('--quiet', action='store_true', help="don't print progress")
+
+    compact_parser = commands.add_parser('compact', help="give free space back to the file system")
+    compact_parser.add_argument('--enable', action='store_true',
+                                help="switch to incremental vacuum first (rewrites the file once)")
+    compact_parser.add_argument('--into', metavar='DEST',
+                                help="write a compacted copy to DEST instead")
+    compact_parser.add_argument('--pages', type=int, default=VACUUM_PAGES,
+                                help=f"pages freed per step (default: {VACUUM_PAGES})")
+    compact_parser.add_argument('--pause', type=float, default=VACUUM_PAUSE,
+                                help=f"seconds between steps (default: {VACUUM_PAUSE})")
+    compact_parser.add_argument('--quiet', action='store_true', help="don't print progress")
+
+    archive_parser = commands.add_parser('archive',
+                                         help="move old customers into an archive file")
+    archive_parser.add_argument('archive', help="archive file (created if needed)")
+    archive_parser.add_argument('--before', required=True,
+                                help="move customers added before this date (YYYY-MM-DD)")
+    archive_parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH,
+                                help=f"rows per transaction (default: {ARCHIVE_BATCH})")
+    archive_parser.add_argument('--pause', type=float, default=ARCHIVE_PAUSE,
+                                help=f"seconds between batches (default: {ARCHIVE_PAUSE})")
+    archive_parser.add_argument('--quiet', action='store_true', help="don't print progress")
+
+    commands.add_parser('space', help="print the file size, free space and archives")
+    args = parser.parse_args(argv)
+
+    reported = False
+
+    def report(message):
+        nonlocal reported
+        if not getattr(args, 'quiet', True):
+            print(f"\r{message}", end='', file=sys.stderr, flush=True)
+            reported = True
+
+    def end_report():
+        if reported:
+            print(file=sys.stderr)
+
+    try:
+        if args.command == 'backup':
+            size = backup(args.dest, args.db, args.pages, args.pause,
+                          lambda done, total: report(f"Copied {done} of {total} pages"))
+            end_report()
+            print(f"Backed up {size} bytes to '{args.dest}'")
+        elif args.command == 'compact' and args.into:
+            size = vacuum_into(args.into, args.db)
+            print(f"Wrote a compacted copy of {size} bytes to '{args.into}'")
+        elif args.command == 'compact':
+            if args.enable:
+                enable_incremental_vacuum(args.db)
+            freed = compact(args.db, args.pages, args.pause,
+                            lambda done, total: report(f"Freed {done} of {total} pages"))
+            end_report()
+            print(f"Freed {freed} pages")
+        elif args.command == 'archive':
+            moved = archive_customers(args.before, args.archive, args.db, args.batch_size,
+                                      args.pause, lambda done: report(f"Moved {done} customers"))
+            end_report()
+            print(f"Moved {moved} customers to '{args.archive}'")
+        else:
+            conn = connect(args.db, read_only=True, archives=False)
+            try:
+                sizes = space(conn)
+            finally:
+                conn.close()
+            print(f"File size:   {sizes['pages'] * sizes['page_size']} bytes")
+            print(f"Free space:  {sizes['free_pages'] * sizes['page_size']} bytes")
+            print(f"Auto vacuum: {sizes['auto_vacuum']}")
+            for path, rows, newest in archive_stats(args.db):
+                if rows is None:
+                    print(f"Archive:     {path} (missing)")
+                else:
+                    print(f"Archive:     {path} ({rows} customers, newest added {newest})")
+    except (OSError, sqlite3.Error, ValueError) as e:
+        end_report()
+        print(f"{args.command.capitalize()} failed: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,19 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
+import os
+import queue
 import sqlite3
-import re
-from datetime import datetime
+from customer_db import CustomerRepository
+from customer_dedup import check_customer
+from customer_metrics import timed
+from customer_writer import UNSAVED_FILE, BatchWriter, WriteQueueFull, save_unsaved
+from customer_validation import CONTACT_METHODS, validate_customer
 
 class CustomerManagementSystem:
-    def __init__(self, root):
+    def __init__(self, root, db_path=None):
         self.root = root
+        self.db_path = db_path
+        self.status_after = None
         self.root.title("Customer Information Management System")
         self.root.geometry("500x600")
         self.root.resizable(False, False)
@@ -14,27 +21,23 @@ class CustomerManagementSystem:
         # Initialize database
         self.init_database()
         
+        # Saves happen on a background writer; results come back through a queue
+        self.writer = BatchWriter(repo=self.repo)
+        self.save_results = queue.Queue()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
         # Create GUI
         self.create_gui()
+        self.root.after(100, self.poll_saves)
     
     def init_database(self):
         """Initialize SQLite database and create table if it doesn't exist"""
-        self.conn = sqlite3.connect('customer_data.db')
-        self.cursor = self.conn.cursor()
-        
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS customers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                birthday TEXT NOT NULL,
-                email TEXT NOT NULL,
-                phone TEXT NOT NULL,
-                address TEXT NOT NULL,
-                preferred_contact TEXT NOT NULL,
-                date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        self.conn.commit()
+        self.repo = CustomerRepository(self.db_path)
+        
+        # Also creates the full-text search index kept in sync by triggers
+        self.repo.init_schema()
+        # A large database from an older version is converted in the background
+        self.repo.start_migration()
     
     def create_gui(self):
         """Create the graphical user interface"""
@@ -90,7 +93,7 @@ class CustomerManagementSystem:
             row=6, column=0, sticky=tk.W, pady=5)
         self.contact_var = tk.StringVar()
         self.contact_dropdown = ttk.Combobox(main_frame, textvariable=self.contact_var,
-                                            values=["Email", "Phone", "Mail"],
+                                            values=list(CONTACT_METHODS),
                                             state="readonly", width=32)
         self.contact_dropdown.grid(row=6, column=1, pady=5, padx=(10, 0))
         self.contact_dropdown.set("Email")  # Default value
@@ -108,26 +111,6 @@ class CustomerManagementSystem:
         self.status_label = ttk.Label(main_frame, text="", font=('Arial', 9))
         self.status_label.grid(row=9, column=0, columnspan=2)
     
-    def validate_email(self, email):
-        """Validate email format"""
-        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        return re.match(pattern, email) is not None
-    
-    def validate_date(self, date_str):
-        """Validate date format (MM/DD/YYYY)"""
-        try:
-            datetime.strptime(date_str, '%m/%d/%Y')
-            return True
-        except ValueError:
-            return False
-    
-    def validate_phone(self, phone):
-        """Validate phone format (accepts various formats)"""
-        # Remove common separators
-        cleaned = re.sub(r'[\s\-\(\)\.]', '', phone)
-        # Check if it's 10 digits
-        return len(cleaned) == 10 and cleaned.isdigit()
-    
     def clear_form(self):
         """Clear all form fields"""
         self.name_entry.delete(0, tk.END)
@@ -137,6 +120,7 @@ class CustomerManagementSystem:
         self.address_text.delete('1.0', tk.END)
         self.contact_dropdown.set("Email")
     
+    @timed('submit')
     def submit_data(self):
         """Validate and submit customer data to database"""
         # Get all values
@@ -148,52 +132,78 @@ class CustomerManagementSystem:
         preferred_contact = self.contact_var.get()
         
         # Validation
-        if not all([name, birthday, email, phone, address, preferred_contact]):
-            messagebox.showerror("Error", "All fields are required!")
-            return
-        
-        if not self.validate_date(birthday):
-            messagebox.showerror("Error", "Invalid birthday format. Use MM/DD/YYYY")
-            return
-        
-        if not self.validate_email(email):
-            messagebox.showerror("Error", "Invalid email format!")
+        error = validate_customer(name, birthday, email, phone, address, preferred_contact)
+        if error:
+            messagebox.showerror("Error", error)
             return
         
-        if not self.validate_phone(phone):
-            messagebox.showerror("Error", "Invalid phone number. Use 10 digits (e.g., xxx-xxx-xxxx)")
+        # Warn about a likely duplicate before saving (indexed lookups only)
+        try:
+            matches = check_customer(name, birthday, email, phone, address, self.repo.db_path)
+        except sqlite3.Error:
+            matches = []
+        if matches:
+            existing = matches[0][1]
+            if not messagebox.askyesno(
+                    "Possible Duplicate",
+                    f"This looks like an existing customer:\n\n"
+                    f"ID {existing[0]}: {existing[1]}\n{existing[3]}\n{existing[4]}\n\n"
+                    f"Save anyway?"):
+                return
+        
+        # Queue the insert; the form is ready for the next customer right away
+        row = (name, birthday, email, phone, address, preferred_contact)
+        try:
+            self.writer.submit(row, lambda customer_id, error, name=name:
+                               self.save_results.put((name, customer_id, error)))
+        except WriteQueueFull as e:
+            messagebox.showerror("Database Busy", f"{str(e)}. Please try again in a moment.")
             return
         
-        # Insert into database
-        try:
-            self.cursor.execute('''
-                INSERT INTO customers (name, birthday, email, phone, address, preferred_contact)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (name, birthday, email, phone, address, preferred_contact))
-            
-            self.conn.commit()
-            
-            # Show success message
-            messagebox.showinfo("Success", "Customer information saved successfully!")
-            
-            # Clear the form
-            self.clear_form()
-            
+        # Clear the form
+        self.clear_form()
+        self.status_label.config(text="Saving...", foreground='gray')
+    
+    def poll_saves(self):
+        """Report committed (or failed) saves from the writer thread"""
+        while True:
+            try:
+                name, customer_id, error = self.save_results.get_nowait()
+            except queue.Empty:
+                break
+            if error is not None:
+                messagebox.showerror("Database Error",
+                                     f"Error saving data for {name}: {str(error)}")
+                self.status_label.config(text="")
+                continue
             # Update status
-            self.status_label.config(text="✓ Data submitted successfully", foreground='green')
-            self.root.after(3000, lambda: self.status_label.config(text=""))
-            
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"Error saving data: {str(e)}")
+            self.status_label.config(text=f"✓ {name} saved (ID: {customer_id})", foreground='green')
+            if self.status_after is not None:
+                self.root.after_cancel(self.status_after)
+            self.status_after = self.root.after(3000, lambda: self.status_label.config(text=""))
+        self.root.after(100, self.poll_saves)
     
-    def __del__(self):
-        """Close database connection when object is destroyed"""
-        if hasattr(self, 'conn'):
-            self.conn.close()
+    def on_close(self):
+        """Commit any queued customers before the window closes"""
+        self.status_label.config(text="Saving...", foreground='gray')
+        self.root.update_idletasks()
+        unsaved = self.writer.close()
+        if unsaved:
+            # The form was cleared on submit, so keep the rows somewhere
+            path = os.path.join(os.path.dirname(os.path.abspath(self.repo.db_path)),
+                                UNSAVED_FILE)
+            try:
+                save_unsaved(unsaved, path)
+                detail = f"They were written to {path} and can be added with customer_import."
+            except OSError as e:
+                detail = f"They couldn't be written to {path} either: {e}"
+            messagebox.showwarning("Unsaved Customers",
+                                   f"{len(unsaved)} customer(s) could not be saved. {detail}")
+        self.root.destroy()
 
-def main():
+def main(db_path=None):
     root = tk.Tk()
-    app = CustomerManagementSystem(root)
+    app = CustomerManagementSystem(root, db_path=db_path)
     root.mainloop()
 
 if __name__ == "__main__":
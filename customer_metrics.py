@@ -0,0 +1,319 @@
+import atexit
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in milliseconds; one more bucket catches the rest
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+SLOW_QUERY_MS = 100     # queries slower than this are logged with their plan
+MAX_QUERIES = 1000      # distinct statements tracked before lumping into "other"
+KEEP_SLOW = 100         # recent slow queries kept for the JSON dump
+
+logger = logging.getLogger('customer_metrics')
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_PLACEHOLDER_LIST_RE = re.compile(r'\?(?:\s*,\s*\?)+')
+_EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+_enabled = False
+_slow_seconds = SLOW_QUERY_MS / 1000
+_dump_paths = set()
+
+
+def normalize_sql(sql):
+    """One line per statement, with IN (?, ?, ...) lists of any length merged"""
+    sql = _WHITESPACE_RE.sub(' ', sql).strip()
+    return _PLACEHOLDER_LIST_RE.sub('?, ...', sql)
+
+
+class Histogram:
+    """Count, sum, max and bucketed counts of durations"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.buckets[bisect_left(BUCKETS_MS, seconds * 1000)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total_ms': self.total * 1000,
+            'mean_ms': self.total * 1000 / self.count if self.count else 0.0,
+            'max_ms': self.max * 1000,
+            'buckets_ms': dict(zip([str(b) for b in BUCKETS_MS] + ['inf'], self.buckets)),
+        }
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """Thread-safe registry of query and operation timings"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.queries = {}
+            self.operations = {}
+            self.counters = Counter()
+            self.slow = deque(maxlen=KEEP_SLOW)
+            self.last_operation = None
+
+    def record_query(self, sql, seconds):
+        key = normalize_sql(sql)
+        with self._lock:
+            histogram = self.queries.get(key)
+            if histogram is None:
+                if len(self.queries) >= MAX_QUERIES:
+                    key = 'other'
+                histogram = self.queries.setdefault(key, Histogram())
+            histogram.observe(seconds)
+            self.counters['queries'] += 1
+
+    def record_operation(self, name, seconds):
+        with self._lock:
+            self.operations.setdefault(name, Histogram()).observe(seconds)
+            self.last_operation = (name, seconds)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def record_slow(self, sql, seconds, plan):
+        with self._lock:
+            self.counters['slow_queries'] += 1
+            self.slow.append({'sql': normalize_sql(sql), 'ms': seconds * 1000,
+                              'plan': plan, 'at': time.time()})
+
+    def snapshot(self):
+        """Everything recorded so far as plain dicts"""
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'operations': {k: h.as_dict() for k, h in self.operations.items()},
+                'queries': {k: h.as_dict() for k, h in self.queries.items()},
+                'slow_queries': list(self.slow),
+            }
+
+    def status_line(self):
+        """Short summary for a status bar"""
+        with self._lock:
+            text = (f"{self.counters['queries']} queries, "
+                    f"{self.counters['slow_queries']} slow")
+            if self.last_operation is not None:
+                name, seconds = self.last_operation
+                text += f", last {name} {seconds * 1000:.0f} ms"
+            return text
+
+    def to_prometheus(self):
+        """The metrics in Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for metric, label, histograms, help_text in (
+                    ('customer_operation_seconds', 'operation', self.operations,
+                     "Time spent in user-facing operations"),
+                    ('customer_query_seconds', 'sql', self.queries,
+                     "Time spent executing and fetching SQL statements")):
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} histogram")
+                for key, histogram in histograms.items():
+                    labels = f'{label}="{_escape_label(key)}"'
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS_MS, histogram.buckets):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound / 1000}"}} '
+                                     f'{cumulative}')
+                    lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                    lines.append(f'{metric}_sum{{{labels}}} {histogram.total}')
+                    lines.append(f'{metric}_count{{{labels}}} {histogram.count}')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE customer_{name}_total counter")
+                lines.append(f"customer_{name}_total {value}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Save as Prometheus text (.prom/.txt) or JSON (anything else)"""
+        with open(path, 'w', encoding='utf-8') as f:
+            if path.lower().endswith(('.prom', '.txt')):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.snapshot(), f, indent=2)
+
+
+metrics = Metrics()
+
+
+def is_enabled():
+    return _enabled
+
+
+def enable(output=None, slow_ms=None, log_path=None):
+    """Turn instrumentation on for connections opened from now on
+
+    output is written with Metrics.write when the program exits. Slow
+    queries go to the customer_metrics logger, and to log_path if given.
+    """
+    global _enabled, _slow_seconds
+    _enabled = True
+    if slow_ms is not None:
+        _slow_seconds = slow_ms / 1000
+    if log_path:
+        handler = logging.FileHandler(log_path, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        logger.addHandler(handler)
+    if output and output not in _dump_paths:
+        _dump_paths.add(output)
+        atexit.register(metrics.write, output)
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def record_operation(name, seconds):
+    """Record a UI operation timed by the caller (no-op when disabled)"""
+    if _enabled:
+        metrics.record_operation(name, seconds)
+
+
+def status_line():
+    return metrics.status_line()
+
+
+@contextmanager
+def timed(name):
+    """Time a block or, as a decorator, a function as operation `name`"""
+    if not _enabled:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.record_operation(name, time.perf_counter() - started)
+
+
+def explain(conn, sql, parameters=()):
+    """EXPLAIN QUERY PLAN lines for a statement, or None if it has no plan"""
+    if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return None
+    try:
+        rows = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql,
+                                          parameters).fetchall()
+    except (sqlite3.Error, ValueError):
+        return None
+    return [row[-1] for row in rows]
+
+
+def _finished(cursor, sql, parameters, seconds, step):
+    metrics.record_query(sql, seconds)
+    if seconds >= _slow_seconds:
+        # executemany has no single parameter set to plan with
+        plan = explain(cursor.connection, sql, parameters) if step != 'executemany' else None
+        metrics.record_slow(sql, seconds, plan)
+        logger.warning("Slow query (%s, %.0f ms): %s%s", step, seconds * 1000,
+                       normalize_sql(sql),
+                       ''.join(f"\n    {line}" for line in plan or ()))
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Times execute() and the fetch calls that follow it"""
+
+    _sql = ''
+    _parameters = ()
+
+    def execute(self, sql, parameters=()):
+        self._sql, self._parameters = sql, parameters
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        except sqlite3.Error:
+            metrics.increment('query_errors')
+            raise
+        finally:
+            _finished(self, sql, parameters, time.perf_counter() - started, 'execute')
+
+    def executemany(self, sql, seq_of_parameters):
+        self._sql, self._parameters = sql, ()
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        except sqlite3.Error:
+            metrics.increment('query_errors')
+            raise
+        finally:
+            _finished(self, sql, (), time.perf_counter() - started, 'executemany')
+
+    def _timed_fetch(self, step, fetch, *args):
+        started = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            _finished(self, self._sql, self._parameters,
+                      time.perf_counter() - started, step)
+
+    def fetchone(self):
+        return self._timed_fetch('fetchone', super().fetchone)
+
+    def fetchmany(self, size=None):
+        fetch = super().fetchmany
+        if size is None:
+            return self._timed_fetch('fetchmany', fetch)
+        return self._timed_fetch('fetchmany', fetch, size)
+
+    def fetchall(self):
+        return self._timed_fetch('fetchall', super().fetchall)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose statements and commits are all timed"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            metrics.record_query('COMMIT', time.perf_counter() - started)
+
+
+def _enable_from_environment():
+    """CUSTOMER_METRICS=1, or a .json/.prom file to write on exit"""
+    setting = os.environ.get('CUSTOMER_METRICS', '')
+    if not setting or setting == '0':
+        return
+    slow_ms = os.environ.get('CUSTOMER_SLOW_MS')
+    enable(output=None if setting == '1' else setting,
+           slow_ms=float(slow_ms) if slow_ms else None,
+           log_path=os.environ.get('CUSTOMER_SLOW_LOG'))
+
+
+_enable_from_environment()
@@ -0,0 +1,51 @@
+import argparse
+import sqlite3
+import sys
+
+from customer_db import CustomerRepository
+from customer_schema import BATCH_SIZE, SCHEMA_VERSION, schema_version
+
+
+def migrate(db_path=None, batch_size=BATCH_SIZE, pause=0, progress=None):
+    """Upgrade a database to SCHEMA_VERSION and finish copying its rows
+
+    The apps can keep using the database meanwhile. Returns the schema
+    version.
+    """
+    repo = CustomerRepository(db_path)
+    repo.upgrade_schema()
+    repo.migrate(batch_size, pause, progress)
+    with repo.pool.connection() as conn:
+        return schema_version(conn)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=f"Upgrade a customer database to schema version {SCHEMA_VERSION}")
+    parser.add_argument('--db', help="database file (default: $CUSTOMER_DB or customer_data.db)")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help=f"rows per transaction (default: {BATCH_SIZE})")
+    parser.add_argument('--pause', type=float, default=0,
+                        help="seconds to wait between batches, to leave room for other writers")
+    parser.add_argument('--quiet', action='store_true', help="don't print progress")
+    args = parser.parse_args(argv)
+
+    def progress(phase, rows, position, last_id):
+        verb = 'Copied' if phase == 'copy' else 'Cleaned up'
+        print(f"\r{verb} rows up to id {position} of {last_id}", end='',
+              file=sys.stderr, flush=True)
+
+    try:
+        version = migrate(args.db, args.batch_size, args.pause,
+                          None if args.quiet else progress)
+    except (OSError, sqlite3.Error) as e:
+        print(f"\nMigration failed: {e}", file=sys.stderr)
+        return 1
+    if not args.quiet:
+        print(file=sys.stderr)
+    print(f"Database is at schema version {version}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+from customer_db import COLUMNS, get_pool, order_expression
+
+PAGE_SIZE = 200      # rows fetched per query
+MAX_CACHED = 1000    # rows kept in memory around the current position
+
+
+class CustomerPager:
+    """Fetch windows of customer rows on demand using keyset pagination"""
+
+    def __init__(self, db_path=None, page_size=PAGE_SIZE,
+                 max_cached=MAX_CACHED, conn=None):
+        self.page_size = page_size
+        self.max_cached = max(max_cached, page_size * 2)
+        # Queries borrow from the shared pool unless given a connection
+        self.conn = conn
+        self.pool = get_pool(db_path) if conn is None else None
+        self.where = ''
+        self.params = ()
+        self.order_column = 'id'
+        self.order_expression = 'id'
+        self.descending = True
+        self.reset()
+
+    def reset(self):
+        """Drop cached rows and the cached row count"""
+        self._rows = []
+        self._start = 0
+        self._count = None
+        self.count_estimated = False
+
+    def set_filter(self, where='', params=()):
+        """Restrict the rows to a SQL condition (without the WHERE keyword)"""
+        self.where = where
+        self.params = tuple(params)
+        self.reset()
+
+    def set_order(self, column='id', descending=True):
+        """Order rows by a column, with id as the tie breaker"""
+        if self.conn is not None:
+            self.order_expression = order_expression(column, self.conn)
+        else:
+            with self.pool.connection() as conn:
+                self.order_expression = order_expression(column, conn)
+        self.order_column = column
+        self.descending = descending
+        self.reset()
+
+    def invalidate(self, count_delta=None):
+        """Drop cached rows after a change, adjusting the count if the change is known"""
+        count, estimated = self._count, self.count_estimated
+        self.reset()
+        if count is not None and count_delta is not None:
+            self.set_count(count + count_delta, estimated)
+
+    def set_count(self, count, estimated=False):
+        """Use a row count computed elsewhere instead of running COUNT(*)"""
+        self._count = count
+        self.count_estimated = estimated
+
+    def estimate_count(self):
+        """Take the id range as the row count until the exact one is set
+
+        MIN and MAX of the primary key are single index lookups, where
+        COUNT(*) reads the whole index. Deleted ids make the estimate high.
+        Only meant for the unfiltered table.
+        """
+        # Separate subqueries: SQLite only optimizes a lone MIN or MAX
+        low, high = self._query('SELECT (SELECT MIN(id) FROM customers), '
+                                '(SELECT MAX(id) FROM customers)', ())[0]
+        self.set_count(0 if low is None else high - low + 1, estimated=True)
+
+    def prime(self, count, rows):
+        """Seed the cache with a count and first rows computed elsewhere"""
+        self.set_count(count)
+        self._rows = list(rows)
+        self._start = 0
+
+    def count(self):
+        """Return the number of rows matching the current filter"""
+        if self._count is None:
+            sql = 'SELECT COUNT(*) FROM customers'
+            if self.where:
+                sql += f' WHERE {self.where}'
+            self._count = self._query(sql, self.params)[0][0]
+        return self._count
+
+    def rows_at(self, start, count):
+        """Return up to `count` rows beginning at position `start`"""
+        start = max(0, start)
+        end = start + count
+        cache_end = self._start + len(self._rows)
+
+        if self._rows and self._start <= start and end <= cache_end:
+            pass
+        elif self._rows and self._start <= start <= cache_end + self.page_size:
+            # Scrolling forwards: continue after the last cached row
+            while cache_end < end:
+                page = self._fetch_after(self._rows[-1])
+                if not page:
+                    break
+                self._rows.extend(page)
+                cache_end += len(page)
+            self._trim(start, end)
+        elif (self._rows and self._start - self.page_size <= start < self._start
+              and end <= cache_end):
+            # Scrolling backwards: continue before the first cached row
+            while self._start > start:
+                page = self._fetch_before(self._rows[0])
+                if not page:
+                    break
+                self._rows[:0] = page
+                self._start -= len(page)
+            self._trim(start, end)
+        else:
+            # Jump: position by offset once, then keyset from there on
+            fetch = max(count, self.page_size)
+            self._start = start
+            self._rows = self._fetch_offset(start, fetch)
+
+        first = start - self._start
+        return self._rows[first:first + count]
+
+    def _order_by(self, descending):
+        direction = 'DESC' if descending else 'ASC'
+        if self.order_column == 'id':
+            return f'id {direction}'
+        return f'{self.order_expression} {direction}, id {direction}'
+
+    def _key(self, row):
+        if self.order_column == 'id':
+            return (row[0],)
+        return (row[0], row[0])
+
+    def _key_condition(self, op):
+        if self.order_column == 'id':
+            return f'id {op} ?'
+        # Read the anchor row's sort value back from the table so derived
+        # sort columns (e.g. birth_date) compare exactly as SQL orders them
+        return (f'({self.order_expression}, id) {op} '
+                f'((SELECT {self.order_expression} FROM customers WHERE id = ?), ?)')
+
+    def _select(self, conditions, params, descending, limit, offset=0):
+        sql = f"SELECT {', '.join(COLUMNS)} FROM customers"
+        where = [f'({self.where})'] if self.where else []
+        where.extend(conditions)
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += f' ORDER BY {self._order_by(descending)} LIMIT ? OFFSET ?'
+        return self._query(sql, self.params + tuple(params) + (limit, offset))
+
+    def _query(self, sql, params):
+        if self.conn is not None:
+            return self.conn.execute(sql, params).fetchall()
+        with self.pool.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def _fetch_offset(self, offset, limit):
+        return self._select([], (), self.descending, limit, offset)
+
+    def _fetch_after(self, row):
+        op = '<' if self.descending else '>'
+        return self._select([self._key_condition(op)], self._key(row),
+                            self.descending, self.page_size)
+
+    def _fetch_before(self, row):
+        op = '>' if self.descending else '<'
+        page = self._select([self._key_condition(op)], self._key(row),
+                            not self.descending, self.page_size)
+        page.reverse()
+        return page
+
+    def _trim(self, start, end):
+        """Keep the cache bounded, dropping rows outside [start, end)"""
+        extra = len(self._rows) - self.max_cached
+        before = min(extra, start - self._start)
+        if before > 0:
+            del self._rows[:before]
+            self._start += before
+            extra -= before
+        after = min(extra, self._start + len(self._rows) - end)
+        if after > 0:
+            del self._rows[-after:]
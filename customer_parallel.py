@@ -0,0 +1,204 @@
+import heapq
+import os
+from collections import Counter
+
+from customer_db import COLUMNS, connect, get_db_path, order_expression
+from customer_search import search_filter
+
+CHUNK_ROWS = 250000          # ids per worker task
+MIN_PARALLEL_ROWS = 1000000  # below this one query beats starting workers
+MAX_AHEAD = 2                # tasks queued per worker while results stream out
+
+_executor = None
+_executor_workers = None
+
+# Each worker process keeps one read-only connection per database file
+_worker_conns = {}
+
+
+def _worker_conn(db_path):
+    conn = _worker_conns.get(db_path)
+    if conn is None:
+        conn = _worker_conns[db_path] = connect(db_path, read_only=True)
+    return conn
+
+
+def _run_chunk(db_path, sql, params):
+    return _worker_conn(db_path).execute(sql, params).fetchall()
+
+
+def get_executor(workers=None):
+    """Return the shared worker pool, started on first use
+
+    Starting processes costs more than most queries, so the pool is kept
+    for the life of the program.
+    """
+    global _executor, _executor_workers
+    # Imported on first use: it pulls in multiprocessing, which the apps
+    # only need once a table is big enough for a parallel scan
+    from concurrent.futures import ProcessPoolExecutor
+    workers = workers or os.cpu_count() or 1
+    if _executor is None or _executor_workers != workers:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = ProcessPoolExecutor(workers)
+        _executor_workers = workers
+    return _executor
+
+
+def id_range(db_path=None):
+    """Return (lowest id, highest id) of a database, or None when empty"""
+    conn = connect(db_path, read_only=True)
+    try:
+        # Separate subqueries: SQLite only optimizes a lone MIN or MAX
+        low, high = conn.execute('SELECT (SELECT MIN(id) FROM customers), '
+                                 '(SELECT MAX(id) FROM customers)').fetchone()
+    finally:
+        conn.close()
+    return None if low is None else (low, high)
+
+
+def worth_parallel(db_path=None):
+    """True when a database is big enough for a parallel scan to pay off"""
+    ids = id_range(db_path)
+    return (os.cpu_count() or 1) > 1 and ids is not None \
+        and ids[1] - ids[0] >= MIN_PARALLEL_ROWS
+
+
+def chunks(db_paths=None, chunk_rows=CHUNK_ROWS):
+    """Split each database's id range into (db_path, low, high) slices"""
+    tasks = []
+    for db_path in db_paths or [get_db_path()]:
+        ids = id_range(db_path)
+        if ids is None:
+            continue
+        low, high = ids
+        for start in range(low, high + 1, chunk_rows):
+            tasks.append((db_path, start, min(start + chunk_rows - 1, high)))
+    return tasks
+
+
+def _where(low, high, where, params, term, columns):
+    """The filter for one slice: the id range, then the caller's condition
+    and search term (whose index lookup is limited to the same range)"""
+    conditions = ['id BETWEEN ? AND ?']
+    values = [low, high]
+    if where:
+        conditions.append(f'({where})')
+        values.extend(params)
+    if term:
+        search, search_params = search_filter(term, columns, id_range=(low, high))
+        if search:
+            conditions.append(search)
+            values.extend(search_params)
+    return ' AND '.join(conditions), tuple(values)
+
+
+def _map(tasks, workers):
+    """Run (db_path, sql, params) tasks, yielding results in task order
+
+    Only a few tasks per worker are queued at a time, so a consumer that
+    stops early doesn't leave the pool busy with the rest.
+    """
+    executor = get_executor(workers)
+    ahead = (workers or os.cpu_count() or 1) * MAX_AHEAD
+    tasks = iter(tasks)
+    pending = []
+    try:
+        while True:
+            while len(pending) < ahead:
+                task = next(tasks, None)
+                if task is None:
+                    break
+                pending.append(executor.submit(_run_chunk, *task))
+            if not pending:
+                return
+            yield pending.pop(0).result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _sort_key(value):
+    """Order Python values the way SQLite orders them: NULL, numbers, text, blobs"""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (3, value)
+
+
+def scan(where='', params=(), term=None, columns=None, order_column='id',
+         descending=False, limit=None, db_paths=None, workers=None, chunk_rows=CHUNK_ROWS):
+    """Yield customer rows (in COLUMNS order) matching a filter, in order
+
+    The id range of each database in db_paths (default: the current one) is
+    split into chunks that worker processes query on their own read-only
+    connections. `term` is a search as typed, matched through the full-text
+    index. Rows are merged into one ordered stream: in id order they are
+    passed on as each chunk finishes; other orders wait for every chunk.
+    """
+    expression = order_expression(order_column)
+    direction = 'DESC' if descending else 'ASC'
+    select = ', '.join(COLUMNS) + ('' if order_column == 'id' else f', {expression}')
+    tasks = []
+    for db_path, low, high in chunks(db_paths, chunk_rows):
+        condition, values = _where(low, high, where, params, term, columns)
+        sql = (f'SELECT {select} FROM customers WHERE {condition} '
+               f'ORDER BY {expression} {direction}, id {direction}')
+        if limit is not None:
+            sql += f' LIMIT {int(limit)}'
+        tasks.append((db_path, sql, values))
+
+    if order_column == 'id' and (db_paths is None or len(db_paths) == 1):
+        if descending:
+            tasks.reverse()
+        # Chunks cover consecutive id ranges, so their order is the result order
+        results = (row for rows in _map(tasks, workers) for row in rows)
+    else:
+        width = len(COLUMNS)
+        key = (lambda row: (_sort_key(row[0]),)) if order_column == 'id' else \
+            (lambda row: (_sort_key(row[width]), row[0]))
+        results = heapq.merge(*_map(tasks, workers), key=key, reverse=descending)
+        if order_column != 'id':
+            results = (row[:width] for row in results)
+
+    for count, row in enumerate(results):
+        if limit is not None and count >= limit:
+            return
+        yield row
+
+
+def count(where='', params=(), term=None, columns=None, db_paths=None,
+          workers=None, chunk_rows=CHUNK_ROWS, cancelled=None):
+    """Count the customers matching a filter, a chunk per worker task
+
+    Returns None if cancelled() becomes true before every chunk is counted.
+    """
+    tasks = []
+    for db_path, low, high in chunks(db_paths, chunk_rows):
+        condition, values = _where(low, high, where, params, term, columns)
+        tasks.append((db_path, f'SELECT COUNT(*) FROM customers WHERE {condition}', values))
+    total = 0
+    for rows in _map(tasks, workers):
+        if cancelled is not None and cancelled():
+            return None
+        total += rows[0][0]
+    return total
+
+
+def group_counts(expression, where='', params=(), term=None, columns=None,
+                 db_paths=None, workers=None, chunk_rows=CHUNK_ROWS):
+    """Return (value, count) pairs of a SQL expression, largest count first"""
+    tasks = []
+    for db_path, low, high in chunks(db_paths, chunk_rows):
+        condition, values = _where(low, high, where, params, term, columns)
+        tasks.append((db_path, f'SELECT {expression}, COUNT(*) FROM customers '
+                               f'WHERE {condition} GROUP BY 1', values))
+    totals = Counter()
+    for rows in _map(tasks, workers):
+        for value, number in rows:
+            totals[value] += number
+    return sorted(totals.items(), key=lambda item: (-item[1], _sort_key(item[0])))
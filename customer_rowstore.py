@@ -0,0 +1,422 @@
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from itertools import accumulate, chain, compress, count, islice, repeat
+from operator import contains
+
+from customer_db import COLUMNS
+from customer_schema import EPOCH_SQL, schema_version
+from customer_validation import parse_date
+
+SEGMENT_ROWS = 4096   # rows per packed string; an update rewrites one segment
+CHUNK_SIZE = 10000    # rows fetched from the cursor at a time while loading
+DENSE_HITS = SEGMENT_ROWS // 8   # hits in a segment above which a search tests row by row
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+_EPOCH = datetime(1970, 1, 1)
+_SECOND = timedelta(seconds=1)
+_TEXT_DATE = 1 << 62   # sort key of a date_added that isn't a timestamp: after them, as in SQL
+
+# Columns kept as packed text; the others have their own storage
+TEXT_COLUMNS = ('name', 'birthday', 'email', 'phone', 'address')
+
+
+class TextColumn:
+    """Strings stored end to end, SEGMENT_ROWS to a segment
+
+    A value is a slice of its segment between two end offsets, so a row
+    costs its characters plus four bytes instead of a str object each.
+    """
+
+    def __init__(self, terminator=None):
+        self.segments = []
+        self.ends = array('I')
+        self.terminator = terminator   # ends every value, if given, and appears nowhere else
+
+    def __len__(self):
+        return len(self.ends)
+
+    def extend(self, values, lower=False):
+        """Append strings (lowercased, with lower=True)"""
+        values = list(values)
+        done = 0
+        while done < len(values):
+            slot = len(self.ends)
+            if slot % SEGMENT_ROWS == 0:
+                self.segments.append('')
+            part = values[done:done + SEGMENT_ROWS - slot % SEGMENT_ROWS]
+            text = ''.join(part)
+            if lower:
+                lowered = text.lower()
+                if len(lowered) == len(text):
+                    text = lowered
+                else:
+                    # A few characters lowercase to more than one
+                    part = [value.lower() for value in part]
+                    text = ''.join(part)
+            if self.terminator and text.count(self.terminator) != len(part):
+                part = [self._clean(value.lower() if lower else value) for value in part]
+                text = ''.join(part)
+            segment = self.segments[-1]
+            self.ends.extend(islice(accumulate(map(len, part), initial=len(segment)), 1, None))
+            self.segments[-1] = segment + text
+            done += len(part)
+
+    def bounds(self, slot):
+        """(segment, start, end) of a slot's value"""
+        start = self.ends[slot - 1] if slot % SEGMENT_ROWS else 0
+        return slot // SEGMENT_ROWS, start, self.ends[slot]
+
+    def get(self, slot):
+        segment, start, end = self.bounds(slot)
+        return self.segments[segment][start:end]
+
+    def _clean(self, value):
+        """A value with the terminator only at its end"""
+        terminator = self.terminator
+        return value[:-len(terminator)].replace(terminator, ' ') + terminator
+
+    def set(self, slot, value):
+        """Replace a value, shifting the rest of its segment"""
+        if self.terminator:
+            value = self._clean(value)
+        segment, start, end = self.bounds(slot)
+        text = self.segments[segment]
+        if text[start:end] == value:
+            return
+        self.segments[segment] = text[:start] + value + text[end:]
+        delta = len(value) - (end - start)
+        if delta:
+            last = min((segment + 1) * SEGMENT_ROWS, len(self.ends))
+            self.ends[slot:last] = array('I', map(delta.__add__, self.ends[slot:last]))
+
+    def _values(self, index):
+        """The values of one segment"""
+        segment = self.segments[index]
+        if self.terminator:
+            # One split is much cheaper than a slice per value
+            return segment.split(self.terminator)
+        lo = index * SEGMENT_ROWS
+        ends = self.ends[lo:lo + SEGMENT_ROWS]
+        return map(segment.__getitem__, map(slice, chain((0,), ends), ends))
+
+    def find(self, term, cancelled=None):
+        """The slots whose value contains term, in slot order
+
+        Returns None if cancelled() becomes true first.
+        """
+        ends = self.ends
+        found = []
+        for index, segment in enumerate(self.segments):
+            if cancelled is not None and cancelled():
+                return None
+            lo = index * SEGMENT_ROWS
+            hi = min(lo + SEGMENT_ROWS, len(ends))
+            if segment.count(term, 0, len(segment) // 8) > DENSE_HITS // 8:
+                # Many rows match (going by the first eighth of the segment):
+                # testing every row beats locating each hit
+                found.extend(compress(range(lo, hi),
+                                      map(contains, self._values(index), repeat(term))))
+                continue
+            position = segment.find(term)
+            while position >= 0:
+                slot = bisect_right(ends, position, lo, hi)
+                found.append(slot)
+                # Skip the rest of the row: one hit per row is enough
+                lo = slot + 1
+                position = segment.find(term, ends[slot])
+        return found
+
+
+# What a search scans for each row, lowercased. NUL between fields and a
+# newline after the row keep a term from matching across fields or rows
+# (neither can be typed in the search box).
+_search_text = '{}\0{}\0{}\n'.format
+
+
+def _birthday_key(value):
+    parsed = parse_date(value) if isinstance(value, str) else None
+    return parsed.toordinal() if parsed else 0
+
+
+class CustomerStore:
+    """Every customer of the classic viewer, column by column
+
+    Rows live in slots in id order, so an id is found by bisecting the id
+    array (the few added below the highest id since loading go in a dict).
+    Text is packed per column (TextColumn), preferred contacts are stored
+    as small integers pointing into a table of the distinct values, and
+    ids and dates added are machine integers. name, email and phone are
+    also kept lowercased in one search column that a search scans with
+    str.find. `order` holds the slots in display order.
+
+    Deleted rows keep their slot until the store is loaded again, so slot
+    lists handed out earlier stay valid.
+    """
+
+    def __init__(self):
+        self.ids = array('q')
+        self.alive = bytearray()
+        self.text = {column: TextColumn() for column in TEXT_COLUMNS}
+        self._text_columns = tuple(self.text.values())
+        self.contacts = array('H')
+        self.contact_values = []
+        self._contact_codes = {}
+        self.dates = array('q')
+        self._odd_dates = {}     # slot -> date_added that isn't a plain timestamp
+        self.search_text = TextColumn('\n')
+        self.order = array('q')
+        self.sort_by = 'id'
+        self.descending = True
+        self._birthday_keys = None
+        self._positions = None
+        self._sorted_count = 0   # slots before this one are in id order
+        self._extra_slots = {}   # id -> slot for the rest, added out of order
+        self._live = 0
+
+    @classmethod
+    def load(cls, conn, sort_by='id', descending=True, chunk_size=CHUNK_SIZE):
+        """Build a store from the customers table, a cursor chunk at a time"""
+        store = cls()
+        # Seconds since the epoch rather than the text shown: version 2
+        # stores them, and they are what the store keeps
+        added = 'added_at' if schema_version(conn) >= 2 else EPOCH_SQL.format('date_added')
+        columns = [f'ifnull({column}, \'\')' if column in TEXT_COLUMNS else column
+                   for column in COLUMNS[:-1]]
+        cursor = conn.execute(f"SELECT {', '.join(columns)}, {added} FROM customers ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            store._append(rows)
+        store._sorted_count = len(store.ids)
+        store.sort(sort_by, descending)
+        return store
+
+    def __len__(self):
+        return self._live
+
+    # --- Storage -----------------------------------------------------------
+
+    def _contact_code(self, value):
+        code = self._contact_codes.get(value)
+        if code is None:
+            code = self._contact_codes[value] = len(self.contact_values)
+            self.contact_values.append(value)
+        return code
+
+    def _date_value(self, slot, value):
+        """Seconds since the epoch of a date added (as stored or as shown),
+        remembering values that aren't timestamps"""
+        self._odd_dates.pop(slot, None)
+        if isinstance(value, int):
+            return value
+        if isinstance(value, str) and len(value) == 19:
+            try:
+                return (datetime.fromisoformat(value) - _EPOCH) // _SECOND
+            except ValueError:
+                pass
+        self._odd_dates[slot] = value
+        return -1 if value is None else _TEXT_DATE
+
+    def _append(self, rows):
+        """Add rows in new slots at the end
+
+        Rows are in COLUMNS order; date_added may be shown text or seconds.
+        Each column is added in one go rather than row by row.
+        """
+        start = len(self.ids)
+        ids, names, birthdays, emails, phones, addresses, contacts, dates = \
+            [['' if value is None else value for value in column]
+             if index in (1, 2, 3, 4, 5) and None in column else column
+             for index, column in enumerate(zip(*rows))]
+        self.ids.extend(ids)
+        self.alive.extend(b'\1' * len(rows))
+        for column, values in zip(TEXT_COLUMNS, (names, birthdays, emails, phones, addresses)):
+            self.text[column].extend(values)
+        for value in set(contacts) - self._contact_codes.keys():
+            self._contact_code(value)
+        self.contacts.extend(map(self._contact_codes.__getitem__, contacts))
+        try:
+            self.dates.extend(array('q', dates))
+        except TypeError:
+            self.dates.extend(self._date_value(slot, value)
+                              for slot, value in enumerate(dates, start))
+        self.search_text.extend(map(_search_text, names, emails, phones), lower=True)
+        if self._birthday_keys is not None:
+            self._birthday_keys.extend(map(_birthday_key, birthdays))
+        self._live += len(rows)
+
+    def _write(self, slot, row):
+        """Overwrite a slot in place"""
+        row = ['' if value is None else value for value in row]
+        for index, column in enumerate(COLUMNS):
+            if column in self.text:
+                self.text[column].set(slot, row[index])
+        self.contacts[slot] = self._contact_code(row[6])
+        self.dates[slot] = self._date_value(slot, row[7])
+        self.search_text.set(slot, _search_text(row[1], row[3], row[4]).lower())
+        if self._birthday_keys is not None:
+            self._birthday_keys[slot] = _birthday_key(row[2])
+
+    def slot_of(self, customer_id):
+        """The slot holding a customer, or None"""
+        slot = self._find(customer_id)
+        if slot is None or not self.alive[slot]:
+            return None
+        return slot
+
+    def _find(self, customer_id):
+        slot = bisect_left(self.ids, customer_id, 0, self._sorted_count)
+        if slot < self._sorted_count and self.ids[slot] == customer_id:
+            return slot
+        return self._extra_slots.get(customer_id)
+
+    def row(self, slot):
+        """A slot as a tuple in COLUMNS order"""
+        # TextColumn.get inlined: this runs for every row put on screen
+        segment, offset = divmod(slot, SEGMENT_ROWS)
+        name, birthday, email, phone, address = [
+            column.segments[segment][column.ends[slot - 1] if offset else 0:column.ends[slot]]
+            for column in self._text_columns]
+        date = self._odd_dates.get(slot) if slot in self._odd_dates else \
+            time.strftime(DATE_FORMAT, time.gmtime(self.dates[slot]))
+        return (self.ids[slot], name, birthday, email, phone, address,
+                self.contact_values[self.contacts[slot]], date)
+
+    # --- Order -------------------------------------------------------------
+
+    def _key_function(self, column):
+        if column == 'id':
+            return self.ids.__getitem__
+        if column == 'date_added':
+            return self.dates.__getitem__
+        if column == 'preferred_contact':
+            values, contacts = self.contact_values, self.contacts
+            return lambda slot: values[contacts[slot]] or ''
+        if column == 'birthday':
+            if self._birthday_keys is None:
+                birthdays = self.text['birthday']
+                self._birthday_keys = array('l', (_birthday_key(birthdays.get(slot))
+                                                  for slot in range(len(self.ids))))
+            return self._birthday_keys.__getitem__
+        return self.text[column].get
+
+    def sort(self, column='id', descending=True):
+        """Put the live slots in display order: by a column, then by id"""
+        self.sort_by = column
+        self.descending = descending
+        slots = range(len(self.ids) - 1, -1, -1) if descending else range(len(self.ids))
+        live = compress(slots, map(self.alive.__getitem__, slots))
+        if column == 'id' and not self._extra_slots:
+            self.order = array('q', live)
+        else:
+            # Stable: rows with equal keys keep the id order of `slots`
+            self.order = array('q', sorted(live, key=self._key_function(column),
+                                           reverse=descending))
+        self._positions = None
+
+    def _sort_key(self, slot):
+        return self._key_function(self.sort_by)(slot), self.ids[slot]
+
+    def _insert_position(self, slot):
+        """Index in order where slot belongs in the current sort"""
+        key = self._sort_key(slot)
+        lo, hi = 0, len(self.order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key = self._sort_key(self.order[mid])
+            if (mid_key > key) if self.descending else (mid_key < key):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def in_order(self, slots):
+        """Slots (in slot order) rearranged into display order"""
+        if self.sort_by == 'id' and not self._extra_slots:
+            # Slot order is id order
+            return slots[::-1] if self.descending else slots
+        if len(slots) > len(self.order) // 8:
+            # Cheaper to walk the whole order than to sort many slots
+            wanted = bytearray(len(self.ids))
+            # Marks every slot without a Python-level loop (__setitem__ returns None)
+            any(map(wanted.__setitem__, slots, repeat(1)))
+            return list(compress(self.order, map(wanted.__getitem__, self.order)))
+        return sorted(slots, key=self._position_array().__getitem__)
+
+    def positions(self, slots):
+        """Where each of the (live) slots is in display order"""
+        return list(map(self._position_array().__getitem__, slots))
+
+    def _position_array(self):
+        """slot -> index in order, rebuilt after the order changes"""
+        positions = self._positions
+        if positions is None:
+            positions = array('q', bytes(8 * len(self.ids)))
+            any(map(positions.__setitem__, self.order, count()))
+            self._positions = positions
+        return positions
+
+    # --- Changes -----------------------------------------------------------
+
+    def discard(self, customer_ids):
+        """Remove customers; returns the ids that were in the store"""
+        slots = {}
+        for customer_id in customer_ids:
+            slot = self.slot_of(customer_id)
+            if slot is not None:
+                slots[customer_id] = slot
+                self.alive[slot] = 0
+        if len(slots) > 64:
+            self.order = array('q', compress(self.order,
+                                             map(self.alive.__getitem__, self.order)))
+        else:
+            for slot in slots.values():
+                self.order.remove(slot)
+        self._live -= len(slots)
+        if slots:
+            self._positions = None
+        return set(slots)
+
+    def put(self, row):
+        """Add a customer (or bring back a discarded one with new values)
+        and return its position in display order"""
+        customer_id = row[0]
+        slot = self._find(customer_id)
+        if slot is None:
+            slot = len(self.ids)
+            if self._sorted_count == slot and (not slot or customer_id > self.ids[-1]):
+                self._sorted_count += 1
+            else:
+                self._extra_slots[customer_id] = slot
+            self._append([row])
+        else:
+            if self.alive[slot]:
+                self.discard([customer_id])
+            self._write(slot, row)
+            self.alive[slot] = 1
+            self._live += 1
+        position = self._insert_position(slot)
+        self.order.insert(position, slot)
+        self._positions = None
+        return position
+
+    # --- Search ------------------------------------------------------------
+
+    def search(self, term, cancelled=None):
+        """Slots whose name, email or phone contains term, in display order
+
+        term is matched in lowercase, like the viewer's search box. Returns
+        None if cancelled() becomes true first.
+        """
+        term = term.lower()
+        if not term or '\0' in term or '\n' in term:
+            return [] if term else self.order[:]
+        matched = self.search_text.find(term, cancelled)
+        if matched is None:
+            return None
+        if self._live < len(self.ids):
+            matched = list(compress(matched, map(self.alive.__getitem__, matched)))
+        return self.in_order(matched)
@@ -0,0 +1,556 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from customer_search import PHONE_DIGITS_SQL, create_search_triggers, drop_search_triggers
+from customer_stats import create_stats_triggers, drop_stats_triggers
+from customer_validation import CONTACT_METHODS, parse_date, phone_digits
+
+# Versions, kept in PRAGMA user_version:
+#  1  customers is a table of the text the form was given
+#  2  customer_records keeps ISO birth dates, epoch timestamps, phone numbers
+#     as integers and contact methods as ids into contact_methods; customers
+#     is a view over it with the old columns, so readers don't change
+SCHEMA_VERSION = 2
+
+BATCH_SIZE = 10000   # rows copied (or cleaned up) per transaction
+
+CREATE_CUSTOMERS_SQL = '''
+    CREATE TABLE IF NOT EXISTS customers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        birthday TEXT NOT NULL,
+        email TEXT NOT NULL,
+        phone TEXT NOT NULL,
+        address TEXT NOT NULL,
+        preferred_contact TEXT NOT NULL,
+        date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+# Conversions between the displayed and the stored values. {0} is the
+# value to convert; a value that can't be converted is kept as it is, so
+# nothing is lost from rows that predate validation.
+
+# M/D/YYYY -> YYYY-MM-DD
+ISO_DATE_SQL = '''(CASE WHEN {0} GLOB '[0-9]*/[0-9]*/[0-9][0-9][0-9][0-9]' AND length({0}) <= 10
+    THEN substr({0}, length({0}) - 3) || '-' ||
+         printf('%02d', substr({0}, 1, instr({0}, '/') - 1)) || '-' ||
+         printf('%02d', substr({0}, instr({0}, '/') + 1, length({0}) - instr({0}, '/') - 5))
+    ELSE {0} END)'''
+
+# YYYY-MM-DD -> MM/DD/YYYY
+US_DATE_SQL = '''(CASE WHEN {0} GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+    THEN substr({0}, 6, 2) || '/' || substr({0}, 9, 2) || '/' || substr({0}, 1, 4)
+    ELSE {0} END)'''
+
+# Typed phone -> 10-digit integer
+_DIGITS = PHONE_DIGITS_SQL.format('{0}')
+PHONE_NUMBER_SQL = (f"(CASE WHEN length({_DIGITS}) = 10 AND {_DIGITS} NOT GLOB '*[^0-9]*' "
+                    f"THEN CAST({_DIGITS} AS INTEGER) ELSE {{0}} END)")
+
+# 10-digit integer -> xxx-xxx-xxxx
+PHONE_TEXT_SQL = '''(CASE WHEN typeof({0}) = 'integer'
+    THEN printf('%03d-%03d-%04d', {0} / 10000000, {0} / 10000 % 1000, {0} % 10000)
+    ELSE {0} END)'''
+
+# 'YYYY-MM-DD HH:MM:SS' (UTC, as CURRENT_TIMESTAMP) <-> seconds since 1970
+EPOCH_SQL = "coalesce(CAST(strftime('%s', {0}) AS INTEGER), {0})"
+TIMESTAMP_SQL = "(CASE WHEN typeof({0}) = 'integer' THEN datetime({0}, 'unixepoch') ELSE {0} END)"
+NOW_SQL = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+# Any casing of a contact method -> its canonical name
+CONTACT_NAME_SQL = ('(CASE lower(trim({0})) '
+                    + ' '.join(f"WHEN '{m.lower()}' THEN '{m}'" for m in CONTACT_METHODS)
+                    + ' ELSE {0} END)')
+CONTACT_ID_SQL = '(SELECT id FROM contact_methods WHERE name = {0})'
+
+# The standard methods get ids in name order, so sorting by contact_id
+# sorts by name. Other methods get the next id when first stored (e.g.
+# 'Fax' -> 4), which breaks that order: see contact_ids_sorted
+_CONTACT_IDS = {name: i for i, name in enumerate(sorted(CONTACT_METHODS), 1)}
+# The same lookup without a subquery, which generated columns can't hold
+_CONTACT_ID_CASE = ('(CASE {0} '
+                    + ' '.join(f"WHEN '{m}' THEN {i}" for m, i in _CONTACT_IDS.items())
+                    + ' END)')
+
+# Keys that bring likely duplicates of a customer together (see
+# customer_dedup): email without case or +tag, phone digits, and last name
+# with birthday. SQLite doesn't allow table-qualified names here.
+_EMAIL_KEY_SQL = '''
+    lower(CASE WHEN instr(substr(email, 1, instr(email, '@')), '+') > 0
+          THEN substr(email, 1, instr(email, '+') - 1) || substr(email, instr(email, '@'))
+          ELSE email END)
+'''
+_LAST_NAME_SQL = ("lower(substr(trim(name), "
+                  "length(rtrim(trim(name), replace(trim(name), ' ', ''))) + 1))")
+DEDUP_KEYS = {
+    'email_key': _EMAIL_KEY_SQL,
+    'phone_key': PHONE_DIGITS_SQL.format('phone'),
+    'name_key': f"{_LAST_NAME_SQL} || '|' || birth_date",
+}
+
+# Version 1 columns as the version 2 columns store them
+_STORED = {
+    'birth_date': ISO_DATE_SQL.format('birthday'),
+    'phone_number': PHONE_NUMBER_SQL.format('phone'),
+    'contact_id': _CONTACT_ID_CASE.format(CONTACT_NAME_SQL.format('preferred_contact')),
+    'added_at': EPOCH_SQL.format('date_added'),
+}
+
+_CREATE_RECORDS_SQL = f'''
+    CREATE TABLE customer_records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        birth_date TEXT NOT NULL,
+        email TEXT NOT NULL,
+        phone_number INTEGER NOT NULL,
+        address TEXT NOT NULL,
+        contact_id INTEGER NOT NULL REFERENCES contact_methods (id),
+        added_at INTEGER DEFAULT ({NOW_SQL}),
+        birthday TEXT GENERATED ALWAYS AS ({US_DATE_SQL.format('birth_date')}) VIRTUAL,
+        phone TEXT GENERATED ALWAYS AS ({PHONE_TEXT_SQL.format('phone_number')}) VIRTUAL,
+        date_added TEXT GENERATED ALWAYS AS ({TIMESTAMP_SQL.format('added_at')}) VIRTUAL,
+        {', '.join(f'{column} TEXT GENERATED ALWAYS AS ({expression}) VIRTUAL'
+                   for column, expression in DEDUP_KEYS.items())}
+    )
+'''
+
+# Every column the viewer sorts by (pages are read by keyset, see
+# customer_paging) and every dedup key gets an index. On 1M rows a page
+# sorted by a column without one took 170-210 ms instead of 1-6 ms;
+# address and contact_id, the least used, cost 16% of insert speed together
+RECORD_INDEXES = ('name', 'birth_date', 'email', 'phone_number', 'address',
+                  'contact_id', 'added_at') + tuple(DEDUP_KEYS)
+
+_CREATE_VIEW_SQL = '''
+    CREATE VIEW customers AS
+    SELECT r.id, r.name, r.birthday, r.email, r.phone, r.address,
+           (SELECT m.name FROM contact_methods m WHERE m.id = r.contact_id) AS preferred_contact,
+           r.date_added, r.birth_date, r.phone_number, r.contact_id, r.added_at,
+           r.email_key, r.phone_key, r.name_key
+    FROM customer_records r
+'''
+
+_RECORD_COLUMNS = 'name, birth_date, email, phone_number, address, contact_id, added_at'
+
+# Triggers on the version 1 table, dropped when it is swapped out
+_LEGACY_TRIGGERS = ('customers_log_update', 'customers_log_delete', 'customers_copy_insert',
+                    'customers_copy_update', 'customers_copy_delete')
+
+# Change log entries older than this are pruned when the log is set up
+KEEP_CHANGES_DAYS = 7
+
+
+def _record_values(prefix, date_default=None):
+    """SQL for the customer_records values of a displayed row `prefix`"""
+    contact = CONTACT_NAME_SQL.format(f'{prefix}.preferred_contact')
+    added = EPOCH_SQL.format(f'{prefix}.date_added')
+    if date_default:
+        added = f'coalesce({added}, {date_default})'
+    return (f"{prefix}.name, {ISO_DATE_SQL.format(f'{prefix}.birthday')}, {prefix}.email, "
+            f"{PHONE_NUMBER_SQL.format(f'{prefix}.phone')}, {prefix}.address, "
+            f"{CONTACT_ID_SQL.format(contact)}, {added}")
+
+
+def _add_contact(prefix):
+    return (f"INSERT OR IGNORE INTO contact_methods (name) "
+            f"VALUES ({CONTACT_NAME_SQL.format(f'{prefix}.preferred_contact')});")
+
+
+def _table_type(conn, name):
+    row = conn.execute('SELECT type FROM sqlite_master WHERE name = ?', (name,)).fetchone()
+    return row[0] if row else None
+
+
+def contact_ids_sorted(conn):
+    """Whether sorting by contact_id still sorts by contact method name"""
+    if _table_type(conn, 'contact_methods') is None:
+        return False
+    names = [name for name, in conn.execute('SELECT name FROM contact_methods ORDER BY id')]
+    return names == sorted(names)
+
+
+def schema_version(conn):
+    """Return the schema version, 0 for a database without customers"""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version == 0 and _table_type(conn, 'customers') == 'table':
+        return 1
+    return version
+
+
+def storage_table(conn):
+    """The table customers are stored in: customer_records, or customers
+    itself before the version 2 migration has finished"""
+    return 'customer_records' if _table_type(conn, 'customers') == 'view' else 'customers'
+
+
+def migration_pending(conn):
+    """True while rows still have to be copied or the old table cleaned up"""
+    return (_table_type(conn, 'customer_migration') is not None
+            or _table_type(conn, 'customers_v1') is not None)
+
+
+def ensure_change_log(conn, table='customers'):
+    """Create the change log and the update/delete triggers that feed it
+
+    Inserts are not logged: new rows are found by id, which only grows
+    because the table uses AUTOINCREMENT.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS customer_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    create_change_triggers(conn, table)
+    conn.execute("DELETE FROM customer_changes WHERE changed_at < datetime('now', ?)",
+                 (f'-{KEEP_CHANGES_DAYS} days',))
+    conn.commit()
+
+
+def create_change_triggers(conn, table='customers'):
+    """Create the triggers that log updates and deletes of `table`"""
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS customers_log_update AFTER UPDATE ON {table}
+        BEGIN
+            INSERT INTO customer_changes (customer_id, op) VALUES (new.id, 'U');
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS customers_log_delete AFTER DELETE ON {table}
+        BEGIN
+            INSERT INTO customer_changes (customer_id, op) VALUES (old.id, 'D');
+        END
+    ''')
+
+
+def insert_sql(conn, with_date=False):
+    """INSERT statement for (name, birthday, email, phone, address,
+    preferred_contact[, date_added]) as typed, into the current storage"""
+    if storage_table(conn) == 'customers':
+        columns = 'name, birthday, email, phone, address, preferred_contact'
+        marks = '?, ?, ?, ?, ?, ?'
+        if with_date:
+            columns += ', date_added'
+            marks += ', ?'
+        return f'INSERT INTO customers ({columns}) VALUES ({marks})'
+
+    # lastrowid isn't set through the view's INSTEAD OF trigger, so write
+    # the table directly
+    contact = CONTACT_ID_SQL.format(CONTACT_NAME_SQL.format('?6'))
+    added = f"coalesce({EPOCH_SQL.format('?7')}, {NOW_SQL})" if with_date else NOW_SQL
+    return f'''
+        INSERT INTO customer_records ({_RECORD_COLUMNS})
+        VALUES (?1, {ISO_DATE_SQL.format('?2')}, ?3, {PHONE_NUMBER_SQL.format('?4')}, ?5,
+                {contact}, {added})
+    '''
+
+
+# The same conversions in Python, for bulk loads that insert straight into
+# customer_records (see customer_import)
+
+RECORDS_INSERT_SQL = f'INSERT INTO customer_records ({_RECORD_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)'
+
+
+@lru_cache(maxsize=65536)
+def _epoch(timestamp):
+    try:
+        parsed = datetime.fromisoformat(timestamp)
+    except ValueError:
+        return timestamp
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def _phone_number(phone):
+    digits = phone_digits(phone)
+    return int(digits) if len(digits) == 10 and digits.isascii() and digits.isdigit() else phone
+
+
+def contact_ids(conn, names=()):
+    """Contact method name -> id, adding any of `names` not stored yet"""
+    conn.executemany('INSERT OR IGNORE INTO contact_methods (name) VALUES (?)',
+                     [(name,) for name in names])
+    return dict(conn.execute('SELECT name, id FROM contact_methods'))
+
+
+def stored_values(row, contact_ids):
+    """The customer_records values of (name, birthday, email, phone, address,
+    preferred_contact, date_added) as typed, for RECORDS_INSERT_SQL
+
+    The contact method must already be a canonical name in contact_ids.
+    """
+    name, birthday, email, phone, address, contact, date_added = row
+    birth_date = parse_date(birthday)
+    return (name, birth_date.isoformat() if birth_date else birthday, email,
+            _phone_number(phone), address, contact_ids[contact], _epoch(date_added))
+
+
+# Version 1 ------------------------------------------------------------------
+
+def _create_customers(conn):
+    conn.execute(CREATE_CUSTOMERS_SQL)
+
+
+# Version 2 ------------------------------------------------------------------
+
+def _start_compact_storage(conn):
+    """Create the version 2 tables and start copying into them
+
+    Only schema changes, so it's quick at any size. Rows are copied by
+    _copy_rows; until then the triggers added here copy every change.
+    """
+    # Give the old table the new columns, so sorts and summary counts use
+    # the same values before and after the copy
+    columns = {row[1] for row in conn.execute('PRAGMA table_xinfo(customers)')}
+    for column, expression in list(_STORED.items()) + list(DEDUP_KEYS.items()):
+        if column not in columns:
+            conn.execute(f'ALTER TABLE customers ADD COLUMN {column} '
+                         f'GENERATED ALWAYS AS ({expression}) VIRTUAL')
+
+    if _table_type(conn, 'customer_stats') is not None:
+        # Older triggers count birthdays by a column that is now birth_date
+        drop_stats_triggers(conn)
+        create_stats_triggers(conn)
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS contact_methods (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    conn.executemany('INSERT OR IGNORE INTO contact_methods (id, name) VALUES (?, ?)',
+                     [(i, name) for name, i in _CONTACT_IDS.items()])
+    conn.execute(_CREATE_RECORDS_SQL)
+    for column in RECORD_INDEXES:
+        conn.execute(f'CREATE INDEX idx_customer_records_{column} '
+                     f'ON customer_records({column})')
+
+    conn.execute(f'''
+        CREATE TRIGGER customers_copy_insert AFTER INSERT ON customers
+        BEGIN
+            {_add_contact('new')}
+            INSERT OR REPLACE INTO customer_records (id, {_RECORD_COLUMNS})
+            VALUES (new.id, {_record_values('new')});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER customers_copy_update AFTER UPDATE ON customers
+        BEGIN
+            {_add_contact('new')}
+            DELETE FROM customer_records WHERE id = old.id;
+            INSERT OR REPLACE INTO customer_records (id, {_RECORD_COLUMNS})
+            VALUES (new.id, {_record_values('new')});
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER customers_copy_delete AFTER DELETE ON customers
+        BEGIN
+            DELETE FROM customer_records WHERE id = old.id;
+        END
+    ''')
+    conn.execute('CREATE TABLE customer_migration (version INTEGER NOT NULL, '
+                 'next_id INTEGER NOT NULL)')
+    conn.execute('INSERT INTO customer_migration VALUES (2, 0)')
+
+
+# The displayed values after a round trip through the stored ones. Rows are
+# rewritten to these before they're copied, so the search index and the
+# summary counts (which the old table's triggers keep) match the new table.
+_CANONICAL = {
+    'birthday': US_DATE_SQL.format(ISO_DATE_SQL.format('birthday')),
+    'phone': PHONE_TEXT_SQL.format(PHONE_NUMBER_SQL.format('phone')),
+    'preferred_contact': CONTACT_NAME_SQL.format('preferred_contact'),
+    'date_added': TIMESTAMP_SQL.format(EPOCH_SQL.format('date_added')),
+}
+
+
+def _copy_rows(conn, batch_size):
+    """Copy the next batch of rows; swap the tables once all are copied
+
+    Returns the number of rows copied, 0 once the migration is finished.
+    """
+    start = conn.execute('SELECT next_id FROM customer_migration').fetchone()[0]
+    row = conn.execute('SELECT id FROM customers WHERE id > ? ORDER BY id LIMIT 1 OFFSET ?',
+                       (start, batch_size - 1)).fetchone()
+    end = row[0] if row else conn.execute(
+        'SELECT COALESCE(MAX(id), 0) FROM customers').fetchone()[0]
+    if end <= start:
+        _swap_tables(conn)
+        return 0
+
+    conn.execute(f'''
+        UPDATE customers SET {', '.join(f'{c} = {e}' for c, e in _CANONICAL.items())}
+        WHERE id > ?1 AND id <= ?2
+          AND ({' OR '.join(f'{c} IS NOT {e}' for c, e in _CANONICAL.items())})
+    ''', (start, end))
+    conn.execute('''
+        INSERT OR IGNORE INTO contact_methods (name)
+        SELECT DISTINCT preferred_contact FROM customers WHERE id > ?1 AND id <= ?2
+    ''', (start, end))
+    copied = conn.execute(f'''
+        INSERT OR REPLACE INTO customer_records (id, {_RECORD_COLUMNS})
+        SELECT id, {_record_values('customers')} FROM customers WHERE id > ?1 AND id <= ?2
+    ''', (start, end)).rowcount
+    conn.execute('UPDATE customer_migration SET next_id = ?', (end,))
+    return copied
+
+
+def _swap_tables(conn):
+    """Put the view in place of the old table, in the caller's transaction"""
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    drop_search_triggers(conn)
+    drop_stats_triggers(conn)
+    for name in _LEGACY_TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+    # The old table is emptied in batches later (see migrate_step): dropping
+    # millions of rows at once would keep writers waiting
+    conn.execute('ALTER TABLE customers RENAME TO customers_v1')
+    conn.execute(_CREATE_VIEW_SQL)
+    conn.execute(f'''
+        CREATE TRIGGER customers_view_insert INSTEAD OF INSERT ON customers
+        BEGIN
+            {_add_contact('new')}
+            INSERT INTO customer_records (id, {_RECORD_COLUMNS})
+            VALUES (new.id, {_record_values('new', NOW_SQL)});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER customers_view_update INSTEAD OF UPDATE ON customers
+        BEGIN
+            {_add_contact('new')}
+            UPDATE customer_records SET ({_RECORD_COLUMNS}) = ({_record_values('new')})
+            WHERE id = old.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER customers_view_delete INSTEAD OF DELETE ON customers
+        BEGIN
+            DELETE FROM customer_records WHERE id = old.id;
+        END
+    ''')
+
+    if 'customers_fts' in tables:
+        create_search_triggers(conn, 'customer_records')
+    if 'customer_stats' in tables:
+        create_stats_triggers(conn, 'customer_records')
+    if 'customer_changes' in tables:
+        create_change_triggers(conn, 'customer_records')
+
+    # Never hand out an id the old table already used
+    last_id = conn.execute('''
+        SELECT max(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'customers_v1'), 0),
+                   COALESCE((SELECT MAX(id) FROM customer_records), 0))
+    ''').fetchone()[0]
+    if not conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'customer_records'",
+                        (last_id,)).rowcount:
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('customer_records', ?)",
+                     (last_id,))
+    conn.execute('DROP TABLE customer_migration')
+    conn.execute('PRAGMA user_version = 2')
+
+
+# Each version's schema change, then (if rows have to be rewritten) a
+# function that copies one batch and finishes the migration when none are
+# left. The schema change runs when the apps start; the copy runs in the
+# background (see CustomerRepository.migrate) or with customer_migrate.
+MIGRATIONS = (
+    (1, _create_customers, None),
+    (2, _start_compact_storage, _copy_rows),
+)
+
+
+def migrate_schema(conn):
+    """Bring the schema up to SCHEMA_VERSION, apart from copying rows
+
+    Each step runs in its own transaction, so several programs starting at
+    once migrate only once. A small table is copied straight away; a large
+    one stays readable and writable while migrate_step copies it.
+    Returns the schema version.
+    """
+    for version, start, copy in MIGRATIONS:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if schema_version(conn) < version and not migration_pending(conn):
+                start(conn)
+                if copy is None:
+                    conn.execute(f'PRAGMA user_version = {version}')
+                elif conn.execute('SELECT COUNT(*) FROM (SELECT 1 FROM customers LIMIT ?)',
+                                  (BATCH_SIZE,)).fetchone()[0] < BATCH_SIZE:
+                    while copy(conn, BATCH_SIZE):
+                        pass
+                    while _table_type(conn, 'customers_v1') is not None:
+                        _cleanup_rows(conn, BATCH_SIZE)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        if schema_version(conn) < version:
+            break
+    return schema_version(conn)
+
+
+def _cleanup_rows(conn, batch_size):
+    """Empty the swapped out table a piece at a time, dropping it at the end
+
+    Its indexes go first, one per call, so the row deletes after them
+    don't have to update any. Returns the number of rows deleted.
+    """
+    index = conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' "
+                         "AND tbl_name = 'customers_v1' AND sql IS NOT NULL").fetchone()
+    if index:
+        conn.execute(f'DROP INDEX {index[0]}')
+        return 0
+    deleted = conn.execute('DELETE FROM customers_v1 WHERE id IN '
+                           '(SELECT id FROM customers_v1 ORDER BY id LIMIT ?)',
+                           (batch_size,)).rowcount
+    if deleted < batch_size:
+        conn.execute('DROP TABLE customers_v1')
+    return deleted
+
+
+def migrate_step(conn, batch_size=BATCH_SIZE):
+    """Copy or clean up one batch in its own transaction
+
+    Returns (phase, rows, done up to id, last id) with phase 'copy' or
+    'cleanup', or None when there is nothing left to do.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if _table_type(conn, 'customer_migration') is not None:
+            rows = _copy_rows(conn, batch_size)
+            last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM customers').fetchone()[0]
+            position = last_id if rows == 0 else conn.execute(
+                'SELECT next_id FROM customer_migration').fetchone()[0]
+            result = ('copy', rows, position, last_id)
+        elif _table_type(conn, 'customers_v1') is not None:
+            last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM customers_v1').fetchone()[0]
+            rows = _cleanup_rows(conn, batch_size)
+            position = conn.execute('SELECT COALESCE(MIN(id) - 1, ?) FROM customers_v1',
+                                    (last_id,)).fetchone()[0] \
+                if _table_type(conn, 'customers_v1') else last_id
+            result = ('cleanup', rows, position, last_id)
+        else:
+            result = None
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return result
+
+
+def migrate_rows(conn, batch_size=BATCH_SIZE, progress=None):
+    """Run migrate_step until the migration is finished
+
+    progress, if given, is called with each step's result.
+    """
+    while True:
+        step = migrate_step(conn, batch_size)
+        if step is None:
+            return
+        if progress is not None:
+            progress(*step)
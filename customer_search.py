@@ -0,0 +1,171 @@
+import re
+import sqlite3
+
+# Columns indexed for full-text search. phone_digits holds the phone number
+# with separators removed so "5551234" finds "555-123-4567".
+SEARCH_COLUMNS = ('name', 'email', 'phone', 'address', 'phone_digits')
+
+# SQL expression that strips the separators validate_phone accepts from
+# the phone column expression {0}
+PHONE_DIGITS_SQL = ("replace(replace(replace(replace(replace({0}, "
+                     "'-', ''), ' ', ''), '(', ''), ')', ''), '.', '')")
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _trigger_values(prefix):
+    return (f"{prefix}.id, {prefix}.name, {prefix}.email, {prefix}.phone, "
+            f"{prefix}.address, {PHONE_DIGITS_SQL.format(prefix + '.phone')}")
+
+
+def ensure_search_index(conn, table='customers'):
+    """Create the FTS5 index and its sync triggers if they don't exist
+
+    `table` is the table the customers are stored in (see customer_schema).
+    Returns False when SQLite was built without FTS5, in which case callers
+    should fall back to LIKE searches.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE name = 'customers_fts'")
+    if cursor.fetchone():
+        return True
+    cursor.execute("SELECT name FROM sqlite_master WHERE name = 'customers'")
+    if cursor.fetchone() is None:
+        return False
+
+    # One transaction, so another connection never sees the index without
+    # its triggers or rows, and a second app starting at the same time
+    # waits and then finds the index made
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute("SELECT name FROM sqlite_master WHERE name = 'customers_fts'")
+        if cursor.fetchone():
+            conn.rollback()
+            return True
+        try:
+            # Contentless table: the text lives in customers, FTS only keeps the index
+            cursor.execute(f'''
+                CREATE VIRTUAL TABLE customers_fts USING fts5(
+                    {', '.join(SEARCH_COLUMNS)},
+                    content='', prefix='2 3'
+                )
+            ''')
+        except sqlite3.OperationalError:
+            conn.rollback()
+            return False
+
+        create_search_triggers(conn, table)
+
+        # Index the rows that were added before the index existed
+        index_customers(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return True
+
+
+def create_search_triggers(conn, table='customers'):
+    """Create the triggers that keep customers_fts in sync with `table`"""
+    columns = ', '.join(SEARCH_COLUMNS)
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS customers_fts_insert AFTER INSERT ON {table}
+        BEGIN
+            INSERT INTO customers_fts(rowid, {columns})
+            VALUES ({_trigger_values('new')});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS customers_fts_delete AFTER DELETE ON {table}
+        BEGIN
+            INSERT INTO customers_fts(customers_fts, rowid, {columns})
+            VALUES ('delete', {_trigger_values('old')});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS customers_fts_update AFTER UPDATE ON {table}
+        BEGIN
+            INSERT INTO customers_fts(customers_fts, rowid, {columns})
+            VALUES ('delete', {_trigger_values('old')});
+            INSERT INTO customers_fts(rowid, {columns})
+            VALUES ({_trigger_values('new')});
+        END
+    ''')
+
+
+def drop_search_triggers(conn):
+    """Drop the sync triggers, e.g. while bulk loading rows"""
+    for name in ('customers_fts_insert', 'customers_fts_delete', 'customers_fts_update'):
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+def index_customers(conn, after_id=0):
+    """Add customers with an id above `after_id` to the search index"""
+    conn.execute(f'''
+        INSERT INTO customers_fts(rowid, {', '.join(SEARCH_COLUMNS)})
+        SELECT {_trigger_values('customers')} FROM main.customers WHERE id > ?
+    ''', (after_id,))
+
+
+def build_match_query(term, columns=None):
+    """Turn free text into an FTS5 prefix query, or None if it has no words
+
+    Every word must match the start of a token, e.g. "jo sm" finds
+    "John Smith". `columns` restricts the match to some of SEARCH_COLUMNS.
+    """
+    words = _TOKEN_RE.findall(term.lower())
+    if not words:
+        return None
+    query = ' '.join(f'"{word}"*' for word in words)
+    if columns:
+        query = f"{{{' '.join(columns)}}} : ({query})"
+    return query
+
+
+def search_filter(term, columns=None, id_range=None):
+    """Return a (where, params) pair restricting customers to search matches
+
+    With an id_range of (low, high) only that slice of the index is read
+    (see customer_parallel).
+    """
+    query = build_match_query(term, columns)
+    if query is None:
+        return '', ()
+    if id_range is not None:
+        return ('id IN (SELECT rowid FROM customers_fts WHERE customers_fts MATCH ? '
+                'AND rowid BETWEEN ? AND ?)', (query,) + tuple(id_range))
+    return ('id IN (SELECT rowid FROM customers_fts WHERE customers_fts MATCH ?)',
+            (query,))
+
+
+def search_ids(conn, term, limit=None, columns=None):
+    """Return matching customer ids, best match first"""
+    query = build_match_query(term, columns)
+    if query is None:
+        return []
+    sql = 'SELECT rowid FROM customers_fts WHERE customers_fts MATCH ? ORDER BY rank'
+    params = (query,)
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params += (limit,)
+    return [row[0] for row in conn.execute(sql, params)]
+
+
+def search_customers(conn, term, limit=None, columns=None):
+    """Return full customer rows matching the search, best match first"""
+    query = build_match_query(term, columns)
+    if query is None:
+        return []
+    sql = '''
+        SELECT c.id, c.name, c.birthday, c.email, c.phone, c.address,
+               c.preferred_contact, c.date_added
+        FROM customers_fts
+        JOIN customers c ON c.id = customers_fts.rowid
+        WHERE customers_fts MATCH ?
+        ORDER BY customers_fts.rank
+    '''
+    params = (query,)
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params += (limit,)
+    return conn.execute(sql, params).fetchall()
@@ -0,0 +1,169 @@
+from datetime import date
+
+# What the summary counts customers by, and the SQL that gives each
+# customer's key from a row of the customers table or view (see
+# customer_schema). birth_date is the ISO birthday.
+STAT_KEYS = {
+    'contact': '{0}.preferred_contact',
+    'day': 'date({0}.date_added)',
+    'domain': "lower(substr({0}.email, instr({0}.email, '@') + 1))",
+    'birthday': '{0}.birth_date',
+}
+
+# Triggers on customer_records see the contact method's id, not its name,
+# and fire on updates of the stored columns behind the keys
+_TRIGGER_KEYS = {
+    'customers': (STAT_KEYS, 'preferred_contact, date_added, email, birthday'),
+    'customer_records': (
+        dict(STAT_KEYS, contact='(SELECT name FROM contact_methods WHERE id = {0}.contact_id)'),
+        'contact_id, added_at, email, birth_date'),
+}
+
+# Age buckets as (label, lowest age, highest age)
+AGE_BUCKETS = (('Under 18', 0, 17), ('18-24', 18, 24), ('25-34', 25, 34),
+               ('35-44', 35, 44), ('45-54', 45, 54), ('55-64', 55, 64),
+               ('65+', 65, None))
+
+RECENT_DAYS = 14     # days with signups shown in the summary
+RECENT_WEEKS = 12
+TOP_DOMAINS = 10
+
+_TRIGGERS = ('customer_stats_insert', 'customer_stats_delete', 'customer_stats_update')
+
+
+def _upserts(keys, prefix, change):
+    return ''.join(f'''
+            INSERT INTO customer_stats (kind, key, count)
+            VALUES ('{kind}', coalesce({expression.format(prefix)}, ''), {change})
+            ON CONFLICT (kind, key) DO UPDATE SET count = count + {change};'''
+                   for kind, expression in keys.items())
+
+
+def ensure_stats(conn, table='customers'):
+    """Create the summary counts and the triggers that keep them current
+
+    `table` is the table the customers are stored in. Returns False when
+    customers doesn't exist yet or lacks the birth_date column.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE name = 'customer_stats'")
+    if cursor.fetchone():
+        return True
+    columns = {row[1] for row in cursor.execute('PRAGMA table_xinfo(customers)')}
+    if 'birth_date' not in columns:
+        return False
+
+    conn.execute('''
+        CREATE TABLE customer_stats (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (kind, key)
+        ) WITHOUT ROWID
+    ''')
+    create_stats_triggers(conn, table)
+
+    # Count the rows that were added before the table existed
+    add_stats(conn)
+    conn.commit()
+    return True
+
+
+def create_stats_triggers(conn, table='customers'):
+    """Create the triggers that update customer_stats row by row"""
+    keys, columns = _TRIGGER_KEYS[table]
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS customer_stats_insert AFTER INSERT ON {table}
+        BEGIN{_upserts(keys, 'new', 1)}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS customer_stats_delete AFTER DELETE ON {table}
+        BEGIN{_upserts(keys, 'old', -1)}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS customer_stats_update
+        AFTER UPDATE OF {columns} ON {table}
+        BEGIN{_upserts(keys, 'old', -1)}{_upserts(keys, 'new', 1)}
+        END
+    ''')
+
+
+def drop_stats_triggers(conn):
+    """Drop the triggers, e.g. while bulk loading rows"""
+    for name in _TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+def add_stats(conn, after_id=0):
+    """Count customers with an id above `after_id` into customer_stats"""
+    selects = ' UNION ALL '.join(
+        f"SELECT '{kind}', coalesce({expression.format('customers')}, ''), COUNT(*) "
+        f"FROM main.customers WHERE id > :after_id GROUP BY 2"
+        for kind, expression in STAT_KEYS.items())
+    # "WHERE true" keeps SQLite from reading ON CONFLICT as a join clause
+    conn.execute(f'''
+        INSERT INTO customer_stats (kind, key, count)
+        SELECT * FROM ({selects}) WHERE true
+        ON CONFLICT (kind, key) DO UPDATE SET count = count + excluded.count
+    ''', {'after_id': after_id})
+
+
+def rebuild_stats(conn):
+    """Recount everything from the customers table"""
+    conn.execute('DELETE FROM customer_stats')
+    add_stats(conn)
+
+
+def _counts(conn, kind, order='count DESC, key', limit=None):
+    sql = f'SELECT key, count FROM customer_stats WHERE kind = ? AND count > 0 ORDER BY {order}'
+    if limit is not None:
+        sql += f' LIMIT {int(limit)}'
+    return conn.execute(sql, (kind,)).fetchall()
+
+
+def age_buckets(conn, today=None):
+    """Return (label, count) for AGE_BUCKETS, ages as of today"""
+    today = (today or date.today()).isoformat()
+    counts = {label: 0 for label, _, _ in AGE_BUCKETS}
+    # One row per distinct age, from one row per distinct birthday
+    for age, count in conn.execute('''
+            SELECT CAST(substr(:today, 1, 4) AS INTEGER) - CAST(substr(key, 1, 4) AS INTEGER)
+                   - (substr(:today, 6) < substr(key, 6)) AS age, SUM(count)
+            FROM customer_stats
+            WHERE kind = 'birthday' AND count > 0
+              AND key GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+            GROUP BY age
+        ''', {'today': today}):
+        for label, low, high in AGE_BUCKETS:
+            if age >= low and (high is None or age <= high):
+                counts[label] += count
+                break
+    return list(counts.items())
+
+
+def summary(conn, today=None):
+    """Dashboard numbers, read from customer_stats in O(groups)"""
+    contact = _counts(conn, 'contact')
+    domains = _counts(conn, 'domain')
+    top_domains = domains[:TOP_DOMAINS]
+    other = sum(count for _, count in domains[TOP_DOMAINS:])
+    if other:
+        top_domains.append(('(other)', other))
+
+    daily = _counts(conn, 'day', order='key DESC', limit=RECENT_DAYS)
+    weekly = conn.execute('''
+        SELECT date(key, 'weekday 0', '-6 days') AS week, SUM(count)
+        FROM customer_stats WHERE kind = 'day' AND count > 0
+        GROUP BY week ORDER BY week DESC LIMIT ?
+    ''', (RECENT_WEEKS,)).fetchall()
+
+    return {
+        'total': sum(count for _, count in contact),
+        'contact': contact,
+        'signups_daily': daily[::-1],
+        'signups_weekly': weekly[::-1],
+        'age_buckets': age_buckets(conn, today),
+        'email_domains': top_domains,
+    }
@@ -0,0 +1,201 @@
+import re
+import sys
+from datetime import date
+from functools import lru_cache
+
+CONTACT_METHODS = ('Email', 'Phone', 'Mail')
+FIELDS = ('name', 'birthday', 'email', 'phone', 'address', 'preferred_contact')
+
+# Error messages, in the order the entry form checks them
+MESSAGES = {
+    'required': "All fields are required!",
+    'birthday': "Invalid birthday format. Use MM/DD/YYYY",
+    'email': "Invalid email format!",
+    'phone': "Invalid phone number. Use 10 digits (e.g., xxx-xxx-xxxx)",
+    'preferred_contact': "Preferred contact must be Email, Phone or Mail",
+}
+
+EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+DATE_RE = re.compile(r'(\d{1,2})/(\d{1,2})/(\d{4})', re.ASCII)
+PHONE_SEPARATORS_RE = re.compile(r'[\s\-\(\)\.]')
+
+_CONTACT_LOOKUP = {method.lower(): method for method in CONTACT_METHODS}
+
+
+def validate_email(email):
+    """Validate email format"""
+    return EMAIL_RE.match(email) is not None
+
+
+@lru_cache(maxsize=65536)
+def parse_date(date_str):
+    """Parse MM/DD/YYYY into a date, or None if invalid (cached)"""
+    match = DATE_RE.fullmatch(date_str)
+    if match is None:
+        return None
+    month, day, year = map(int, match.groups())
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def validate_date(date_str):
+    """Validate date format (MM/DD/YYYY)"""
+    return parse_date(date_str) is not None
+
+
+def phone_digits(phone):
+    """Return the phone number with common separators removed"""
+    return PHONE_SEPARATORS_RE.sub('', phone)
+
+
+def validate_phone(phone):
+    """Validate phone format (accepts various formats)"""
+    cleaned = phone_digits(phone)
+    # Check if it's 10 digits
+    return len(cleaned) == 10 and cleaned.isdigit()
+
+
+def normalize_contact(value):
+    """Return the canonical contact method for any casing, or None"""
+    return _CONTACT_LOOKUP.get(str(value).strip().lower())
+
+
+def validate_customer(name, birthday, email, phone, address, preferred_contact):
+    """Return the entry form's error message for a customer, or None if valid"""
+    if not all([name, birthday, email, phone, address, preferred_contact]):
+        return MESSAGES['required']
+    if not validate_date(birthday):
+        return MESSAGES['birthday']
+    if not validate_email(email):
+        return MESSAGES['email']
+    if not validate_phone(phone):
+        return MESSAGES['phone']
+    if normalize_contact(preferred_contact) is None:
+        return MESSAGES['preferred_contact']
+    return None
+
+
+# Batch validation -----------------------------------------------------------
+
+# NumPy and pandas are never imported here (pandas alone takes longer than
+# starting the apps): a caller passing their arrays has already loaded them
+
+def _is_series(values):
+    pd = sys.modules.get('pandas')
+    return pd is not None and isinstance(values, pd.Series)
+
+
+def _is_array(values):
+    np = sys.modules.get('numpy')
+    return np is not None and isinstance(values, np.ndarray)
+
+
+def _strings(values):
+    """An array or Series as text, with missing values (None, NaN) as ''
+
+    A plain astype(str) would turn them into 'None' and 'nan', which pass
+    the required check.
+    """
+    if _is_series(values):
+        return values.where(values.notna(), '').astype(str)
+    np = sys.modules['numpy']
+    if values.dtype.kind in 'US':
+        return values.astype(str)
+    if values.dtype.kind == 'f':
+        missing = np.isnan(values)
+    else:
+        # NaN is the one value that isn't equal to itself
+        missing = np.equal(values, None) | (values != values)
+    return np.where(missing, '', values.astype(str))
+
+
+def _apply(values, check):
+    """Run check over a column, once per distinct value for array input"""
+    if _is_series(values):
+        values = _strings(values)
+        uniques = values.unique()
+        results = {value: check(value) for value in uniques}
+        return values.map(results).to_numpy(dtype=bool)
+    if _is_array(values):
+        np = sys.modules['numpy']
+        uniques, inverse = np.unique(_strings(values), return_inverse=True)
+        results = np.fromiter((check(value) for value in uniques), dtype=bool,
+                              count=len(uniques))
+        return results[inverse]
+    return [check(value) for value in values]
+
+
+def _email_mask(values):
+    if _is_series(values):
+        return _strings(values).str.match(EMAIL_RE).to_numpy(dtype=bool)
+    return _apply(values, validate_email)
+
+
+def _phone_mask(values):
+    if _is_series(values):
+        cleaned = _strings(values).str.replace(PHONE_SEPARATORS_RE, '', regex=True)
+        return ((cleaned.str.len() == 10) & cleaned.str.isdigit()).to_numpy(dtype=bool)
+    return _apply(values, validate_phone)
+
+
+def _reasons(mask, message):
+    if _is_array(mask):
+        return sys.modules['numpy'].where(mask, None, message).tolist()
+    return [None if ok else message for ok in mask]
+
+
+def validate_emails(values):
+    """Validate a column of emails, returning (mask, reasons)"""
+    mask = _email_mask(values)
+    return mask, _reasons(mask, MESSAGES['email'])
+
+
+def validate_dates(values):
+    """Validate a column of MM/DD/YYYY dates, returning (mask, reasons)"""
+    mask = _apply(values, validate_date)
+    return mask, _reasons(mask, MESSAGES['birthday'])
+
+
+def validate_phones(values):
+    """Validate a column of phone numbers, returning (mask, reasons)"""
+    mask = _phone_mask(values)
+    return mask, _reasons(mask, MESSAGES['phone'])
+
+
+def validate_customers(columns):
+    """Validate customers given as columns (a dict of field -> values)
+
+    Returns (mask, reasons): mask[i] is True when row i passes every check,
+    and reasons[i] is the first error the entry form would have shown, or
+    None. The mask is a NumPy array when any column is a NumPy array or
+    pandas Series, and a list otherwise.
+    """
+    size = len(columns[FIELDS[0]])
+    checks = [
+        ('required', [_apply(columns[field], bool) for field in FIELDS]),
+        ('birthday', [_apply(columns['birthday'], validate_date)]),
+        ('email', [_email_mask(columns['email'])]),
+        ('phone', [_phone_mask(columns['phone'])]),
+        ('preferred_contact',
+         [_apply(columns['preferred_contact'],
+                 lambda value: normalize_contact(value) is not None)]),
+    ]
+
+    if any(_is_series(c) or _is_array(c) for c in columns.values()):
+        # Whole-column operations: the first failed check of each row wins
+        np = sys.modules['numpy']
+        failed = [~np.asarray(mask, dtype=bool) for _, masks in checks for mask in masks]
+        messages = [MESSAGES[key] for key, masks in checks for _ in masks]
+        reasons = np.select(failed, messages, default=None)
+        return np.equal(reasons, None), reasons.tolist()
+
+    reasons = [None] * size
+    for key, masks in checks:
+        message = MESSAGES[key]
+        for mask in masks:
+            for i, ok in enumerate(mask):
+                if not ok and reasons[i] is None:
+                    reasons[i] = message
+    return [reason is None for reason in reasons], reasons
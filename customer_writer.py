@@ -0,0 +1,176 @@
+import csv
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from customer_db import CustomerRepository
+from customer_validation import FIELDS
+
+BATCH_SIZE = 50       # rows committed together at most
+FLUSH_MS = 200        # longest a row waits for others to share its commit
+MAX_QUEUE = 1000      # submits beyond this are refused instead of blocking
+MAX_RETRIES = 5       # attempts when the database stays busy
+CLOSE_TIMEOUT = 10    # seconds close() waits for the queued rows
+UNSAVED_FILE = 'unsaved_customers.csv'   # next to the database, see save_unsaved
+
+_STOP = object()
+
+
+class WriteQueueFull(Exception):
+    """Raised by submit() when the writer is too far behind"""
+
+
+def _is_busy(error):
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+class BatchWriter:
+    """Insert customers on a background thread, grouping rows per commit
+
+    submit() returns at once. Rows are committed together once BATCH_SIZE
+    are waiting or FLUSH_MS has passed since the first one. After the
+    COMMIT, each row's callback(customer_id, error) runs on the writer
+    thread, so GUI callers should hand the result to the Tk thread.
+    Rows that fail are also kept in `failed` as (row, error) pairs.
+    """
+
+    def __init__(self, db_path=None, batch_size=BATCH_SIZE, flush_ms=FLUSH_MS,
+                 max_queue=MAX_QUEUE, max_retries=MAX_RETRIES, repo=None):
+        self.repo = repo or CustomerRepository(db_path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self.max_retries = max_retries
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.failed = []
+        self._batch = None        # rows being written right now
+        self._abandoned = False   # set when close() gave up waiting
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, row, callback=None):
+        """Queue a (name, birthday, email, phone, address, preferred_contact) row"""
+        try:
+            self._queue.put_nowait((tuple(row), callback))
+        except queue.Full:
+            raise WriteQueueFull("Too many customers waiting to be saved") from None
+
+    def pending(self):
+        """Number of rows submitted but not yet committed"""
+        return self._queue.unfinished_tasks
+
+    def flush(self):
+        """Block until every submitted row has been committed or failed"""
+        self._queue.join()
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """Commit what is queued and stop the writer thread
+
+        Waits at most `timeout` seconds, so a database that stays locked
+        can't hang the caller. Returns the (row, error) pairs of the rows
+        that weren't saved: those whose commit failed, and those still
+        waiting when the time ran out.
+        """
+        deadline = time.monotonic() + timeout
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(max(deadline - time.monotonic(), 0))
+        unsaved = list(self.failed)
+        if not self._thread.is_alive():
+            return unsaved
+
+        # Stop retrying and hand back whatever is left
+        self._abandoned = True
+        batch = self._batch
+        if batch:
+            error = TimeoutError("Still being saved when the writer closed; "
+                                 "check for it before adding it again")
+            unsaved.extend((row, error) for row, _ in batch)
+        error = TimeoutError(f"Not saved within {timeout}s of closing")
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                unsaved.append((item[0], error))
+            self._queue.task_done()
+        self._queue.put_nowait(_STOP)
+        return unsaved
+
+    def _run(self):
+        stopping = False
+        while not stopping and not self._abandoned:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+            self._batch = batch
+            self._write(batch)
+            self._batch = None
+
+    def _write(self, batch):
+        rows = [row for row, _ in batch]
+        ids, error = None, None
+        for attempt in range(self.max_retries):
+            if self._abandoned:
+                error = TimeoutError("Not saved before the writer closed")
+                break
+            try:
+                ids = self.repo.add_customers(rows)
+                break
+            except sqlite3.OperationalError as e:
+                error = e
+                if not _is_busy(e):
+                    break
+                time.sleep(0.05 * 2 ** attempt)
+            except sqlite3.Error as e:
+                error = e
+                break
+
+        if ids is None:
+            self.failed.extend((row, error) for row, _ in batch)
+        for i, (row, callback) in enumerate(batch):
+            if callback is not None:
+                try:
+                    if ids is not None:
+                        callback(ids[i], None)
+                    else:
+                        callback(None, error)
+                except Exception:
+                    pass
+            self._queue.task_done()
+
+
+def save_unsaved(unsaved, path):
+    """Append (row, error) pairs from close() to a CSV file
+
+    The file has the importer's columns, so the rows can be added later
+    with customer_import. Returns the path.
+    """
+    new = not os.path.exists(path)
+    with open(path, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        if new:
+            writer.writerow(FIELDS + ('error',))
+        writer.writerows(list(row) + [str(error)] for row, error in unsaved)
+    return path
@@ -1,18 +1,98 @@
+import time
+# Startup time is measured from here, before the GUI and database modules load
+STARTED = time.perf_counter()
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
+import queue
 import sqlite3
+import threading
+from customer_cache import get_cache, query_key
+from customer_changes import ChangeTracker
+from customer_db import COLUMNS, CustomerRepository, include_archives, set_include_archives
+from customer_export import ExportCancelled, available_formats, export_customers
+from customer_metrics import is_enabled, record_operation, status_line, timed
+from customer_paging import CustomerPager
+from customer_parallel import count as parallel_count, worth_parallel
+from customer_rowstore import CustomerStore
+from customer_search import search_filter, search_ids
+from customer_validation import CONTACT_METHODS
+from search_worker import QueryWorker
+
+# Extra rows fetched beyond the visible ones so short scrolls don't query
+OVERSCAN = 20
+
+# Search index columns the search box looks in
+SEARCH_COLUMNS = ('name', 'email', 'phone', 'phone_digits')
+
+# How often finished background searches are checked for (ms)
+SEARCH_POLL_MS = 50
+
+# Search results inserted into the Treeview per Tk event loop turn
+INSERT_CHUNK = 500
+
+# How often the database is checked for commits from other programs (ms)
+CHANGE_POLL_MS = 1000
+
+# Contact choice in the batch update dialog that leaves the field alone
+UNCHANGED = '(unchanged)'
+
+# Treeview headings and the database columns they show
+HEADING_COLUMNS = dict(zip(
+    ('ID', 'Name', 'Birthday', 'Email', 'Phone', 'Address', 'Contact', 'Date Added'),
+    COLUMNS))
 
 class CustomerDatabaseViewer:
-    def __init__(self, root):
+    def __init__(self, root, virtual=True, search_debounce_ms=250, db_path=None,
+                 parallel=None, fast_start=False, started=None):
         self.root = root
+        self.repo = CustomerRepository(db_path)
         self.root.title("Customer Database Viewer")
         self.root.geometry("1000x600")
         
+        # Virtual mode keeps only the visible rows in the Treeview
+        self.virtual = virtual
+        # Count search matches on several processes (None: when the table is big)
+        self.parallel = parallel
+        # Fast start (virtual mode) shows the first page before counting rows
+        # or upgrading the schema; startup_seconds is the time until then
+        self.fast_start = fast_start and virtual
+        self.started = time.perf_counter() if started is None else started
+        self.startup_seconds = None
+        self.count_worker = None
+        self.pager = None
+        self.top_row = 0
+        self.visible_rows = 20
+        self.has_search_index = False
+        self.shown_generation = None
+        
+        self.export_thread = None
+        self.export_cancelled = False
+        self.tracker = None
+        self.migration_thread = None
+        self.store = None
+        
+        # Repeated searches and detail lookups are answered from memory
+        self.cache = get_cache(self.repo.db_path)
+        self.detail_windows = {}
+        
+        # Current sort; the default view is newest first
+        self.sort_by = 'id'
+        self.sort_descending = True
+        
+        # Searches run on a worker thread; results are polled with after()
+        self.search_worker = QueryWorker(self.repo.db_path, search_debounce_ms)
+        self.search_started = None
+        self.root.after(SEARCH_POLL_MS, self.poll_search)
+        self.root.after(SEARCH_POLL_MS, self.poll_count)
+        
         # Create GUI
         self.create_gui()
         
         # Load data on startup
         self.load_data()
+        
+        # Pick up rows written by the entry form without a full reload
+        self.root.after(CHANGE_POLL_MS, self.poll_changes)
     
     def create_gui(self):
         """Create the graphical user interface"""
@@ -36,7 +116,7 @@ class CustomerDatabaseViewer:
         title_label.pack(side=tk.LEFT)
         
         # Refresh button
-        refresh_btn = ttk.Button(top_frame, text="Refresh", command=self.load_data)
+        refresh_btn = ttk.Button(top_frame, text="Refresh", command=self.refresh_data)
         refresh_btn.pack(side=tk.RIGHT, padx=5)
         
         # Search frame
@@ -74,9 +154,23 @@ class CustomerDatabaseViewer:
             self.tree.column(col, width=column_widths[col], minwidth=50)
         
         # Scrollbars
-        vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
         hsb = ttk.Scrollbar(tree_frame, orient="horizontal", command=self.tree.xview)
-        self.tree.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
+        self.tree.configure(xscrollcommand=hsb.set)
+        if self.virtual:
+            # The vertical scrollbar tracks the position in the whole table
+            vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=self.on_vscroll)
+            self.tree.bind('<Up>', self.on_arrow_key)
+            self.tree.bind('<Down>', self.on_arrow_key)
+            self.tree.bind('<MouseWheel>', self.on_mousewheel)
+            self.tree.bind('<Button-4>', self.on_mousewheel)
+            self.tree.bind('<Button-5>', self.on_mousewheel)
+            self.tree.bind('<Prior>', lambda e: self.scroll_rows(-self.visible_rows))
+            self.tree.bind('<Next>', lambda e: self.scroll_rows(self.visible_rows))
+            self.tree.bind('<Configure>', self.on_tree_resize)
+        else:
+            vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
+            self.tree.configure(yscrollcommand=vsb.set)
+        self.vsb = vsb
         
         # Grid layout for treeview and scrollbars
         self.tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
@@ -86,9 +180,19 @@ class CustomerDatabaseViewer:
         tree_frame.columnconfigure(0, weight=1)
         tree_frame.rowconfigure(0, weight=1)
         
-        # Status bar
-        self.status_label = ttk.Label(main_frame, text="", relief=tk.SUNKEN, anchor=tk.W)
-        self.status_label.grid(row=2, column=0, sticky=(tk.W, tk.E), pady=(10, 0))
+        # Status bar, with the result cache's hit rate on the right
+        status_frame = ttk.Frame(main_frame, relief=tk.SUNKEN)
+        status_frame.grid(row=2, column=0, sticky=(tk.W, tk.E), pady=(10, 0))
+        self.status_label = ttk.Label(status_frame, text="", anchor=tk.W)
+        self.status_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.cache_label = ttk.Label(status_frame, text="", anchor=tk.E, foreground='gray')
+        self.cache_label.pack(side=tk.RIGHT, padx=(10, 2))
+        
+        # Query and operation timings, only with CUSTOMER_METRICS set
+        self.metrics_label = None
+        if is_enabled():
+            self.metrics_label = ttk.Label(main_frame, text="", anchor=tk.E, foreground='gray')
+            self.metrics_label.grid(row=4, column=0, sticky=(tk.W, tk.E), pady=(5, 0))
         
         # Button frame
         button_frame = ttk.Frame(main_frame)
@@ -98,38 +202,53 @@ class CustomerDatabaseViewer:
                   command=self.view_details).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Delete Selected", 
                   command=self.delete_record).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Update Selected...", 
+                  command=self.update_records).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Export to Text", 
                   command=self.export_to_text).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Export...", 
+                  command=self.export_data).pack(side=tk.LEFT, padx=5)
+        
+        # Export progress, only shown while an export runs
+        self.export_frame = ttk.Frame(button_frame)
+        self.export_progress = ttk.Progressbar(self.export_frame, length=150,
+                                               mode='determinate', maximum=100)
+        self.export_progress.pack(side=tk.LEFT)
+        ttk.Button(self.export_frame, text="Cancel", 
+                  command=self.cancel_export).pack(side=tk.LEFT, padx=(5, 0))
         
         # Alternating row colors
         self.tree.tag_configure('oddrow', background='#E8E8E8')
         self.tree.tag_configure('evenrow', background='#FFFFFF')
     
+    @timed('load')
     def load_data(self):
         """Load all customer data from database"""
-        # Clear existing data
+        if self.virtual:
+            self.load_virtual()
+            return
+        
+        # Clear existing data and stop any search results still being inserted
+        self.shown_generation = None
         for item in self.tree.get_children():
             self.tree.delete(item)
         
         try:
-            conn = sqlite3.connect('customer_data.db')
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT * FROM customers ORDER BY id DESC')
-            rows = cursor.fetchall()
-            
-            # Store all data for filtering
-            self.all_data = rows
+            self.upgrade_schema()
+            self.start_change_tracking()
+            # Keep every row in memory, column by column, for filtering and sorting
+            with self.repo.pool.connection() as conn:
+                self.store = CustomerStore.load(conn, self.sort_by, self.sort_descending)
+            store = self.store
             
             # Insert data into treeview
-            for idx, row in enumerate(rows):
+            for idx, slot in enumerate(store.order):
                 tag = 'evenrow' if idx % 2 == 0 else 'oddrow'
-                self.tree.insert('', tk.END, values=row, tags=(tag,))
+                row = store.row(slot)
+                self.tree.insert('', tk.END, iid=str(row[0]), values=row, tags=(tag,))
             
             # Update status
-            self.status_label.config(text=f"Total records: {len(rows)}")
-            
-            conn.close()
+            self.status_label.config(text=f"Total records: {len(store)}")
             
         except sqlite3.Error as e:
             messagebox.showerror("Database Error", f"Error loading data: {str(e)}")
@@ -138,45 +257,439 @@ class CustomerDatabaseViewer:
                                   "customer_data.db file not found. Please run the main application first.")
             self.status_label.config(text="Database file not found")
     
-    def filter_data(self, *args):
-        """Filter displayed data based on search term"""
-        search_term = self.search_var.get().lower()
+    def load_virtual(self):
+        """Reset the pager and show the rows at the current position"""
+        try:
+            if self.pager is None:
+                self.pager = CustomerPager(self.repo.db_path,
+                                           max_cached=2 * (self.visible_rows + OVERSCAN) + 200)
+                if self.fast_start:
+                    self.start_fast()
+                    return
+                self.upgrade_schema()
+            self.start_change_tracking()
+            self.pager.reset()
+            self.render_window()
+        except sqlite3.Error as e:
+            messagebox.showerror("Database Error", f"Error loading data: {str(e)}")
+    
+    def start_fast(self):
+        """Show the first page now, with the id range standing in for the count
+        
+        The schema upgrade and the exact count run once the window is up.
+        """
+        # The change log has to exist before tracking starts; databases
+        # from older versions or customer_import may not have one yet
+        self.repo.ensure_change_log()
+        self.start_change_tracking()
+        self.pager.estimate_count()
+        self.render_window()
+        self.startup_seconds = time.perf_counter() - self.started
+        record_operation('startup', self.startup_seconds)
+        self.root.after_idle(self.finish_startup)
+    
+    def finish_startup(self):
+        """The work fast start put off: schema upgrade and the exact row count"""
+        try:
+            self.upgrade_schema()
+        except sqlite3.Error as e:
+            messagebox.showerror("Database Error", f"Error upgrading database: {str(e)}")
+        if self.count_worker is None:
+            self.count_worker = QueryWorker(self.repo.db_path, debounce_ms=0)
+        self.count_worker.submit(
+            lambda conn, cancelled: conn.execute('SELECT COUNT(*) FROM customers').fetchone()[0])
+    
+    def poll_count(self):
+        """Replace the estimated row count once the background count is done"""
+        finished = self.count_worker.poll() if self.count_worker is not None else None
+        if finished is not None:
+            generation, count, error = finished
+            self.count_worker.close()
+            self.count_worker = None
+            # A search started meanwhile has counted its own rows
+            if error is None and self.pager.count_estimated and not self.pager.where:
+                self.pager.set_count(count)
+                self.render_window()
+        self.root.after(SEARCH_POLL_MS, self.poll_count)
+    
+    def upgrade_schema(self):
+        """Bring the schema up to date and finish any migration in the background"""
+        # The full-text index only covers live customers, not archived ones
+        self.has_search_index = self.repo.upgrade_schema() and not include_archives()
+        if self.migration_thread is None or not self.migration_thread.is_alive():
+            self.migration_thread = self.repo.start_migration()
+    
+    def start_change_tracking(self):
+        """Remember the database state that the next refresh compares against"""
+        if self.tracker is None:
+            self.tracker = ChangeTracker(self.repo.db_path)
+        self.tracker.start()
+    
+    def poll_changes(self):
+        """Refresh when another connection has committed (cheap PRAGMA check)"""
+        try:
+            if self.tracker is not None and self.tracker.has_changed():
+                self.refresh_data()
+        except sqlite3.Error:
+            pass
+        self.cache_label.config(text=self.cache.status_line())
+        if self.metrics_label is not None:
+            self.metrics_label.config(text=status_line())
+        self.root.after(CHANGE_POLL_MS, self.poll_changes)
+    
+    @timed('refresh')
+    def refresh_data(self):
+        """Apply only the rows inserted, updated or deleted since the last refresh"""
+        if self.tracker is None:
+            self.load_data()
+            return
+        try:
+            changes = self.tracker.fetch_changes()
+        except sqlite3.Error as e:
+            messagebox.showerror("Database Error", f"Error refreshing data: {str(e)}")
+            return
+        if not changes:
+            return
+        # Classic searches filter the row store, so their cached results go with it
+        self.cache.discard(changes.deleted | {row[0] for row in changes.updated})
+        
+        if self.virtual:
+            # Only the visible window is in the Treeview: drop the cached
+            # pages and re-render at the same position
+            if self.pager.where:
+                self.pager.invalidate()
+            else:
+                self.pager.invalidate(len(changes.inserted) - len(changes.deleted))
+            self.render_window()
+        else:
+            self.apply_changes(changes)
+    
+    def apply_changes(self, changes):
+        """Patch the row store and the Treeview in place with a ChangeSet"""
+        store = self.store
+        if store is None:
+            return
         
-        # Clear existing data
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+        # Updated rows are taken out and put back since their position may change
+        changed = changes.updated + changes.inserted
+        store.discard(changes.deleted | {row[0] for row in changed})
+        for row in changed:
+            store.put(row)
         
-        if not hasattr(self, 'all_data'):
+        if self.search_var.get():
+            # Let the background search decide which of the changed rows match
+            self.filter_data()
             return
         
-        # Filter and display data
-        filtered_count = 0
-        for idx, row in enumerate(self.all_data):
+        deleted = [str(customer_id) for customer_id in changes.deleted
+                   if self.tree.exists(str(customer_id))]
+        if deleted:
+            self.tree.delete(*deleted)
+        
+        # Changed items are detached, then put back in order of their final
+        # position, so each goes straight to its place; existing items keep
+        # their selection
+        placed = sorted(zip(store.positions(store.slot_of(row[0]) for row in changed), changed))
+        iids = [str(row[0]) for row in changed if self.tree.exists(str(row[0]))]
+        if iids:
+            self.tree.detach(*iids)
+        for position, row in placed:
+            iid = str(row[0])
+            if self.tree.exists(iid):
+                self.tree.move(iid, '', position)
+                self.tree.item(iid, values=row)
+            else:
+                self.tree.insert('', position, iid=iid, values=row)
+        
+        first_changed = 0 if deleted or not placed else placed[0][0]
+        self.restripe(first_changed)
+        self.status_label.config(text=f"Total records: {len(store)}")
+    
+    def restripe(self, start=0, items=None):
+        """Fix alternating row colors from a position on, a chunk per event loop turn"""
+        if items is None:
+            items = self.tree.get_children()
+        end = min(start + INSERT_CHUNK, len(items))
+        for idx in range(start, end):
+            self.tree.item(items[idx], tags=('evenrow' if idx % 2 == 0 else 'oddrow',))
+        if end < len(items):
+            self.root.after(1, self.restripe, end, items)
+    
+    def render_window(self):
+        """Show the rows at the current scroll position in the Treeview"""
+        total = self.pager.count()
+        self.top_row = max(0, min(self.top_row, total - self.visible_rows))
+        rows = self.pager.rows_at(self.top_row, self.visible_rows + OVERSCAN)
+        
+        selected = set(self.tree.selection())
+        children = self.tree.get_children()
+        if children:
+            self.tree.delete(*children)
+        for idx, row in enumerate(rows[:self.visible_rows]):
+            position = self.top_row + idx
+            tag = 'evenrow' if position % 2 == 0 else 'oddrow'
+            self.tree.insert('', tk.END, iid=str(row[0]), values=row, tags=(tag,))
+        
+        still_shown = [iid for iid in selected if self.tree.exists(iid)]
+        if still_shown:
+            self.tree.selection_set(still_shown)
+        
+        # Scrollbar reflects the position within the whole result
+        if total:
+            first = self.top_row / total
+            last = min(1.0, (self.top_row + self.visible_rows) / total)
+        else:
+            first, last = 0.0, 1.0
+        self.vsb.set(first, last)
+        
+        shown = min(self.visible_rows, len(rows))
+        if self.pager.count_estimated:
+            total = f"~{total}"
+        if self.search_var.get():
+            self.status_label.config(
+                text=f"Showing {self.top_row + 1 if shown else 0}-{self.top_row + shown} "
+                     f"of {total} matching records")
+        else:
+            self.status_label.config(
+                text=f"Total records: {total} (showing {self.top_row + 1 if shown else 0}-"
+                     f"{self.top_row + shown})")
+    
+    def scroll_rows(self, delta):
+        """Move the visible window by a number of rows"""
+        if self.pager is None:
+            return 'break'
+        self.top_row += delta
+        self.render_window()
+        return 'break'
+    
+    def on_vscroll(self, action, amount, unit=None):
+        """Handle scrollbar drags, arrows and trough clicks"""
+        if self.pager is None:
+            return
+        if action == 'moveto':
+            self.top_row = int(float(amount) * self.pager.count())
+            self.render_window()
+        elif action == 'scroll':
+            step = self.visible_rows if unit == 'pages' else 1
+            self.scroll_rows(int(amount) * step)
+    
+    def on_mousewheel(self, event):
+        """Scroll the virtual window with the mouse wheel"""
+        if event.num == 4 or event.delta > 0:
+            return self.scroll_rows(-3)
+        return self.scroll_rows(3)
+    
+    def on_arrow_key(self, event):
+        """Scroll when the keyboard selection moves past the visible rows"""
+        items = self.tree.get_children()
+        focus = self.tree.focus()
+        if not items or focus not in items:
+            return None
+        if event.keysym == 'Up' and focus == items[0] and self.top_row > 0:
+            self.scroll_rows(-1)
+        elif event.keysym == 'Down' and focus == items[-1]:
+            self.scroll_rows(1)
+        else:
+            return None
+        items = self.tree.get_children()
+        if items:
+            edge = items[0] if event.keysym == 'Up' else items[-1]
+            self.tree.selection_set(edge)
+            self.tree.focus(edge)
+        return 'break'
+    
+    def on_tree_resize(self, event):
+        """Recompute how many rows fit when the window is resized"""
+        row_height = ttk.Style().lookup('Treeview', 'rowheight') or 20
+        rows = max(1, (event.height - 25) // int(row_height))
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            if self.pager is not None:
+                self.render_window()
+    
+    def filter_data(self, *args):
+        """Start a background search for the current search term"""
+        search_term = self.search_var.get().lower()
+        
+        if self.virtual:
+            if self.pager is None:
+                return
+            job = self.virtual_search_job(search_term)
+        else:
+            if self.store is None:
+                return
+            job = self.classic_search_job(search_term)
+        
+        self.search_worker.submit(job)
+        self.search_started = time.perf_counter()
+        self.status_label.config(text="Searching...")
+    
+    def search_condition(self, search_term):
+        """Return the (where, params) filter for a search term"""
+        if not search_term:
+            return '', ()
+        if self.has_search_index:
+            return search_filter(search_term, SEARCH_COLUMNS)
+        pattern = f'%{search_term}%'
+        return ('name LIKE ? OR email LIKE ? OR phone LIKE ?',
+                (pattern, pattern, pattern))
+    
+    def virtual_search_job(self, search_term):
+        """Build a worker job that counts matches and fetches the first window"""
+        where, params = self.search_condition(search_term)
+        order = (self.pager.order_column, self.pager.descending)
+        window = self.visible_rows + OVERSCAN
+        if self.parallel is None:
+            self.parallel = worth_parallel(self.repo.db_path)
+        parallel = self.parallel and bool(search_term)
+        if self.has_search_index:
+            parallel_filter = {'term': search_term, 'columns': SEARCH_COLUMNS}
+        else:
+            parallel_filter = {'where': where, 'params': params}
+        db_paths = [self.repo.db_path]
+        cache = self.cache
+        key = query_key(search_term, *order)
+        
+        def job(conn, cancelled):
+            token = cache.check(conn)
+            cached = cache.get(key)
+            if cached is not None:
+                count, rows = cached
+                return where, params, order, count, rows
+            pager = CustomerPager(conn=conn)
+            pager.set_order(*order)
+            pager.set_filter(where, params)
+            rows = pager.rows_at(0, window)
+            if parallel:
+                # Chunks of the id range counted by worker processes
+                count = parallel_count(db_paths=db_paths, cancelled=cancelled,
+                                       **parallel_filter)
+            else:
+                count = pager.count()
+            if count is None or cancelled():
+                return None
+            cache.put(key, (count, rows), token)
+            return where, params, order, count, rows
+        return job
+    
+    def classic_search_job(self, search_term):
+        """Build a worker job that finds the slots of the row store that match"""
+        store = self.store
+        has_search_index = self.has_search_index
+        ranked = self.sort_by == 'id' and self.sort_descending
+        # Results depend on the store, which refresh_data keeps in step with
+        # the database, so they are stored against the cache's state now.
+        # Slots only mean something to the store they came from.
+        cache = self.cache
+        token = cache.token()
+        key = query_key(search_term, self.sort_by, self.sort_descending, page=None)
+        
+        def job(conn, cancelled):
+            if not search_term:
+                return store.order[:]
+            cached = cache.get(key)
+            if cached is not None and cached[0] is store:
+                return cached[1]
+            matches = find(conn, cancelled)
+            if matches is not None:
+                cache.put(key, (store, matches), token)
+            return matches
+        
+        def find(conn, cancelled):
+            if has_search_index:
+                # Ranked matches from the full-text index
+                ids = search_ids(conn, search_term, columns=SEARCH_COLUMNS)
+                slots = [slot for slot in map(store.slot_of, ids) if slot is not None]
+                # Unless ranked, keep the column sort the user picked
+                return slots if ranked else store.in_order(slots)
+            
             # Search in name, email, and phone fields
-            if (search_term in str(row[1]).lower() or 
-                search_term in str(row[3]).lower() or 
-                search_term in str(row[4]).lower()):
-                
-                tag = 'evenrow' if filtered_count % 2 == 0 else 'oddrow'
-                self.tree.insert('', tk.END, values=row, tags=(tag,))
-                filtered_count += 1
+            return store.search(search_term, cancelled)
+        return job
+    
+    def poll_search(self):
+        """Apply finished background searches on the Tk thread"""
+        finished = self.search_worker.poll()
+        if finished is not None:
+            generation, result, error = finished
+            if error is not None:
+                messagebox.showerror("Database Error", f"Error searching data: {str(error)}")
+            elif result is not None and self.virtual:
+                where, params, order, count, rows = result
+                if order == (self.pager.order_column, self.pager.descending):
+                    self.pager.set_filter(where, params)
+                    self.pager.prime(count, rows)
+                    self.top_row = 0
+                    self.render_window()
+            elif result is not None:
+                self.shown_generation = generation
+                self.show_rows(result, generation)
+            if result is not None:
+                # From the keystroke's search starting to its first rows on screen
+                record_operation('filter', time.perf_counter() - self.search_started)
+        self.root.after(SEARCH_POLL_MS, self.poll_search)
+    
+    def show_rows(self, slots, generation, start=0):
+        """Insert search results (row store slots) in chunks so the UI stays responsive"""
+        if generation != self.shown_generation:
+            return
+        if start == 0:
+            children = self.tree.get_children()
+            if children:
+                self.tree.delete(*children)
+        
+        store = self.store
+        end = min(start + INSERT_CHUNK, len(slots))
+        for idx in range(start, end):
+            tag = 'evenrow' if idx % 2 == 0 else 'oddrow'
+            row = store.row(slots[idx])
+            self.tree.insert('', tk.END, iid=str(row[0]), values=row, tags=(tag,))
         
-        self.status_label.config(text=f"Showing {filtered_count} of {len(self.all_data)} records")
+        if end < len(slots):
+            self.root.after(1, self.show_rows, slots, generation, end)
+        else:
+            self.status_label.config(text=f"Showing {len(slots)} of {len(store)} records")
     
+    @timed('sort')
     def sort_column(self, col):
-        """Sort treeview by column"""
-        data = [(self.tree.set(item, col), item) for item in self.tree.get_children('')]
+        """Sort by a column; clicking the same column again reverses it"""
+        column = HEADING_COLUMNS[col]
+        if column == self.sort_by:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_by = column
+            self.sort_descending = False
+        
+        # Show the direction on the heading
+        for heading, name in HEADING_COLUMNS.items():
+            arrow = ''
+            if name == self.sort_by:
+                arrow = ' \u25bc' if self.sort_descending else ' \u25b2'
+            self.tree.heading(heading, text=heading + arrow)
         
-        # Try to sort numerically if possible, otherwise alphabetically
         try:
-            data.sort(key=lambda x: int(x[0]))
-        except ValueError:
-            data.sort(key=lambda x: x[0])
+            if self.virtual:
+                # One ordered query for the first window; scrolling pages by keyset
+                if self.pager is None:
+                    return
+                self.pager.set_order(self.sort_by, self.sort_descending)
+                self.top_row = 0
+                self.render_window()
+                return
+            
+            if self.store is None:
+                return
+        except sqlite3.Error as e:
+            messagebox.showerror("Database Error", f"Error sorting data: {str(e)}")
+            return
         
-        for idx, (val, item) in enumerate(data):
-            self.tree.move(item, '', idx)
-            tag = 'evenrow' if idx % 2 == 0 else 'oddrow'
-            self.tree.item(item, tags=(tag,))
+        # Every row is in memory, so the sort needs no query
+        self.store.sort(self.sort_by, self.sort_descending)
+        if self.search_var.get():
+            self.filter_data()
+        else:
+            self.shown_generation = self.search_worker.generation
+            self.show_rows(self.store.order[:], self.shown_generation)
     
     def view_details(self):
         """Show detailed view of selected customer"""
@@ -185,11 +698,31 @@ class CustomerDatabaseViewer:
             messagebox.showinfo("No Selection", "Please select a customer to view details.")
             return
         
-        # Get selected item values
-        values = self.tree.item(selected[0])['values']
+        customer_id = int(selected[0])
+        
+        # A window already open for this customer is brought to the front
+        detail_window = self.detail_windows.get(customer_id)
+        if detail_window is not None and detail_window.winfo_exists():
+            detail_window.lift()
+            detail_window.focus_set()
+            return
+        
+        # The stored row, from the cache unless it changed since last shown
+        try:
+            with self.repo.pool.connection() as conn:
+                row = self.cache.customer(conn, customer_id)
+        except sqlite3.Error as e:
+            messagebox.showerror("Database Error", f"Error loading customer: {str(e)}")
+            return
+        if row is None:
+            messagebox.showinfo("Not Found", f"Customer {customer_id} no longer exists.")
+            return
+        values = ['' if value is None else value for value in row]
         
         # Create detail window
         detail_window = tk.Toplevel(self.root)
+        self.detail_windows[customer_id] = detail_window
+        detail_window.protocol('WM_DELETE_WINDOW', lambda: self.close_details(customer_id))
         detail_window.title(f"Customer Details - ID: {values[0]}")
         detail_window.geometry("400x350")
         detail_window.resizable(False, False)
@@ -213,65 +746,213 @@ class CustomerDatabaseViewer:
                 ttk.Label(frame, text=str(value), font=('Arial', 10)).grid(
                     row=i, column=1, sticky=tk.W, pady=5)
         
-        ttk.Button(frame, text="Close", command=detail_window.destroy).grid(
+        ttk.Button(frame, text="Close", command=lambda: self.close_details(customer_id)).grid(
             row=len(labels), column=0, columnspan=2, pady=(20, 0))
     
-    def delete_record(self):
-        """Delete selected customer record"""
+    def close_details(self, customer_id):
+        """Close a customer's detail window"""
+        detail_window = self.detail_windows.pop(customer_id, None)
+        if detail_window is not None:
+            detail_window.destroy()
+    
+    def batch_target(self, action):
+        """The customers a batch operation applies to: the selected rows, or
+        with none selected every row matching the search
+
+        Returns (description, repository keyword arguments), or None.
+        """
         selected = self.tree.selection()
-        if not selected:
-            messagebox.showinfo("No Selection", "Please select a customer to delete.")
-            return
+        if len(selected) == 1:
+            values = self.tree.item(selected[0])['values']
+            return f"{values[1]} (ID: {values[0]})", {'customer_ids': [int(selected[0])]}
+        if selected:
+            return (f"the {len(selected)} selected customers",
+                    {'customer_ids': [int(iid) for iid in selected]})
         
-        values = self.tree.item(selected[0])['values']
-        customer_id = values[0]
-        customer_name = values[1]
+        search_term = self.search_var.get().lower()
+        if not search_term:
+            messagebox.showinfo("No Selection",
+                                f"Please select the customers to {action}, or search for them.")
+            return None
+        where, params = self.search_condition(search_term)
+        try:
+            count = self.repo.count(where, params)
+        except sqlite3.Error as e:
+            messagebox.showerror("Database Error", f"Error counting customers: {str(e)}")
+            return None
+        if not count:
+            messagebox.showinfo("No Matches", f"No customers match '{search_term}'.")
+            return None
+        return (f"all {count} customers matching '{search_term}'",
+                {'where': where, 'params': params})
+    
+    @timed('delete')
+    def delete_record(self):
+        """Delete the selected customers (or the search result) in one transaction"""
+        target = self.batch_target('delete')
+        if target is None:
+            return
+        description, selection = target
         
         # Confirm deletion
         confirm = messagebox.askyesno("Confirm Delete", 
-                                     f"Are you sure you want to delete:\n\n{customer_name} (ID: {customer_id})?")
+                                     f"Are you sure you want to delete:\n\n{description}?")
         
         if confirm:
             try:
-                conn = sqlite3.connect('customer_data.db')
-                cursor = conn.cursor()
-                cursor.execute('DELETE FROM customers WHERE id = ?', (customer_id,))
-                conn.commit()
-                conn.close()
+                deleted = self.repo.delete_customers(**selection)
                 
-                messagebox.showinfo("Success", "Customer record deleted successfully.")
-                self.load_data()
+                messagebox.showinfo("Success", "Customer record deleted successfully." if deleted == 1
+                                    else f"{deleted} customer records deleted successfully.")
+                self.refresh_data()
                 
             except sqlite3.Error as e:
                 messagebox.showerror("Database Error", f"Error deleting record: {str(e)}")
     
-    def export_to_text(self):
-        """Export all visible data to a text file"""
+    def update_records(self):
+        """Ask for a new contact method and/or address for the selected
+        customers (or the search result)"""
+        target = self.batch_target('update')
+        if target is None:
+            return
+        description, selection = target
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Update Customers")
+        dialog.resizable(False, False)
+        frame = ttk.Frame(dialog, padding="20")
+        frame.pack(fill=tk.BOTH, expand=True)
+        
+        ttk.Label(frame, text=f"Update {description}", font=('Arial', 10, 'bold')).grid(
+            row=0, column=0, columnspan=2, sticky=tk.W, pady=(0, 10))
+        ttk.Label(frame, text="Preferred Contact:").grid(row=1, column=0, sticky=tk.W, pady=5)
+        contact_var = tk.StringVar(value=UNCHANGED)
+        ttk.Combobox(frame, textvariable=contact_var, values=[UNCHANGED, *CONTACT_METHODS],
+                     state="readonly", width=27).grid(row=1, column=1, pady=5, padx=(10, 0))
+        ttk.Label(frame, text="Address:").grid(row=2, column=0, sticky=tk.W, pady=5)
+        address_var = tk.StringVar()
+        ttk.Entry(frame, textvariable=address_var, width=30).grid(
+            row=2, column=1, pady=5, padx=(10, 0))
+        ttk.Label(frame, text="Leave a field blank to keep it as it is.", 
+                  font=('Arial', 8), foreground='gray').grid(row=3, column=0, columnspan=2)
+        
+        def apply():
+            changes = {}
+            if contact_var.get() != UNCHANGED:
+                changes['preferred_contact'] = contact_var.get()
+            if address_var.get().strip():
+                changes['address'] = address_var.get().strip()
+            if not changes:
+                messagebox.showinfo("Nothing to Update", "Choose a contact method or enter an address.",
+                                    parent=dialog)
+                return
+            if self.apply_update(description, selection, changes):
+                dialog.destroy()
+        
+        buttons = ttk.Frame(frame)
+        buttons.grid(row=4, column=0, columnspan=2, pady=(15, 0))
+        ttk.Button(buttons, text="Update", command=apply).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Cancel", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
+    
+    @timed('update')
+    def apply_update(self, description, selection, changes):
+        """Confirm and run a batch update; True once it has run"""
+        fields = ' and '.join(f"{'preferred contact' if column == 'preferred_contact' else column} "
+                              f"to {value}" for column, value in changes.items())
+        if not messagebox.askyesno("Confirm Update", f"Set {fields} for:\n\n{description}?"):
+            return False
         try:
-            with open('customer_export.txt', 'w') as f:
-                f.write("CUSTOMER DATABASE EXPORT\n")
-                f.write("=" * 80 + "\n\n")
-                
-                for item in self.tree.get_children():
-                    values = self.tree.item(item)['values']
-                    f.write(f"ID: {values[0]}\n")
-                    f.write(f"Name: {values[1]}\n")
-                    f.write(f"Birthday: {values[2]}\n")
-                    f.write(f"Email: {values[3]}\n")
-                    f.write(f"Phone: {values[4]}\n")
-                    f.write(f"Address: {values[5]}\n")
-                    f.write(f"Preferred Contact: {values[6]}\n")
-                    f.write(f"Date Added: {values[7]}\n")
-                    f.write("-" * 80 + "\n\n")
-            
-            messagebox.showinfo("Export Successful", 
-                              "Data exported to 'customer_export.txt'")
-        except Exception as e:
-            messagebox.showerror("Export Error", f"Error exporting data: {str(e)}")
+            updated = self.repo.update_customers(changes, **selection)
+        except sqlite3.Error as e:
+            messagebox.showerror("Database Error", f"Error updating records: {str(e)}")
+            return False
+        messagebox.showinfo("Success", f"{updated} customer records updated.")
+        self.refresh_data()
+        return True
+    
+    def export_to_text(self):
+        """Export the rows matching the current search to a text file"""
+        self.start_export('customer_export.txt', 'text')
+    
+    def export_data(self):
+        """Ask for a file and export the current search results to it"""
+        filetypes = [('CSV', '*.csv'), ('CSV (gzip)', '*.csv.gz'),
+                     ('JSON Lines', '*.jsonl'), ('JSON Lines (gzip)', '*.jsonl.gz'),
+                     ('Text', '*.txt')]
+        if 'parquet' in available_formats():
+            filetypes.insert(4, ('Parquet', '*.parquet'))
+        path = filedialog.asksaveasfilename(title="Export Customers",
+                                            defaultextension='.csv',
+                                            filetypes=filetypes)
+        if path:
+            self.start_export(path)
+    
+    def start_export(self, path, fmt=None):
+        """Stream rows from the database to a file on a background thread"""
+        if self.export_thread is not None and self.export_thread.is_alive():
+            messagebox.showinfo("Export Running", "An export is already in progress.")
+            return
+        
+        # Export what the user is looking at: current search and sort,
+        # but every matching row rather than only the loaded ones
+        where, params = self.search_condition(self.search_var.get().lower())
+        order_column, descending = self.sort_by, self.sort_descending
+        db_path = self.repo.db_path
+        progress_queue = queue.Queue()
+        self.export_cancelled = False
+        
+        def progress(done, total):
+            progress_queue.put(('progress', done, total))
+            return not self.export_cancelled
+        
+        def run():
+            try:
+                with timed('export'):
+                    count = export_customers(path, fmt, where=where, params=params,
+                                             order_column=order_column, descending=descending,
+                                             db_path=db_path, progress=progress)
+                progress_queue.put(('done', count, None))
+            except Exception as e:
+                progress_queue.put(('error', e, None))
+        
+        self.export_progress['value'] = 0
+        self.export_frame.pack(side=tk.LEFT, padx=5)
+        self.export_thread = threading.Thread(target=run, daemon=True)
+        self.export_thread.start()
+        self.root.after(100, self.poll_export, path, progress_queue)
+    
+    def cancel_export(self):
+        self.export_cancelled = True
+    
+    def poll_export(self, path, progress_queue):
+        """Update the progress bar and report when the export finishes"""
+        while True:
+            try:
+                kind, value, total = progress_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'progress':
+                self.export_progress['value'] = 100 * value / total if total else 100
+                self.status_label.config(text=f"Exporting... {value} of {total} rows")
+            else:
+                self.export_frame.pack_forget()
+                if kind == 'done':
+                    self.status_label.config(text=f"Exported {value} rows")
+                    messagebox.showinfo("Export Successful",
+                                        f"{value} records exported to '{path}'")
+                elif isinstance(value, ExportCancelled):
+                    self.status_label.config(text="Export cancelled")
+                else:
+                    messagebox.showerror("Export Error", f"Error exporting data: {str(value)}")
+                return
+        self.root.after(100, self.poll_export, path, progress_queue)
 
-def main():
+def main(virtual=True, db_path=None, parallel=None, fast_start=True, archived=False):
+    # Archived customers are shown read-only next to the live ones
+    set_include_archives(archived)
     root = tk.Tk()
-    app = CustomerDatabaseViewer(root)
+    app = CustomerDatabaseViewer(root, virtual=virtual, db_path=db_path, parallel=parallel,
+                                 fast_start=fast_start, started=STARTED)
     root.mainloop()
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+import queue
+import sqlite3
+import threading
+import time
+
+from customer_db import connect
+
+
+class QueryWorker:
+    """Run database jobs on a background thread, newest job wins
+
+    Each submit() supersedes the previous job: a pending job is dropped
+    and a running one is interrupted. Jobs only start once no newer job
+    has arrived for `debounce_ms`, so fast typing runs a single query.
+    Finished results are picked up from the Tk thread with poll().
+    """
+
+    def __init__(self, db_path=None, debounce_ms=250):
+        self.db_path = db_path
+        self.debounce = debounce_ms / 1000
+        self.results = queue.Queue()
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._pending = None
+        self._running = None
+        self._conn = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def generation(self):
+        """Number of the most recently submitted job"""
+        return self._generation
+
+    def submit(self, job):
+        """Queue job(conn, cancelled) and return its generation number"""
+        with self._cond:
+            self._generation += 1
+            self._pending = (self._generation, job, time.monotonic())
+            if self._running is not None:
+                # Abort the statement the worker is executing right now
+                self._conn.interrupt()
+            self._cond.notify()
+            return self._generation
+
+    def cancelled(self, generation):
+        """True once a newer job has been submitted"""
+        return generation != self._generation
+
+    def poll(self):
+        """Return (generation, result, error) for the newest finished job, or None"""
+        latest = None
+        while True:
+            try:
+                item = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if not self.cancelled(item[0]):
+                latest = item
+        return latest
+
+    def busy(self):
+        """True while a job is waiting or running"""
+        return self._pending is not None or self._running is not None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._pending = None
+            if self._running is not None:
+                self._conn.interrupt()
+            self._cond.notify()
+
+    def _run(self):
+        self._conn = connect(self.db_path)
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    break
+                generation, job, submitted = self._pending
+                delay = submitted + self.debounce - time.monotonic()
+                if delay > 0:
+                    # Debounce: a newer submit replaces the pending job
+                    self._cond.wait(delay)
+                    continue
+                self._pending = None
+                self._running = generation
+
+            result, error = None, None
+            try:
+                result = job(self._conn, lambda: self.cancelled(generation))
+            except sqlite3.OperationalError as e:
+                if not self.cancelled(generation):
+                    error = e
+            except Exception as e:
+                error = e
+
+            with self._cond:
+                self._running = None
+            if not self.cancelled(generation):
+                self.results.put((generation, result, error))
+        self._conn.close()
@@ -0,0 +1,36 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from customer_generator import generate_customers, generate_database  # noqa: E402
+from customer_schema import CREATE_CUSTOMERS_SQL  # noqa: E402
+
+
+def make_v1_database(path, count, seed=0):
+    """A database as the first version of the apps left it: only the customers table"""
+    conn = sqlite3.connect(path)
+    conn.execute(CREATE_CUSTOMERS_SQL)
+    conn.executemany(
+        'INSERT INTO customers (name, birthday, email, phone, address, preferred_contact, '
+        'date_added) VALUES (:name, :birthday, :email, :phone, :address, '
+        ':preferred_contact, :date_added)',
+        generate_customers(count, seed))
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def v1_db(tmp_path):
+    return make_v1_database(str(tmp_path / 'v1.db'), 50)
+
+
+@pytest.fixture
+def imported_db(tmp_path):
+    path = str(tmp_path / 'imported.db')
+    generate_database(50, path)
+    return path
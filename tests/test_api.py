@@ -0,0 +1,78 @@
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import partial
+from http.client import HTTPConnection
+
+import pytest
+
+from customer_api import CustomerApi, CustomerServer
+from customer_db import ConnectionPool, PoolTimeout
+
+
+@contextmanager
+def _server(api):
+    server = CustomerServer(('127.0.0.1', 0), api, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server.server_port
+    finally:
+        server.shutdown()
+        server.server_close()
+        api.close()
+
+
+def _get(port, path):
+    client = HTTPConnection('127.0.0.1', port, timeout=10)
+    try:
+        client.request('GET', path)
+        response = client.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        client.close()
+
+
+def test_pool_timeout_is_a_database_error(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'customers.db'), size=1)
+    with pool.connection():
+        with pytest.raises(sqlite3.OperationalError) as raised:
+            pool._acquire(timeout=0.05)
+    assert isinstance(raised.value, PoolTimeout)
+    pool.close()
+
+
+def test_busy_pool_answers_503(imported_db):
+    api = CustomerApi(imported_db, pool_size=1)
+    pool = api.repo.pool
+    pool._acquire = partial(ConnectionPool._acquire, pool, timeout=0.05)
+    with _server(api) as port:
+        with pool.connection():
+            status, body = _get(port, '/customers/1')
+    assert status == 503
+    assert 'busy' in body['error']
+
+
+def test_bounds_in_error_messages(imported_db):
+    with _server(CustomerApi(imported_db)) as port:
+        assert _get(port, '/customers?offset=-1') == (
+            400, {'error': "offset must be at least 0"})
+        assert _get(port, '/customers?limit=0') == (
+            400, {'error': "limit must be between 1 and 10000"})
+
+
+def test_list_and_search_agree_on_terms_without_words(imported_db):
+    with _server(CustomerApi(imported_db)) as port:
+        status, listed = _get(port, '/customers?q=%21%21%21')
+        assert status == 200
+        assert (listed['total'], listed['customers']) == (0, [])
+        assert _get(port, '/search?q=%21%21%21') == (200, {'customers': []})
+
+        name = _get(port, '/customers/1')[1]['name']
+        query = name.split()[0]
+        listed = _get(port, f'/customers?q={query}&limit=all')[1]
+        found = _get(port, f'/search?q={query}&limit=10000')[1]
+        assert listed['total'] > 0
+        assert ({c['id'] for c in listed['customers']}
+                == {c['id'] for c in found['customers']})
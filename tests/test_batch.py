@@ -0,0 +1,87 @@
+import sqlite3
+
+import pytest
+
+from customer_db import COLUMNS, CustomerRepository, connect
+from customer_search import search_filter
+
+
+@pytest.fixture(params=['v1_db', 'imported_db'])
+def databases(request, tmp_path):
+    """Two identical databases: one for the batch operation, one for the
+    same change made row by row"""
+    path = request.getfixturevalue(request.param)
+    CustomerRepository(path).ensure_change_log()
+    copy = str(tmp_path / 'row_by_row.db')
+    source, target = sqlite3.connect(path), sqlite3.connect(copy)
+    source.backup(target)
+    source.close()
+    target.close()
+    return path, copy
+
+
+def _state(path):
+    """Rows, summary counts, search results and logged changes of a database"""
+    conn = connect(path)
+    try:
+        tables = {name for name, in conn.execute('SELECT name FROM sqlite_master')}
+        state = {
+            'rows': conn.execute(f"SELECT {', '.join(COLUMNS)} FROM customers "
+                                 "ORDER BY id").fetchall(),
+            'changes': set(conn.execute('SELECT customer_id, op FROM customer_changes')),
+        }
+        if 'customer_stats' in tables:
+            state['stats'] = set(conn.execute('SELECT kind, key, count FROM customer_stats '
+                                              'WHERE count > 0'))
+        if 'customers_fts' in tables:
+            where, params = search_filter('new')
+            state['search'] = conn.execute(f'SELECT id FROM customers WHERE {where} '
+                                           'ORDER BY id', params).fetchall()
+        return state
+    finally:
+        conn.close()
+
+
+def _row_by_row(path, sql, ids):
+    conn = connect(path)
+    for customer_id in ids:
+        conn.execute(sql, (customer_id,))
+    conn.commit()
+    conn.close()
+
+
+def test_batch_delete_matches_deleting_each_row(databases):
+    batch, single = databases
+    repo = CustomerRepository(batch)
+    assert repo.delete_customers([3, 5, 5, 99]) == 2
+    assert repo.delete_customers(where="preferred_contact = ?", params=('Email',)) > 0
+
+    conn = connect(single)
+    emails = [customer_id for customer_id, in conn.execute(
+        "SELECT id FROM customers WHERE preferred_contact = 'Email' AND id NOT IN (3, 5)")]
+    conn.close()
+    _row_by_row(single, 'DELETE FROM customers WHERE id = ?', [3, 5, *emails])
+    assert _state(batch) == _state(single)
+
+
+def test_batch_update_matches_updating_each_row(databases):
+    batch, single = databases
+    repo = CustomerRepository(batch)
+    ids = list(range(1, 21))
+    changed = repo.update_customers({'preferred_contact': 'mail', 'address': '9 New Rd'}, ids)
+    assert repo.update_customers({'preferred_contact': 'Mail', 'address': '9 New Rd'}, ids) == 0
+    assert repo.update_customers({'preferred_contact': 'Fax'}, where='id > ?',
+                                 params=(45,)) == 5
+
+    assert changed == 20
+
+    _row_by_row(single, "UPDATE customers SET preferred_contact = 'Mail', address = '9 New Rd' "
+                        "WHERE id = ?", ids)
+    _row_by_row(single, "UPDATE customers SET preferred_contact = 'Fax' WHERE id = ?",
+                range(46, 51))
+    assert _state(batch) == _state(single)
+
+
+def test_only_batch_columns_can_be_updated(imported_db):
+    with pytest.raises(ValueError):
+        CustomerRepository(imported_db).update_customers({'name': 'Same Name'}, [1])
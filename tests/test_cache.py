@@ -0,0 +1,78 @@
+import pytest
+
+from customer_cache import ResultCache, customer_key, get_cache, query_key
+from customer_db import CustomerRepository, connect
+
+CUSTOMER = ('Cached Person', '01/02/1990', 'cached@example.com', '555-010-4000',
+            '1 Cache St', 'Email')
+
+
+@pytest.fixture
+def conn(imported_db):
+    CustomerRepository(imported_db).ensure_change_log()
+    conn = connect(imported_db)
+    yield conn
+    conn.close()
+
+
+def test_writes_drop_what_they_change(imported_db, conn):
+    cache = ResultCache()
+    assert cache.customer(conn, 3)[0] == 3
+    assert cache.customer(conn, 4)[0] == 4
+    cache.put(query_key('smith'), [(1,)], cache.check(conn))
+    assert cache.customer(conn, 3)[0] == 3
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    other = connect(imported_db)
+    other.execute("UPDATE customers SET address = '2 New St' WHERE id = 3")
+    other.commit()
+
+    cache.check(conn)
+    # The changed row and every search result are dropped, other rows kept
+    assert cache.get(customer_key(3)) is None
+    assert cache.get(query_key('smith')) is None
+    assert cache.get(customer_key(4)) is not None
+    assert cache.customer(conn, 3)[5] == '2 New St'
+
+    other.execute('INSERT INTO customers (name, birthday, email, phone, address, '
+                  'preferred_contact) VALUES (?, ?, ?, ?, ?, ?)', CUSTOMER)
+    other.commit()
+    cache.put(query_key('smith'), [(1,)], cache.check(conn))
+    other.execute('DELETE FROM customers WHERE id = 4')
+    other.commit()
+    other.close()
+
+    cache.check(conn)
+    assert cache.get(query_key('smith')) is None
+    assert cache.get(customer_key(4)) is None
+    assert cache.customer(conn, 4) is None
+
+
+def test_results_from_before_a_change_are_not_stored(imported_db, conn):
+    cache = ResultCache()
+    token = cache.check(conn)
+    other = connect(imported_db)
+    other.execute('DELETE FROM customers WHERE id = 5')
+    other.commit()
+    other.close()
+    cache.check(conn)
+    cache.put(query_key('smith'), [(5,)], token)
+    assert cache.get(query_key('smith')) is None
+
+
+def test_least_recently_used_entries_go_first():
+    cache = ResultCache(max_entries=2, max_result_rows=3)
+    cache.put(query_key('a'), ['a'])
+    cache.put(query_key('b'), ['b'])
+    cache.get(query_key('a'))
+    cache.put(query_key('c'), ['c'])
+    assert cache.get(query_key('b')) is None
+    assert cache.get(query_key('a')) == ['a'] and cache.get(query_key('c')) == ['c']
+    cache.put(query_key('d'), [1, 2, 3, 4])
+    assert cache.get(query_key('d')) is None
+
+
+def test_one_cache_per_database_file(tmp_path):
+    path = str(tmp_path / 'cached.db')
+    assert get_cache(path) is get_cache(str(tmp_path / '.' / 'cached.db'))
+    assert get_cache(path) is not get_cache(str(tmp_path / 'other.db'))
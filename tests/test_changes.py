@@ -0,0 +1,42 @@
+from customer_changes import ChangeTracker
+from customer_db import CustomerRepository, connect
+
+CUSTOMER = ('Changed Person', '01/02/1990', 'changed@example.com', '555-010-2000',
+            '1 Change St', 'Email')
+
+
+def test_tracker_sees_commits_from_another_connection(imported_db):
+    CustomerRepository(imported_db).ensure_change_log()
+    tracker = ChangeTracker(imported_db)
+    tracker.start()
+    assert not tracker.has_changed()
+    assert not tracker.fetch_changes()
+
+    conn = connect(imported_db)
+    conn.execute('INSERT INTO customers (name, birthday, email, phone, address, '
+                 'preferred_contact) VALUES (?, ?, ?, ?, ?, ?)', CUSTOMER)
+    conn.execute("UPDATE customers SET address = '2 Moved St' WHERE id IN (3, 7)")
+    conn.execute('DELETE FROM customers WHERE id IN (7, 9)')
+    conn.commit()
+
+    assert tracker.has_changed()
+    changes = tracker.fetch_changes()
+    assert [row[:2] for row in changes.inserted] == [(51, 'Changed Person')]
+    # Row 7 was updated and then deleted: only the delete is reported
+    assert [(row[0], row[5]) for row in changes.updated] == [(3, '2 Moved St')]
+    assert changes.deleted == {7, 9}
+    assert not tracker.has_changed()
+
+    # A row inserted and then changed in the same window is reported as
+    # inserted, with its latest values
+    conn.execute('INSERT INTO customers (name, birthday, email, phone, address, '
+                 'preferred_contact) VALUES (?, ?, ?, ?, ?, ?)', CUSTOMER)
+    conn.execute("UPDATE customers SET name = 'Renamed Person' WHERE id = 52")
+    conn.commit()
+    conn.close()
+
+    changes = tracker.fetch_changes()
+    assert [row[:2] for row in changes.inserted] == [(52, 'Renamed Person')]
+    assert not changes.updated and not changes.deleted
+    assert not tracker.fetch_changes()
+    tracker.close()
@@ -0,0 +1,95 @@
+import csv
+import io
+import json
+
+import pytest
+
+import view_customers
+from customer_db import COLUMNS, connect
+from customer_search import search_filter
+
+
+def _run(capsys, *argv):
+    code = view_customers.main(list(argv))
+    out, err = capsys.readouterr()
+    return code, out, err
+
+
+def _rows(db_path, condition='', params=(), order='id'):
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM customers {condition} "
+                            f"ORDER BY {order}", params).fetchall()
+    finally:
+        conn.close()
+    return [[str(value) for value in row] for row in rows]
+
+
+def test_list_prints_sorted_csv_and_jsonl(imported_db, capsys):
+    code, out, _ = _run(capsys, '--db', imported_db, 'list', '--format', 'csv',
+                        '--sort', 'name', '--desc', '--limit', '5', '--offset', '2')
+    assert code == 0
+    header, *rows = list(csv.reader(io.StringIO(out)))
+    assert tuple(header) == COLUMNS
+    assert rows == _rows(imported_db, order='name DESC, id DESC')[2:7]
+
+    code, out, _ = _run(capsys, '--db', imported_db, 'list', '--format', 'jsonl',
+                        '--where', "preferred_contact = 'Email'")
+    assert code == 0
+    ids = [json.loads(line)['id'] for line in out.splitlines()]
+    assert ids == [int(row[0]) for row in
+                   _rows(imported_db, "WHERE preferred_contact = 'Email'")]
+
+
+def test_list_table_has_a_line_per_customer(imported_db, capsys):
+    code, out, _ = _run(capsys, '--db', imported_db, 'list', '--limit', '3')
+    assert code == 0
+    lines = out.splitlines()
+    assert lines[0].startswith('ID') and set(lines[1]) == {'-', ' '}
+    assert [line.split()[0] for line in lines[2:]] == ['1', '2', '3']
+
+
+def test_search_prints_the_matching_customers(imported_db, capsys):
+    term = _rows(imported_db)[0][1].split()[-1]
+    conn = connect(imported_db)
+    where, params = search_filter(term)
+    conn.close()
+    code, out, _ = _run(capsys, '--db', imported_db, 'search', term, '--format', 'csv')
+    assert code == 0
+    _, *rows = list(csv.reader(io.StringIO(out)))
+    assert rows and rows == _rows(imported_db, f'WHERE {where}', params)
+
+    # A term without searchable words matches nothing
+    code, out, _ = _run(capsys, '--db', imported_db, 'search', '!!', '--format', 'csv')
+    assert code == 0 and out == ''
+
+
+def test_summary_and_stats(imported_db, capsys):
+    code, out, _ = _run(capsys, '--db', imported_db, 'summary', '--format', 'jsonl')
+    assert code == 0
+    summary = json.loads(out)
+    assert summary['total'] == 50
+    assert sum(count for _, count in summary['contact']) == 50
+
+    code, out, _ = _run(capsys, '--db', imported_db, 'summary')
+    assert code == 0 and 'DATABASE SUMMARY' in out
+
+    code, out, _ = _run(capsys, '--db', imported_db, 'stats', '--format', 'jsonl')
+    assert code == 0
+    stats = json.loads(out)
+    assert (stats['customers'], stats['lowest_id'], stats['highest_id']) == (50, 1, 50)
+    assert stats['search_index'] and stats['summary_counts']
+    assert not stats['migration_pending']
+
+    code, out, _ = _run(capsys, '--db', imported_db, 'stats')
+    assert code == 0 and 'Customers: ' in out
+
+
+def test_failures_exit_with_an_error(imported_db, capsys):
+    code, out, err = _run(capsys, '--db', imported_db, 'list', '--where', 'no_such_column = 1')
+    assert code == 1 and out == ''
+    assert err.startswith('List failed: ')
+
+    with pytest.raises(SystemExit) as exit_info:
+        view_customers.main(['--db', imported_db, 'list', '--sort', 'no_such_column'])
+    assert exit_info.value.code == 2
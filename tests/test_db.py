@@ -0,0 +1,47 @@
+import threading
+
+import pytest
+
+from customer_db import PRAGMAS, ConnectionPool, connect
+
+
+def test_connections_get_the_shared_settings(imported_db):
+    conn = connect(imported_db)
+    settings = {name: conn.execute(f'PRAGMA {name}').fetchone()[0] for name, _ in PRAGMAS}
+    conn.close()
+    assert settings['journal_mode'] == 'wal'
+    assert settings['synchronous'] == 1          # NORMAL
+    assert settings['busy_timeout'] == 5000
+    assert settings['temp_store'] == 2           # MEMORY
+
+
+def test_pool_reuses_at_most_size_connections(imported_db):
+    pool = ConnectionPool(imported_db, size=2)
+    seen = set()
+    barrier = threading.Barrier(4)
+
+    def borrow():
+        barrier.wait()
+        for _ in range(20):
+            with pool.connection() as conn:
+                seen.add(id(conn))
+                conn.execute('SELECT COUNT(*) FROM customers').fetchone()
+
+    threads = [threading.Thread(target=borrow) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 1 <= len(seen) <= 2
+    pool.close()
+
+
+def test_pool_transaction_rolls_back_on_error(imported_db):
+    pool = ConnectionPool(imported_db, size=1)
+    with pytest.raises(ValueError):
+        with pool.transaction() as conn:
+            conn.execute('DELETE FROM customers')
+            raise ValueError
+    with pool.connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM customers').fetchone()[0] == 50
+    pool.close()
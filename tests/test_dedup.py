@@ -0,0 +1,47 @@
+from itertools import combinations
+
+from customer_db import COLUMNS, connect
+from customer_dedup import THRESHOLD, check_customer, find_duplicates, score
+from customer_generator import generate_database
+
+
+def test_blocked_pairs_match_scoring_every_pair(tmp_path):
+    path = str(tmp_path / 'dupes.db')
+    generate_database(200, path, duplicates=0.3)
+    conn = connect(path)
+    rows = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM customers ORDER BY id").fetchall()
+    conn.close()
+
+    expected = {(a[0], b[0]) for a, b in combinations(rows, 2) if score(a, b) >= THRESHOLD}
+    found, candidates, skipped = find_duplicates(path, workers=1)
+    assert expected
+    assert {(a, b) for _, a, b in found} == expected
+    assert candidates >= len(found) and skipped == 0
+    assert [pair[0] for pair in found] == sorted((pair[0] for pair in found), reverse=True)
+
+
+def test_oversized_key_groups_are_skipped(imported_db):
+    conn = connect(imported_db)
+    conn.execute("UPDATE customers SET phone = '555-010-9999' WHERE id <= 5")
+    conn.commit()
+    conn.close()
+    _, candidates, skipped = find_duplicates(imported_db, workers=1, max_block=4)
+    assert skipped == 1 and candidates == 0
+
+
+def test_check_customer_finds_the_same_person(imported_db):
+    conn = connect(imported_db)
+    stored = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM customers WHERE id = 7").fetchone()
+    conn.close()
+    _, name, birthday, email, phone, address = stored[:6]
+    first, last = name.split(' ', 1)
+    local, domain = email.split('@')
+
+    # Reordered name, tagged upper-case email, phone typed differently
+    matches = check_customer(f'{last}, {first}', birthday, f'{local.upper()}+shop@{domain}',
+                             '(' + phone.replace('-', ') ', 1), address, imported_db)
+    assert [row[0] for _, row in matches] == [7]
+    assert matches[0][0] == 1.0
+
+    assert check_customer('Nobody Known', '01/01/1900', 'nobody@example.com',
+                          '555-010-0000', '1 Nowhere Rd', imported_db) == []
@@ -0,0 +1,60 @@
+import csv
+import gzip
+import json
+
+import pytest
+
+from customer_db import COLUMNS, connect
+from customer_export import ExportCancelled, export_customers
+
+
+def _rows(path, condition='', order='id'):
+    conn = connect(path)
+    try:
+        return conn.execute(f"SELECT {', '.join(COLUMNS)} FROM customers {condition} "
+                            f"ORDER BY {order}").fetchall()
+    finally:
+        conn.close()
+
+
+def _as_text(rows):
+    return [[str(value) for value in row] for row in rows]
+
+
+def test_csv_export_streams_every_row_with_progress(imported_db, tmp_path):
+    path = str(tmp_path / 'out.csv')
+    progress = []
+    count = export_customers(path, db_path=imported_db, chunk_size=7,
+                             progress=lambda done, total: progress.append((done, total)))
+    assert count == 50
+    assert progress == [(min(done, 50), 50) for done in range(7, 57, 7)]
+    with open(path, newline='', encoding='utf-8') as f:
+        header, *rows = list(csv.reader(f))
+    assert tuple(header) == COLUMNS
+    assert rows == _as_text(_rows(imported_db))
+
+
+def test_compressed_jsonl_export_keeps_filter_order_and_slice(imported_db, tmp_path):
+    path = str(tmp_path / 'out.jsonl.gz')
+    count = export_customers(path, db_path=imported_db, where="preferred_contact = ?",
+                             params=('Email',), order_column='name', descending=True,
+                             limit=5, offset=2, chunk_size=2)
+    expected = _rows(imported_db, "WHERE preferred_contact = 'Email'",
+                     'name DESC, id DESC')[2:7]
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        exported = [json.loads(line) for line in f]
+    assert count == len(expected)
+    assert exported == [dict(zip(COLUMNS, row)) for row in expected]
+
+
+def test_cancelled_export_stops_early(imported_db, tmp_path):
+    with pytest.raises(ExportCancelled):
+        export_customers(str(tmp_path / 'out.csv'), db_path=imported_db, chunk_size=10,
+                         progress=lambda done, total: done < 20)
+
+
+def test_bad_filter_leaves_no_file(imported_db, tmp_path):
+    path = tmp_path / 'out.csv'
+    with pytest.raises(Exception):
+        export_customers(str(path), db_path=imported_db, where='no_such_column = 1')
+    assert not path.exists()
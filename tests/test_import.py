@@ -0,0 +1,148 @@
+import csv
+import json
+
+import pytest
+
+from customer_db import connect
+from customer_generator import generate_customers, write_file
+from customer_import import import_file, import_records
+from customer_schema import insert_sql
+from customer_search import search_ids
+from customer_validation import MESSAGES
+
+
+def _write_jsonl(path, lines):
+    path.write_text(''.join(line + '\n' for line in lines), encoding='utf-8')
+    return str(path)
+
+
+GOOD = json.dumps({'name': 'Ada Lovelace', 'birthday': '12/10/1985',
+                   'email': 'ada@example.com', 'phone': '555-123-4567',
+                   'address': '1 Analytical St', 'preferred_contact': 'Email'})
+
+
+def test_bad_jsonl_lines_are_rejected_one_by_one(tmp_path):
+    source = _write_jsonl(tmp_path / 'in.jsonl',
+                          [GOOD, '{"name": ', '[1, 2]', '"text"', GOOD.replace('ada@', 'bob@')])
+    rejects = tmp_path / 'rejects.jsonl'
+    stats = import_file(source, str(tmp_path / 'c.db'), reject_path=str(rejects))
+
+    assert (stats.read, stats.inserted, stats.rejected) == (5, 2, 3)
+    rejected = [json.loads(line) for line in rejects.read_text(encoding='utf-8').splitlines()]
+    assert [r['line'] for r in rejected] == ['{"name":', '[1, 2]', '"text"']
+    assert rejected[0]['error'].startswith('Line 2: invalid JSON')
+    assert rejected[1]['error'] == 'Line 3: not a JSON object'
+
+
+def test_batch_of_only_bad_lines(tmp_path):
+    source = _write_jsonl(tmp_path / 'in.jsonl', ['not json', '42'])
+    stats = import_file(source, str(tmp_path / 'c.db'))
+    assert (stats.read, stats.inserted, stats.rejected) == (2, 0, 2)
+    conn = connect(str(tmp_path / 'c.db'))
+    assert conn.execute('SELECT COUNT(*) FROM customers').fetchone()[0] == 0
+    conn.close()
+
+
+def test_invalid_csv_rows_are_rejected_with_reasons(tmp_path):
+    source = tmp_path / 'in.csv'
+    source.write_text(
+        'Name,Birthday,Email,Phone,Address,Preferred Contact\n'
+        'Ada Lovelace,12/10/1985,ada@example.com,555-123-4567,1 Analytical St,email\n'
+        'No Phone,12/10/1985,np@example.com,,2 Main St,Email\n'
+        'Bad Date,13/45/1985,bd@example.com,555-123-4567,3 Main St,Email\n'
+        'Bad Email,12/10/1985,not-an-email,555-123-4567,4 Main St,Email\n'
+        'Bad Phone,12/10/1985,bp@example.com,555-1234,5 Main St,Email\n'
+        'Bad Contact,12/10/1985,bc@example.com,555-123-4567,6 Main St,Fax\n',
+        encoding='utf-8')
+    rejects = tmp_path / 'rejects.csv'
+    db_path = str(tmp_path / 'c.db')
+    stats = import_file(str(source), db_path, reject_path=str(rejects))
+
+    assert (stats.read, stats.inserted, stats.rejected) == (6, 1, 5)
+    with open(rejects, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    assert [(row['name'], row['error']) for row in rows] == [
+        ('No Phone', MESSAGES['required']),
+        ('Bad Date', MESSAGES['birthday']),
+        ('Bad Email', MESSAGES['email']),
+        ('Bad Phone', MESSAGES['phone']),
+        ('Bad Contact', MESSAGES['preferred_contact']),
+    ]
+    conn = connect(db_path)
+    assert conn.execute('SELECT name, preferred_contact FROM customers').fetchall() == [
+        ('Ada Lovelace', 'Email')]
+    conn.close()
+
+
+def test_bulk_rows_are_stored_as_the_sql_conversions_store_them(tmp_path):
+    records = [
+        ('Ada Lovelace', '12/10/1985', 'ada@example.com', '(555) 123.4567', '1 Analytical St',
+         'Email', '2020-01-02 03:04:05'),
+        ('Bo Li', '1/2/1990', 'bo+x@example.com', '555 123 4567', '2 Main St',
+         'Phone', '2020-01-02T03:04:05'),
+        ('Cy Young', '01/02/1990', 'cy@example.com', '055-123-4567', '3 Main St',
+         'Mail', '2020-01-02'),
+    ]
+    source = tmp_path / 'in.csv'
+    with open(source, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['name', 'birthday', 'email', 'phone', 'address',
+                         'preferred_contact', 'date_added'])
+        writer.writerows(records)
+    bulk = str(tmp_path / 'bulk.db')
+    import_file(str(source), bulk)
+
+    reference = str(tmp_path / 'reference.db')
+    import_file(str(source), reference)
+    conn = connect(reference)
+    conn.execute('DELETE FROM customers')
+    conn.executemany(insert_sql(conn, with_date=True), records)
+    conn.commit()
+    conn.close()
+
+    def stored(path):
+        conn = connect(path)
+        try:
+            return conn.execute('SELECT name, birth_date, email, phone_number, address, '
+                                'contact_id, added_at FROM customer_records').fetchall()
+        finally:
+            conn.close()
+    assert stored(bulk) == stored(reference)
+
+
+def test_bulk_import_rebuilds_indexes_search_and_counts(imported_db, tmp_path):
+    conn = connect(imported_db)
+    indexes = conn.execute("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger') "
+                           "ORDER BY name").fetchall()
+    conn.close()
+    # Larger than the table, so its indexes are dropped and built again
+    source = str(tmp_path / 'more.csv')
+    write_file(source, 120, seed=9)
+    assert import_file(source, imported_db).inserted == 120
+
+    conn = connect(imported_db)
+    assert conn.execute("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger') "
+                        "ORDER BY name").fetchall() == indexes
+    assert conn.execute('PRAGMA integrity_check').fetchone() == ('ok',)
+    counted = dict(conn.execute("SELECT key, count FROM customer_stats "
+                                "WHERE kind = 'contact' AND count > 0"))
+    assert counted == dict(conn.execute('SELECT preferred_contact, COUNT(*) FROM customers '
+                                        'GROUP BY preferred_contact'))
+    last_id, name = conn.execute('SELECT id, name FROM customers ORDER BY id DESC').fetchone()
+    assert last_id in search_ids(conn, name)
+    conn.close()
+
+
+def test_failed_import_adds_nothing(imported_db):
+    def records():
+        yield from generate_customers(30, seed=9)
+        raise OSError("read failed")
+
+    conn = connect(imported_db)
+    before = conn.execute("SELECT COUNT(*), (SELECT COUNT(*) FROM sqlite_master) "
+                          "FROM customers").fetchone()
+    with pytest.raises(OSError):
+        import_records(records(), imported_db, batch_size=10)
+    assert conn.execute("SELECT COUNT(*), (SELECT COUNT(*) FROM sqlite_master) "
+                        "FROM customers").fetchone() == before
+    conn.close()
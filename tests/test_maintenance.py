@@ -0,0 +1,50 @@
+import sqlite3
+from datetime import date
+
+from customer_db import connect, get_repository
+from customer_generator import generate_database
+from customer_maintenance import archive_customers
+from customer_stats import summary
+
+TODAY = date(2026, 1, 1)
+
+
+def _summary(path, archives):
+    conn = connect(path, archives=archives)
+    try:
+        return summary(conn, TODAY)
+    finally:
+        conn.close()
+
+
+def _archive_half(tmp_path):
+    path = str(tmp_path / 'customers.db')
+    generate_database(200, path)
+    get_repository(path).upgrade_schema()
+    before = _summary(path, archives=False)
+
+    conn = sqlite3.connect(path)
+    cutoff = conn.execute('SELECT date_added FROM customers ORDER BY id '
+                          'LIMIT 1 OFFSET 100').fetchone()[0]
+    conn.close()
+    moved = archive_customers(cutoff, str(tmp_path / 'archive.db'), path, pause=0)
+    assert 0 < moved < 200
+    return path, before, moved
+
+
+def test_summary_with_archives_counts_archived_customers(tmp_path):
+    path, before, moved = _archive_half(tmp_path)
+
+    assert _summary(path, archives=False)['total'] == 200 - moved
+    assert _summary(path, archives=True) == before
+
+
+def test_summary_counts_archives_without_stored_counts(tmp_path):
+    path, before, _ = _archive_half(tmp_path)
+    # An archive made before archives kept their own counts
+    conn = sqlite3.connect(str(tmp_path / 'archive.db'))
+    conn.execute('DROP TABLE customer_stats')
+    conn.commit()
+    conn.close()
+
+    assert _summary(path, archives=True) == before
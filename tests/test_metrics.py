@@ -0,0 +1,88 @@
+import json
+import logging
+import sqlite3
+
+import pytest
+
+import customer_metrics
+from customer_db import connect
+from customer_metrics import InstrumentedConnection, metrics, normalize_sql, timed
+
+
+@pytest.fixture
+def instrumented(monkeypatch):
+    """Metrics on for the test, with nothing recorded before it"""
+    monkeypatch.setattr(customer_metrics, '_enabled', False)
+    monkeypatch.setattr(customer_metrics, '_slow_seconds', customer_metrics._slow_seconds)
+    metrics.reset()
+    customer_metrics.enable()
+    yield metrics
+    metrics.reset()
+
+
+def test_connections_are_only_instrumented_when_enabled(imported_db, monkeypatch):
+    monkeypatch.setattr(customer_metrics, '_enabled', False)
+    conn = connect(imported_db)
+    assert not isinstance(conn, InstrumentedConnection)
+    conn.close()
+
+    customer_metrics.enable()
+    conn = connect(imported_db)
+    assert isinstance(conn, InstrumentedConnection)
+    conn.close()
+
+
+def test_queries_are_timed_by_statement(imported_db, instrumented):
+    conn = connect(imported_db)
+    for ids in ((1, 2), (3, 4, 5)):
+        marks = ', '.join('?' * len(ids))
+        conn.execute(f'SELECT name FROM customers WHERE id IN ({marks})', ids).fetchall()
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute('SELECT no_such_column FROM customers')
+    conn.close()
+
+    snapshot = instrumented.snapshot()
+    key = normalize_sql('SELECT name FROM customers WHERE id IN (?, ?)')
+    assert key == 'SELECT name FROM customers WHERE id IN (?, ...)'
+    # execute and fetchall of both statements, under one key
+    assert snapshot['queries'][key]['count'] == 4
+    assert snapshot['counters']['query_errors'] == 1
+
+
+def test_slow_queries_are_logged_with_their_plan(imported_db, instrumented, caplog):
+    customer_metrics.enable(slow_ms=0)
+    conn = connect(imported_db)
+    with caplog.at_level(logging.WARNING, logger='customer_metrics'):
+        conn.execute('SELECT name FROM customers WHERE id = ?', (1,)).fetchone()
+    conn.close()
+
+    slow = [entry for entry in instrumented.snapshot()['slow_queries']
+            if entry['sql'] == 'SELECT name FROM customers WHERE id = ?']
+    assert len(slow) == 2    # execute and fetchone
+    assert any('INTEGER PRIMARY KEY' in line for line in slow[0]['plan'])
+    assert 'Slow query (execute' in caplog.text
+
+
+def test_operations_and_dumps(instrumented, tmp_path):
+    with timed('refresh'):
+        pass
+    with timed('refresh'):
+        pass
+    assert instrumented.snapshot()['operations']['refresh']['count'] == 2
+    assert 'last refresh' in customer_metrics.status_line()
+
+    instrumented.write(str(tmp_path / 'metrics.json'))
+    with open(tmp_path / 'metrics.json', encoding='utf-8') as f:
+        assert json.load(f)['operations']['refresh']['count'] == 2
+    prometheus = instrumented.to_prometheus()
+    assert 'customer_operation_seconds_count{operation="refresh"} 2' in prometheus
+    assert 'customer_operation_seconds_bucket{operation="refresh",le="+Inf"} 2' in prometheus
+
+
+def test_disabled_timing_records_nothing(monkeypatch):
+    monkeypatch.setattr(customer_metrics, '_enabled', False)
+    metrics.reset()
+    with timed('refresh'):
+        pass
+    customer_metrics.record_operation('refresh', 1.0)
+    assert metrics.snapshot()['operations'] == {}
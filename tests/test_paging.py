@@ -0,0 +1,103 @@
+import pytest
+
+from customer_db import COLUMNS, connect
+from customer_paging import CustomerPager
+from customer_validation import phone_digits
+
+CUSTOMER = ('Zed Newman', '01/02/1990', 'zed@example.com', '555-123-4567', '9 New St', 'Email')
+
+
+def _ids(rows):
+    return [row[0] for row in rows]
+
+
+def _ordered_ids(path, condition=''):
+    conn = connect(path)
+    try:
+        return [row[0] for row in conn.execute(
+            f"SELECT id FROM customers {condition} ORDER BY id DESC")]
+    finally:
+        conn.close()
+
+
+def test_scrolling_reads_every_row_once(imported_db):
+    pager = CustomerPager(imported_db, page_size=10, max_cached=20)
+    seen = []
+    for start in range(0, 50, 7):
+        seen.extend(_ids(pager.rows_at(start, 7)))
+    assert seen == _ordered_ids(imported_db)
+    assert pager.count() == 50
+    # Back to the top through the keyset path
+    assert _ids(pager.rows_at(0, 7)) == _ordered_ids(imported_db)[:7]
+
+
+def test_pages_continue_from_the_last_row_under_concurrent_changes(imported_db):
+    pager = CustomerPager(imported_db, page_size=10, max_cached=20)
+    first = _ids(pager.rows_at(0, 10))
+    assert first == list(range(50, 40, -1))
+
+    conn = connect(imported_db)
+    conn.execute('INSERT INTO customers (name, birthday, email, phone, address, '
+                 'preferred_contact) VALUES (?, ?, ?, ?, ?, ?)', CUSTOMER)
+    conn.execute('DELETE FROM customers WHERE id IN (41, 35)')
+    conn.commit()
+    conn.close()
+
+    # Neither skipped nor repeated: the rows after the last one shown
+    following = _ids(pager.rows_at(10, 10))
+    assert following == _ordered_ids(imported_db, 'WHERE id < 41')[:10]
+    assert 35 not in following
+
+    # After invalidating, the new row is at the top and the count is exact
+    pager.invalidate(0)
+    assert _ids(pager.rows_at(0, 3)) == [51, 50, 49]
+    pager.reset()
+    assert pager.count() == 49
+
+
+def test_estimated_count_is_the_id_range(imported_db):
+    conn = connect(imported_db)
+    conn.execute('DELETE FROM customers WHERE id = 10')
+    conn.commit()
+    conn.close()
+    pager = CustomerPager(imported_db)
+    pager.estimate_count()
+    assert (pager.count(), pager.count_estimated) == (50, True)
+    pager.reset()
+    assert (pager.count(), pager.count_estimated) == (49, False)
+
+
+def _sort_key(column):
+    def key(row):
+        value = row[COLUMNS.index(column)]
+        if column == 'birthday':
+            month, day, year = value.split('/')
+            value = (year, month, day)
+        elif column == 'phone':
+            value = phone_digits(value)
+        return value, row[0]
+    return key
+
+
+@pytest.mark.parametrize('column', [c for c in COLUMNS if c != 'id'])
+@pytest.mark.parametrize('descending', [False, True])
+def test_sorted_pages_match_sorting_every_row(imported_db, column, descending):
+    conn = connect(imported_db)
+    # Ties on every column, so the id tie breaker matters across pages
+    conn.execute("UPDATE customers SET address = '1 Same St', "
+                 "preferred_contact = 'Phone' WHERE id % 3 = 0")
+    conn.commit()
+    rows = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM customers").fetchall()
+    conn.close()
+    expected = [row[0] for row in sorted(rows, key=_sort_key(column), reverse=descending)]
+
+    pager = CustomerPager(imported_db, page_size=8, max_cached=16)
+    pager.set_order(column, descending)
+    forwards = []
+    for start in range(0, 50, 5):
+        forwards.extend(_ids(pager.rows_at(start, 5)))
+    assert forwards == expected
+    backwards = []
+    for start in range(45, -1, -5):
+        backwards[:0] = _ids(pager.rows_at(start, 5))
+    assert backwards == expected
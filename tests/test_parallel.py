@@ -0,0 +1,74 @@
+from collections import Counter
+
+import pytest
+
+import customer_parallel
+from customer_db import COLUMNS, connect, order_expression
+from customer_generator import generate_database
+from customer_parallel import count, group_counts, scan
+from customer_search import search_filter
+
+
+@pytest.fixture(autouse=True)
+def stop_workers():
+    yield
+    if customer_parallel._executor is not None:
+        customer_parallel._executor.shutdown(cancel_futures=True)
+        customer_parallel._executor = None
+
+
+def _serial(db_path, where='', params=(), term=None, order_column='id', descending=False):
+    conditions, values = [], list(params)
+    if where:
+        conditions.append(f'({where})')
+    if term:
+        search, search_params = search_filter(term)
+        conditions.append(search)
+        values.extend(search_params)
+    direction = 'DESC' if descending else 'ASC'
+    sql = f"SELECT {', '.join(COLUMNS)} FROM customers"
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += f' ORDER BY {order_expression(order_column)} {direction}, id {direction}'
+    conn = connect(db_path)
+    try:
+        return conn.execute(sql, values).fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('order_column, descending', [
+    ('id', False), ('id', True), ('name', False), ('birthday', True), ('phone', False)])
+def test_scan_matches_the_serial_query(imported_db, order_column, descending):
+    rows = list(scan(order_column=order_column, descending=descending,
+                     db_paths=[imported_db], workers=2, chunk_rows=7))
+    assert rows == _serial(imported_db, order_column=order_column, descending=descending)
+
+    where, params = "preferred_contact = ?", ('Email',)
+    rows = list(scan(where, params, order_column=order_column, descending=descending,
+                     limit=5, db_paths=[imported_db], workers=2, chunk_rows=7))
+    assert rows == _serial(imported_db, where, params, order_column=order_column,
+                           descending=descending)[:5]
+
+
+def test_search_terms_and_counts_match(imported_db):
+    term = _serial(imported_db)[0][1].split()[0]
+    expected = _serial(imported_db, term=term, order_column='name')
+    assert expected
+    assert list(scan(term=term, order_column='name', db_paths=[imported_db],
+                     workers=2, chunk_rows=7)) == expected
+    assert count(term=term, db_paths=[imported_db], workers=2, chunk_rows=7) == len(expected)
+
+    contacts = Counter(row[6] for row in _serial(imported_db))
+    assert dict(group_counts('preferred_contact', db_paths=[imported_db], workers=2,
+                             chunk_rows=7)) == contacts
+
+
+def test_shards_are_merged_in_order(imported_db, tmp_path):
+    other = str(tmp_path / 'other.db')
+    generate_database(30, other, seed=1)
+    rows = list(scan(order_column='name', db_paths=[imported_db, other], workers=2,
+                     chunk_rows=9))
+    expected = _serial(imported_db, order_column='name') + _serial(other, order_column='name')
+    assert rows == sorted(expected, key=lambda row: (row[1], row[0]))
+    assert count(db_paths=[imported_db, other], workers=2) == 80
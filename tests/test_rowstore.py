@@ -0,0 +1,91 @@
+import pytest
+
+import customer_rowstore
+from customer_db import COLUMNS, connect, order_expression
+from customer_rowstore import CustomerStore
+
+CUSTOMER = ('Stored Person', '01/02/1990', 'stored@example.com', '555-010-5000',
+            '1 Store St', 'Phone')
+
+
+@pytest.fixture(params=[(4096, 512), (8, 0)], ids=['one-segment', 'many-segments'])
+def segment_rows(request, monkeypatch):
+    """Run each test with the default segments and with tiny ones, which
+    spread the rows over many segments and take the dense search path"""
+    rows, dense_hits = request.param
+    monkeypatch.setattr(customer_rowstore, 'SEGMENT_ROWS', rows)
+    monkeypatch.setattr(customer_rowstore, 'DENSE_HITS', dense_hits)
+    return rows
+
+
+def _query(conn, column='id', descending=True, term=None):
+    direction = 'DESC' if descending else 'ASC'
+    sql = f"SELECT {', '.join(COLUMNS)} FROM customers"
+    params = ()
+    if term:
+        sql += (' WHERE instr(lower(name), :term) OR instr(lower(email), :term) '
+                'OR instr(lower(phone), :term)')
+        params = {'term': term.lower()}
+    sql += f' ORDER BY {order_expression(column)} {direction}, id {direction}'
+    return conn.execute(sql, params).fetchall()
+
+
+def _shown(store, slots):
+    return [store.row(slot) for slot in slots]
+
+
+@pytest.mark.parametrize('column', COLUMNS)
+def test_sorting_matches_sql(imported_db, segment_rows, column):
+    conn = connect(imported_db)
+    store = CustomerStore.load(conn, column, descending=False, chunk_size=7)
+    assert len(store) == 50
+    assert _shown(store, store.order) == _query(conn, column, descending=False)
+    store.sort(column, descending=True)
+    assert _shown(store, store.order) == _query(conn, column)
+    conn.close()
+
+
+def test_search_matches_sql(imported_db, segment_rows):
+    conn = connect(imported_db)
+    store = CustomerStore.load(conn, 'name', descending=False)
+    rows = _query(conn)
+    for term in (rows[0][1].split()[0].upper(), rows[1][3][:6], '555', '@', 'zzzz'):
+        assert _shown(store, store.search(term)) == _query(conn, 'name', False, term)
+    assert store.search('a\0b') == []
+    assert list(store.search('')) == list(store.order)
+    conn.close()
+
+
+def test_changes_match_sql(imported_db, segment_rows):
+    conn = connect(imported_db)
+    store = CustomerStore.load(conn, 'email', descending=False)
+    select = f"SELECT {', '.join(COLUMNS)} FROM customers WHERE id = ?"
+
+    conn.execute("UPDATE customers SET name = 'Aaron Updated', email = 'a.updated@example.com', "
+                 "preferred_contact = 'Mail' WHERE id IN (3, 30)")
+    conn.execute('DELETE FROM customers WHERE id IN (5, 6, 40)')
+    conn.execute('INSERT INTO customers (name, birthday, email, phone, address, '
+                 'preferred_contact) VALUES (?, ?, ?, ?, ?, ?)', CUSTOMER)
+    conn.commit()
+    for customer_id in (3, 30, 51):
+        row = conn.execute(select, (customer_id,)).fetchone()
+        position = store.put(row)
+        assert store.order[position] == store.slot_of(customer_id)
+    assert store.discard([5, 6, 40, 99]) == {5, 6, 40}
+    assert store.slot_of(5) is None
+
+    assert len(store) == 48
+    assert _shown(store, store.order) == _query(conn, 'email', descending=False)
+    assert _shown(store, store.search('updated')) == _query(conn, 'email', False, 'updated')
+    store.sort('name')
+    assert _shown(store, store.order) == _query(conn, 'name')
+
+    # A deleted customer put back takes its old slot again
+    slot = store._find(40)
+    conn.execute('INSERT INTO customers (id, name, birthday, email, phone, address, '
+                 'preferred_contact) VALUES (40, ?, ?, ?, ?, ?, ?)', CUSTOMER)
+    conn.commit()
+    store.put(conn.execute(select, (40,)).fetchone())
+    assert store.slot_of(40) == slot
+    assert _shown(store, store.order) == _query(conn, 'name')
+    conn.close()
@@ -0,0 +1,77 @@
+import customer_schema
+from customer_db import COLUMNS, connect, get_repository, order_expression
+from customer_paging import CustomerPager
+from customer_schema import (SCHEMA_VERSION, migrate_rows, migrate_schema, migrate_step,
+                             migration_pending, schema_version, storage_table)
+
+
+def _contacts(path):
+    pager = CustomerPager(path, page_size=20)
+    pager.set_order('preferred_contact', descending=False)
+    return [row[6] for row in pager.rows_at(0, 50)], pager.order_expression
+
+
+def test_contact_sort_uses_the_index_while_ids_follow_names(imported_db):
+    contacts, expression = _contacts(imported_db)
+    assert expression == 'contact_id'
+    assert contacts == sorted(contacts)
+
+
+def test_contact_sort_follows_names_after_a_new_method(imported_db):
+    repo = get_repository(imported_db)
+    # Gets the next id, 4, though it sorts between Email and Mail
+    repo.update_customers({'preferred_contact': 'Fax'}, [1, 2])
+    contacts, expression = _contacts(imported_db)
+    assert expression == 'preferred_contact'
+    assert 'Fax' in contacts
+    assert contacts == sorted(contacts)
+    assert order_expression('preferred_contact') == 'preferred_contact'
+
+
+COLUMN_LIST = ', '.join(COLUMNS)
+
+
+def _rows(conn):
+    return conn.execute(f'SELECT {COLUMN_LIST} FROM customers ORDER BY id').fetchall()
+
+
+def test_v1_database_migrates_in_batches(v1_db, monkeypatch):
+    conn = connect(v1_db)
+    before = _rows(conn)
+    # Below the row count, so the copy is left to migrate_step
+    monkeypatch.setattr(customer_schema, 'BATCH_SIZE', 20)
+    migrate_schema(conn)
+    assert migration_pending(conn)
+    assert _rows(conn) == before
+
+    # Changes made while the copy runs are carried over
+    conn.execute("UPDATE customers SET address = '2 New St' WHERE id = 3")
+    conn.execute('DELETE FROM customers WHERE id = 4')
+    conn.commit()
+    expected = [row if row[0] != 3 else row[:5] + ('2 New St',) + row[6:]
+                for row in before if row[0] != 4]
+
+    steps = []
+    migrate_rows(conn, batch_size=15, progress=lambda *step: steps.append(step))
+    phases = [phase for phase, *_ in steps]
+    assert phases.count('copy') > 1 and phases.count('cleanup') > 1
+    assert phases == sorted(phases, key=['copy', 'cleanup'].index)
+
+    assert not migration_pending(conn)
+    assert schema_version(conn) == SCHEMA_VERSION
+    assert storage_table(conn) == 'customer_records'
+    leftovers = conn.execute("SELECT name FROM sqlite_master WHERE name IN "
+                             "('customers_v1', 'customer_migration')").fetchall()
+    assert leftovers == []
+    assert _rows(conn) == expected
+    conn.close()
+
+
+def test_small_v1_database_migrates_at_once(v1_db):
+    conn = connect(v1_db)
+    before = _rows(conn)
+    assert migrate_schema(conn) == SCHEMA_VERSION
+    assert not migration_pending(conn)
+    assert migrate_step(conn) is None
+    assert _rows(conn) == before
+    conn.close()
@@ -0,0 +1,39 @@
+import sqlite3
+
+import pytest
+
+import customer_search
+from customer_search import ensure_search_index, search_ids
+
+
+def _objects(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {name for name, in conn.execute(
+            "SELECT name FROM sqlite_master WHERE name LIKE 'customers_fts%'")}
+    finally:
+        conn.close()
+
+
+def test_failed_backfill_leaves_no_index(v1_db, monkeypatch):
+    def fail(conn, after_id=0):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(customer_search, 'index_customers', fail)
+    conn = sqlite3.connect(v1_db)
+    with pytest.raises(sqlite3.OperationalError):
+        ensure_search_index(conn)
+    conn.close()
+    assert _objects(v1_db) == set()
+
+
+def test_index_is_created_with_triggers_and_rows(v1_db):
+    conn = sqlite3.connect(v1_db)
+    assert ensure_search_index(conn)
+    name = conn.execute('SELECT name FROM customers WHERE id = 7').fetchone()[0]
+    assert 7 in search_ids(conn, name)
+    # A second call, e.g. from another app, finds it made
+    assert ensure_search_index(conn)
+    conn.close()
+    assert {'customers_fts_insert', 'customers_fts_delete',
+            'customers_fts_update'} <= _objects(v1_db)
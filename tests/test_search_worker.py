@@ -0,0 +1,55 @@
+import threading
+import time
+
+from search_worker import QueryWorker
+
+# Never finishes on its own; only an interrupt stops it
+ENDLESS = ('WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) '
+           'SELECT COUNT(*) FROM n')
+
+
+def _wait(worker, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = worker.poll()
+        if result is not None:
+            return result
+        time.sleep(0.01)
+    raise AssertionError("no result")
+
+
+def test_only_the_newest_of_quick_submits_runs(imported_db):
+    worker = QueryWorker(imported_db, debounce_ms=100)
+    ran = []
+
+    def job(term):
+        def run(conn, cancelled):
+            ran.append(term)
+            return conn.execute('SELECT COUNT(*) FROM customers WHERE name LIKE ?',
+                                (f'%{term}%',)).fetchone()[0]
+        return run
+
+    for term in ('a', 'an', 'ann'):
+        generation = worker.submit(job(term))
+    done, count, error = _wait(worker)
+    assert (done, error) == (generation, None)
+    assert isinstance(count, int)
+    assert ran == ['ann']
+    worker.close()
+
+
+def test_a_newer_search_interrupts_a_running_one(imported_db):
+    worker = QueryWorker(imported_db, debounce_ms=0)
+    started = threading.Event()
+
+    def endless(conn, cancelled):
+        started.set()
+        return conn.execute(ENDLESS).fetchone()
+
+    worker.submit(endless)
+    assert started.wait(10)
+    time.sleep(0.2)     # an interrupt only stops a statement already running
+    generation = worker.submit(lambda conn, cancelled: 'done')
+    assert _wait(worker) == (generation, 'done', None)
+    assert not worker.busy()
+    worker.close()
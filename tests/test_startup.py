@@ -0,0 +1,41 @@
+import sqlite3
+
+import pytest
+
+import customer_benchmark
+import readDatabase
+from customer_db import connect
+from customer_schema import SCHEMA_VERSION, schema_version
+
+
+def _open_fast(harness, db_path):
+    root = harness.make_root()
+    viewer = readDatabase.CustomerDatabaseViewer(root, db_path=db_path, fast_start=True,
+                                                 search_debounce_ms=0)
+    return root, viewer
+
+
+@pytest.mark.parametrize('fixture', ['v1_db', 'imported_db'])
+def test_fast_start_on_database_without_change_log(request, fixture):
+    db_path = request.getfixturevalue(fixture)
+    conn = sqlite3.connect(db_path)
+    assert not conn.execute("SELECT 1 FROM sqlite_master "
+                            "WHERE name = 'customer_changes'").fetchone()
+    conn.close()
+
+    harness = customer_benchmark.Harness()
+    with harness.patched():
+        root, viewer = _open_fast(harness, db_path)
+        try:
+            assert harness.messagebox.shown == []
+            assert viewer.startup_seconds is not None
+            assert len(viewer.tree.get_children()) > 0
+            # The rest of the upgrade and the exact count follow
+            assert harness.pump(root, lambda: not viewer.pager.count_estimated)
+            assert viewer.pager.count() == 50
+        finally:
+            customer_benchmark.close_viewer(harness, root, viewer)
+
+    conn = connect(db_path)
+    assert schema_version(conn) == SCHEMA_VERSION
+    conn.close()
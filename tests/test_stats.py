@@ -0,0 +1,60 @@
+from datetime import date
+
+from customer_db import connect
+from customer_stats import AGE_BUCKETS, STAT_KEYS, summary
+
+CUSTOMER = ('Counted Person', '02/29/2000', 'counted@Example.ORG', '555-010-3000',
+            '1 Count St', 'Phone')
+
+
+def _stored(conn):
+    return set(conn.execute('SELECT kind, key, count FROM customer_stats '
+                            'WHERE count > 0').fetchall())
+
+
+def _recount(conn):
+    counts = set()
+    for kind, expression in STAT_KEYS.items():
+        key = f"coalesce({expression.format('customers')}, '')"
+        counts.update((kind, value, count) for value, count in conn.execute(
+            f'SELECT {key}, COUNT(*) FROM customers GROUP BY 1'))
+    return counts
+
+
+def test_counts_follow_inserts_updates_and_deletes(imported_db):
+    conn = connect(imported_db)
+    assert _stored(conn) == _recount(conn)
+
+    conn.execute('INSERT INTO customers (name, birthday, email, phone, address, '
+                 'preferred_contact) VALUES (?, ?, ?, ?, ?, ?)', CUSTOMER)
+    conn.commit()
+    assert ('domain', 'example.org', 1) in _stored(conn)
+    assert _stored(conn) == _recount(conn)
+
+    conn.execute("UPDATE customers SET preferred_contact = 'Mail', "
+                 "email = 'moved@example.org', birthday = '12/31/1999' WHERE id <= 10")
+    conn.execute("UPDATE customers SET address = '2 Other St' WHERE id = 20")
+    conn.commit()
+    assert _stored(conn) == _recount(conn)
+
+    conn.execute('DELETE FROM customers WHERE id % 3 = 0')
+    conn.commit()
+    assert _stored(conn) == _recount(conn)
+    conn.close()
+
+
+def test_summary_matches_the_rows(imported_db):
+    today = date(2026, 1, 1)
+    conn = connect(imported_db)
+    result = summary(conn, today)
+    birth_dates = [date.fromisoformat(value) for value, in conn.execute(
+        'SELECT birth_date FROM customers WHERE birth_date IS NOT NULL')]
+    total = conn.execute('SELECT COUNT(*) FROM customers').fetchone()[0]
+    conn.close()
+
+    assert result['total'] == total
+    ages = [today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+            for born in birth_dates]
+    expected = [(label, sum(low <= age and (high is None or age <= high) for age in ages))
+                for label, low, high in AGE_BUCKETS]
+    assert result['age_buckets'] == expected
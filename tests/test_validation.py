@@ -0,0 +1,40 @@
+import pytest
+
+from customer_validation import FIELDS, MESSAGES, validate_customers
+
+GOOD = {'name': 'Ada Lovelace', 'birthday': '12/10/1985', 'email': 'ada@example.com',
+        'phone': '555-123-4567', 'address': '1 Analytical St', 'preferred_contact': 'Email'}
+
+ROWS = [GOOD,
+        dict(GOOD, name=None),
+        dict(GOOD, address=float('nan')),
+        dict(GOOD, email=None),
+        dict(GOOD, phone='12'),
+        dict(GOOD, birthday='1985-12-10', email='not an email')]
+
+EXPECTED = [None, MESSAGES['required'], MESSAGES['required'], MESSAGES['required'],
+            MESSAGES['phone'], MESSAGES['birthday']]
+
+
+def test_lists():
+    columns = {field: [row[field] or '' for row in ROWS[:2]] + [row[field] for row in ROWS[4:]]
+               for field in FIELDS}
+    mask, reasons = validate_customers(columns)
+    assert reasons == EXPECTED[:2] + EXPECTED[4:]
+    assert mask == [reason is None for reason in reasons]
+
+
+def test_series_with_missing_values():
+    pd = pytest.importorskip('pandas')
+    frame = pd.DataFrame(ROWS)
+    mask, reasons = validate_customers({field: frame[field] for field in FIELDS})
+    assert reasons == EXPECTED
+    assert mask.tolist() == [True] + [False] * 5
+
+
+def test_object_arrays_with_missing_values():
+    np = pytest.importorskip('numpy')
+    columns = {field: np.array([row[field] for row in ROWS], dtype=object) for field in FIELDS}
+    mask, reasons = validate_customers(columns)
+    assert reasons == EXPECTED
+    assert mask.tolist() == [True] + [False] * 5
@@ -0,0 +1,59 @@
+import sqlite3
+import threading
+import time
+
+from customer_import import import_file
+from customer_writer import BatchWriter, save_unsaved
+
+ROW = ('Ann Lee', '01/02/1990', 'ann@example.com', '555-123-4567', '1 Main St', 'Email')
+
+
+class FailingRepo:
+    def add_customers(self, rows):
+        raise sqlite3.IntegrityError("constraint failed")
+
+
+class StuckRepo:
+    """Stands in for a database that stays locked until released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def add_customers(self, rows):
+        self.release.wait()
+        raise sqlite3.OperationalError("database is locked")
+
+
+def test_close_returns_failed_rows():
+    writer = BatchWriter(repo=FailingRepo(), flush_ms=10)
+    writer.submit(ROW)
+    writer.submit(ROW)
+
+    unsaved = writer.close()
+    assert [row for row, _ in unsaved] == [ROW, ROW]
+    assert all(isinstance(error, sqlite3.IntegrityError) for _, error in unsaved)
+
+
+def test_close_gives_up_on_a_full_queue():
+    repo = StuckRepo()
+    writer = BatchWriter(repo=repo, batch_size=1, flush_ms=10, max_queue=2)
+    writer.submit(ROW)
+    time.sleep(0.1)     # let the writer take the first row
+    writer.submit(ROW)
+    writer.submit(ROW)
+
+    started = time.monotonic()
+    unsaved = writer.close(timeout=0.2)
+    assert time.monotonic() - started < 1
+    assert len(unsaved) == 3
+    assert all(isinstance(error, TimeoutError) for _, error in unsaved)
+    repo.release.set()
+
+
+def test_unsaved_rows_can_be_imported(tmp_path):
+    path = str(tmp_path / 'unsaved.csv')
+    save_unsaved([(ROW, TimeoutError("late"))], path)
+    save_unsaved([(ROW, TimeoutError("late"))], path)
+
+    stats = import_file(path, str(tmp_path / 'customers.db'))
+    assert (stats.inserted, stats.rejected) == (2, 0)
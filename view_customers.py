@@ -1,79 +1,86 @@
+import argparse
+import json
+import os
 import sqlite3
-from datetime import datetime
+import sys
+from customer_cache import get_cache, query_key
+from customer_db import COLUMNS, get_repository, include_archives, set_include_archives
+from customer_export import available_formats, export_customers
+from customer_import import BATCH_SIZE, import_file
+from customer_metrics import enable as enable_metrics, timed
+from customer_parallel import scan
+from customer_schema import migration_pending, schema_version
+from customer_search import search_filter
 
-def view_all_customers():
+# Formats the list and search commands print in
+OUTPUT_FORMATS = ('table', 'csv', 'jsonl')
+
+@timed('view_all')
+def view_all_customers(db_path=None):
     """View all customers in the database"""
     try:
-        # Connect to database
-        conn = sqlite3.connect('customer_data.db')
-        cursor = conn.cursor()
-        
-        # Get all customers
-        cursor.execute('SELECT * FROM customers ORDER BY id')
-        customers = cursor.fetchall()
+        total = get_repository(db_path).count()
         
-        if not customers:
+        if not total:
             print("No customers found in the database.")
             return
         
         print(f"\n{'='*80}")
-        print(f"CUSTOMER DATABASE - Total Records: {len(customers)}")
+        print(f"CUSTOMER DATABASE - Total Records: {total}")
         print(f"{'='*80}\n")
         
-        for customer in customers:
-            print(f"ID: {customer[0]}")
-            print(f"Name: {customer[1]}")
-            print(f"Birthday: {customer[2]}")
-            print(f"Email: {customer[3]}")
-            print(f"Phone: {customer[4]}")
-            print(f"Address: {customer[5]}")
-            print(f"Preferred Contact: {customer[6]}")
-            print(f"Date Added: {customer[7]}")
-            print(f"{'-'*80}\n")
-        
-        conn.close()
+        # Streamed from the cursor a chunk at a time, in one buffered write each
+        export_customers('-', 'table', db_path=db_path)
         
     except sqlite3.Error as e:
         print(f"Database error: {e}")
     except FileNotFoundError:
         print("Database file 'customer_data.db' not found!")
 
-def view_summary():
+def print_counts(title, counts, width=30):
+    """Print (label, count) pairs with a bar scaled to the largest count"""
+    print(f"\n{title}:")
+    if not counts:
+        print("  (none)")
+        return
+    largest = max(count for _, count in counts) or 1
+    label_width = max(len(str(label)) for label, _ in counts)
+    for label, count in counts:
+        bar = '#' * round(width * count / largest)
+        print(f"  {str(label):<{label_width}}  {count:>9}  {bar}")
+
+@timed('summary')
+def view_summary(db_path=None):
     """View summary statistics"""
     try:
-        conn = sqlite3.connect('customer_data.db')
-        cursor = conn.cursor()
-        
-        # Total count
-        cursor.execute('SELECT COUNT(*) FROM customers')
-        total = cursor.fetchone()[0]
-        
-        # Contact method breakdown
-        cursor.execute('SELECT preferred_contact, COUNT(*) FROM customers GROUP BY preferred_contact')
-        contact_stats = cursor.fetchall()
+        # Precomputed counts: the cost depends on the number of groups, not rows
+        summary = get_repository(db_path).summary()
         
         print(f"\n{'='*50}")
         print("DATABASE SUMMARY")
         print(f"{'='*50}")
-        print(f"Total Customers: {total}")
-        print(f"\nPreferred Contact Methods:")
-        for method, count in contact_stats:
-            print(f"  {method}: {count}")
+        print(f"Total Customers: {summary['total']}")
+        print_counts("Preferred Contact Methods", summary['contact'])
+        print_counts("Age", summary['age_buckets'])
+        print_counts("Email Domains", summary['email_domains'])
+        print_counts("Signups per Week (week starting)", summary['signups_weekly'])
+        print_counts("Signups per Day (most recent days)", summary['signups_daily'])
         print(f"{'='*50}\n")
         
-        conn.close()
-        
     except sqlite3.Error as e:
         print(f"Database error: {e}")
 
-def search_customer(search_term):
-    """Search for customers by name"""
+@timed('search')
+def search_customer(search_term, db_path=None, shards=None):
+    """Search for customers by name, in one database or across shard files"""
     try:
-        conn = sqlite3.connect('customer_data.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM customers WHERE name LIKE ?', (f'%{search_term}%',))
-        results = cursor.fetchall()
+        if shards:
+            # Every shard searched in parallel, merged in name order
+            results = list(scan(term=search_term, columns=('name',),
+                                order_column='name', db_paths=shards))
+        else:
+            # Prefix match on the name column of the full-text index, best first
+            results = cached_search(search_term, db_path)
         
         if not results:
             print(f"No customers found matching '{search_term}'")
@@ -83,25 +90,273 @@ def search_customer(search_term):
         for customer in results:
             print(f"ID: {customer[0]} | Name: {customer[1]} | Email: {customer[3]}")
         
-        conn.close()
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+
+def cached_search(search_term, db_path=None):
+    """Name search through the result cache, until the data changes"""
+    repo = get_repository(db_path)
+    cache = get_cache(repo.db_path)
+    key = query_key(search_term, 'rank', page=None)
+    with repo.pool.connection() as conn:
+        token = cache.check(conn)
+    results = cache.get(key)
+    if results is None:
+        results = repo.search(search_term, columns=('name',))
+        cache.put(key, results, token)
+    return results
+
+@timed('details')
+def view_customer(customer_id, db_path=None):
+    """Show one customer, from the result cache when it hasn't changed"""
+    try:
+        repo = get_repository(db_path)
+        with repo.pool.connection() as conn:
+            customer = get_cache(repo.db_path).customer(conn, customer_id)
+        
+        if customer is None:
+            print(f"No customer with ID {customer_id}")
+            return
+        
+        print(f"\nID: {customer[0]}")
+        print(f"Name: {customer[1]}")
+        print(f"Birthday: {customer[2]}")
+        print(f"Email: {customer[3]}")
+        print(f"Phone: {customer[4]}")
+        print(f"Address: {customer[5]}")
+        print(f"Preferred Contact: {customer[6]}")
+        print(f"Date Added: {customer[7]}")
         
     except sqlite3.Error as e:
         print(f"Database error: {e}")
 
-if __name__ == "__main__":
-    print("\nCustomer Database Viewer")
-    print("1. View all customers")
-    print("2. View summary")
-    print("3. Search by name")
+@timed('export')
+def export_data(path, fmt=None, compression=None, db_path=None):
+    """Export all customers to a CSV, JSONL, Parquet or text file"""
+    def progress(done, total):
+        percent = 100 * done / total if total else 100
+        print(f"\rExported {done} of {total} rows ({percent:.0f}%)", end='', flush=True)
     
-    choice = input("\nEnter your choice (1-3): ").strip()
+    try:
+        count = export_customers(path, fmt, compression, db_path=db_path, progress=progress)
+        print(f"\nExported {count} customers to '{path}'")
+    except (sqlite3.Error, OSError, ValueError) as e:
+        print(f"\nExport error: {e}")
+
+def search_condition(conn, search_term, columns=None):
+    """Return the (where, params) filter for a search term
     
-    if choice == "1":
-        view_all_customers()
-    elif choice == "2":
-        view_summary()
-    elif choice == "3":
-        search_term = input("Enter name to search: ")
-        search_customer(search_term)
+    Uses the full-text index when the database has one, else a name LIKE scan.
+    The index doesn't cover archived customers, so with archives it is a scan.
+    """
+    if not include_archives() and conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'customers_fts'").fetchone():
+        return search_filter(search_term, columns)
+    return 'name LIKE ?', (f'%{search_term}%',)
+
+def database_stats(db_path=None):
+    """Size and state of a database file"""
+    repo = get_repository(db_path)
+    with repo.pool.connection() as conn:
+        tables = {name for name, in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+        count, lowest, highest = conn.execute(
+            'SELECT COUNT(*), MIN(id), MAX(id) FROM customers').fetchone()
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        pages = conn.execute('PRAGMA page_count').fetchone()[0]
+        free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        archives = 0
+        if 'customer_archives' in tables:
+            archives = conn.execute('SELECT COUNT(*) FROM customer_archives').fetchone()[0]
+        changes = None
+        if 'customer_changes' in tables:
+            changes = conn.execute('SELECT COUNT(*) FROM customer_changes').fetchone()[0]
+        return {
+            'customers': count,
+            'lowest_id': lowest,
+            'highest_id': highest,
+            'schema_version': schema_version(conn),
+            'migration_pending': migration_pending(conn),
+            'search_index': 'customers_fts' in tables,
+            'summary_counts': 'customer_stats' in tables,
+            'change_log_entries': changes,
+            'file_bytes': page_size * pages,
+            'free_bytes': page_size * free_pages,
+            'archive_files': archives,
+        }
+
+def print_mapping(values, fmt):
+    """Print a dict as "Label: value" lines, or as one JSON object"""
+    if fmt == 'jsonl':
+        print(json.dumps(values))
+        return
+    width = max(len(key) for key in values) + 1
+    for key, value in values.items():
+        print(f"{key.replace('_', ' ').capitalize() + ':':<{width}} {value}")
+
+def run_list(args):
+    export_customers('-', args.format, where=args.where or '', order_column=args.sort,
+                     descending=args.desc, db_path=args.db, limit=args.limit,
+                     offset=args.offset)
+
+def run_search(args):
+    repo = get_repository(args.db)
+    with repo.pool.connection() as conn:
+        where, params = search_condition(conn, args.term, args.columns)
+    if not where:
+        return
+    if args.where:
+        where = f'({where}) AND ({args.where})'
+    export_customers('-', args.format, where=where, params=params, order_column=args.sort,
+                     descending=args.desc, db_path=args.db, limit=args.limit,
+                     offset=args.offset)
+
+def run_summary(args):
+    summary = get_repository(args.db).summary()
+    if args.format == 'jsonl':
+        print(json.dumps(summary))
     else:
-        print("Invalid choice!")
\ No newline at end of file
+        view_summary(args.db)
+
+def run_export(args):
+    quiet = args.quiet or args.path == '-'
+    progress = None if quiet else (lambda done, total: print(
+        f"\rExported {done} of {total} rows", end='', file=sys.stderr, flush=True))
+    count = export_customers(args.path, args.format, args.compression,
+                             where=args.where or '', order_column=args.sort,
+                             descending=args.desc, db_path=args.db, progress=progress,
+                             limit=args.limit, offset=args.offset)
+    if not quiet:
+        print(file=sys.stderr)
+        print(f"Exported {count} customers to '{args.path}'", file=sys.stderr)
+
+def run_import(args):
+    progress = None if args.quiet else lambda s: print(s, file=sys.stderr)
+    print(import_file(args.file, args.db, args.format, args.rejects, args.batch_size,
+                      progress))
+
+def run_stats(args):
+    print_mapping(database_stats(args.db), args.format)
+
+def run_menu(args):
+    """The original interactive menu"""
+    # Repeated searches and lookups in one session come from the cache
+    while True:
+        print("\nCustomer Database Viewer")
+        print("1. View all customers")
+        print("2. View summary")
+        print("3. Search by name")
+        print("4. Export to file")
+        print("5. View customer by ID")
+        print("6. Quit")
+        
+        choice = input("\nEnter your choice (1-6): ").strip()
+        
+        if choice == "1":
+            view_all_customers(args.db)
+        elif choice == "2":
+            view_summary(args.db)
+        elif choice == "3":
+            search_term = input("Enter name to search: ")
+            search_customer(search_term, args.db)
+        elif choice == "4":
+            path = input("Enter file name (.csv, .jsonl, .parquet or .txt, optionally .gz): ").strip()
+            export_data(path or 'customer_export.csv', db_path=args.db)
+        elif choice == "5":
+            customer_id = input("Enter customer ID: ").strip()
+            if customer_id.isdigit():
+                view_customer(int(customer_id), args.db)
+            else:
+                print("Invalid ID!")
+        elif choice in ("6", ""):
+            print(get_cache(args.db).status_line())
+            break
+        else:
+            print("Invalid choice!")
+
+def add_row_options(parser):
+    """--where, --sort, --desc, --limit and --offset, shared by the row commands"""
+    parser.add_argument('--where', help="SQL condition on the customers columns, "
+                                        "e.g. \"preferred_contact = 'Email'\"")
+    parser.add_argument('--sort', choices=COLUMNS, default='id', help="order by this column")
+    parser.add_argument('--desc', action='store_true', help="sort in descending order")
+    parser.add_argument('--limit', type=int, help="print at most this many rows")
+    parser.add_argument('--offset', type=int, default=0, help="skip this many rows first")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="View, search, export and import customers. "
+                    "Without a command, shows the interactive menu.")
+    parser.add_argument('--db', help="database file (default: $CUSTOMER_DB or customer_data.db)")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="time every query and write the timings to FILE (.json or .prom)")
+    parser.add_argument('--archived', action='store_true',
+                        help="include customers moved to archive files (see customer_maintenance)")
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    
+    list_parser = commands.add_parser('list', help="print customers")
+    list_parser.add_argument('--format', choices=OUTPUT_FORMATS, default='table')
+    add_row_options(list_parser)
+    list_parser.set_defaults(run=run_list)
+    
+    search_parser = commands.add_parser('search', help="print customers matching a search")
+    search_parser.add_argument('term', help="words to look for, as typed in the viewer")
+    search_parser.add_argument('--columns', nargs='+',
+                               choices=('name', 'email', 'phone', 'address'),
+                               help="only look in these columns (default: all)")
+    search_parser.add_argument('--format', choices=OUTPUT_FORMATS, default='table')
+    add_row_options(search_parser)
+    search_parser.set_defaults(run=run_search)
+    
+    summary_parser = commands.add_parser('summary', help="print the dashboard counts")
+    summary_parser.add_argument('--format', choices=('table', 'jsonl'), default='table')
+    summary_parser.set_defaults(run=run_summary)
+    
+    export_parser = commands.add_parser('export', help="write customers to a file")
+    export_parser.add_argument('path', help="output file, or - for standard output")
+    export_parser.add_argument('--format', choices=available_formats(),
+                               help="file format (default: from the file extension)")
+    export_parser.add_argument('--compression', choices=('gzip', 'zstd'),
+                               help="compression (default: from the file extension)")
+    export_parser.add_argument('--quiet', action='store_true', help="don't print progress")
+    add_row_options(export_parser)
+    export_parser.set_defaults(run=run_export)
+    
+    import_parser = commands.add_parser('import', help="add customers from a CSV or JSONL file")
+    import_parser.add_argument('file', help="input file, or - for standard input")
+    import_parser.add_argument('--format', choices=('csv', 'jsonl'),
+                               help="input format (default: from the file extension)")
+    import_parser.add_argument('--rejects', help="write rejected rows and reasons to this file")
+    import_parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                               help="rows validated and inserted at a time")
+    import_parser.add_argument('--quiet', action='store_true', help="don't print progress")
+    import_parser.set_defaults(run=run_import)
+    
+    stats_parser = commands.add_parser('stats', help="print the size and state of the database")
+    stats_parser.add_argument('--format', choices=('table', 'jsonl'), default='table')
+    stats_parser.set_defaults(run=run_stats)
+    
+    args = parser.parse_args(argv)
+    if args.metrics:
+        enable_metrics(args.metrics)
+    if args.archived:
+        set_include_archives(True)
+    if args.command is None:
+        run_menu(args)
+        return 0
+    
+    try:
+        with timed(args.command):
+            args.run(args)
+    except BrokenPipeError:
+        # The reader (e.g. head) stopped early; that's not an error. Point
+        # stdout at devnull so the flush at exit doesn't fail again.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    except (OSError, sqlite3.Error, ValueError) as e:
+        print(f"{args.command.capitalize()} failed: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())